@@ -641,7 +641,7 @@ BÀI VIẾT WIKI HOÀN CHỈNH:
                     try:
                         from validator import validate_wiki_article, AGRI_AGENT_AVAILABLE
                         if AGRI_AGENT_AVAILABLE:
-                            validation_result = validate_wiki_article(str(wiki_file))
+                            validation_result = await asyncio.to_thread(validate_wiki_article, str(wiki_file))
                             if validation_result["success"]:
                                 results[-1]["validation"] = {
                                     "validated": True,
@@ -930,7 +930,11 @@ async def validate_article_api(slug: str = Form(...), use_web: bool = Form(False
         # Tắt web validation mặc định để tránh vượt quota
         # Web validation tạo ra 15-45+ API calls, chỉ bật khi thực sự cần thiết
         # Mặc định: TẮT (use_web=False) để tránh vượt rate limit
-        result = validate_wiki_article(str(article_path), use_web_validation=use_web)
+        # Chạy trong thread pool: validate gọi LLM đồng bộ (chờ rate limit bằng
+        # time.sleep), chạy thẳng trong handler async sẽ chặn cả event loop
+        result = await asyncio.to_thread(
+            validate_wiki_article, str(article_path), use_web_validation=use_web
+        )
         summary = get_validation_summary(result)
         
         return JSONResponse(content={
@@ -975,7 +979,7 @@ async def validate_all_articles_api():
     try:
         from validator import validate_all_articles
         
-        results = validate_all_articles(str(PAGES_DIR))
+        results = await asyncio.to_thread(validate_all_articles, str(PAGES_DIR))
         
         return JSONResponse(content={
             "success": True,
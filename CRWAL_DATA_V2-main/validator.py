@@ -22,11 +22,12 @@ if str(AGRI_AGENT_PATH) not in sys.path:
     sys.path.insert(0, str(AGRI_AGENT_PATH))
 
 try:
-    from src.agents.extractor import extract_claims_from_text, extract_claims_from_url
+    from src.agents.extractor import estimate_extraction_cost, extract_claims_from_text, extract_claims_from_url
     from src.agents.resolver import group_and_resolve_claims, ResolvedClaim
-    from src.agents.judge import judge_claims
+    from src.agents.judge import estimate_judge_cost, judge_claim_pairs
     from src.models import AgriClaim
-    from src.workflows.main import run_agri_workflow
+    from src.utils.usage_ledger import CostEstimate, get_admission_controller
+    from src.workflows.main import estimate_workflow_cost, run_agri_workflow
     AGRI_AGENT_AVAILABLE = True
     IMPORT_ERROR = None
 except ImportError as e:
@@ -34,6 +35,18 @@ except ImportError as e:
     IMPORT_ERROR = str(e)
 
 
+# Chỉ validate với web các claim quan trọng (tác giả, giải thưởng, nguồn gốc)
+IMPORTANT_PREDICATES = [
+    "tác giả", "nguồn gốc", "giải thưởng", "thành tích", "danh hiệu",
+    "tác giả/nguồn gốc", "giải thưởng/thành tích"
+]
+
+# Số cặp (claim bài viết, claim web) tối đa được judge cho một bài viết (2 lô judge).
+# Số cặp chỉ biết sau khi trích xuất và search, nên ước lượng chi phí trước khi
+# chạy dùng cận trên này; các cặp vượt quá bị bỏ qua.
+MAX_WEB_JUDGE_PAIRS = 40
+
+
 def extract_text_from_markdown(markdown_content: str) -> str:
     """
     Trích xuất text thuần từ markdown, loại bỏ:
@@ -80,6 +93,34 @@ def extract_text_from_markdown(markdown_content: str) -> str:
     return text.strip()
 
 
+def _estimate_text_cost(text_content: str, article_title: str, use_web_validation: bool) -> "CostEstimate":
+    """Ước lượng chi phí LLM để validate nội dung bài viết (cùng tham số chunking với bước extract)."""
+    estimate = estimate_extraction_cost(
+        text_content,
+        use_chunking=len(text_content) > 3000,
+        chunk_size=3000,
+    )
+    if use_web_validation:
+        # Workflow web + judge các cặp (claim bài viết, claim web), tối đa MAX_WEB_JUDGE_PAIRS cặp
+        estimate = estimate + estimate_workflow_cost(article_title) + estimate_judge_cost(MAX_WEB_JUDGE_PAIRS)
+    return estimate
+
+
+def estimate_article_cost(article_path: str, use_web_validation: bool = True) -> "CostEstimate":
+    """
+    Ước lượng chi phí LLM (requests, tokens) để validate một bài viết, không gọi API.
+    Chunk đã có trong extraction cache không được tính.
+    """
+    try:
+        with open(article_path, 'r', encoding='utf-8') as f:
+            markdown_content = f.read()
+    except Exception:
+        return CostEstimate()
+    title_match = re.search(r'^#\s+(.+)$', markdown_content, re.MULTILINE)
+    article_title = title_match.group(1).strip() if title_match else ""
+    return _estimate_text_cost(extract_text_from_markdown(markdown_content), article_title, use_web_validation)
+
+
 def validate_wiki_article(article_path: str, use_web_validation: bool = True) -> Dict[str, Any]:
     """
     Validate một bài viết wiki bằng Agri-Agent.
@@ -146,6 +187,20 @@ def validate_wiki_article(article_path: str, use_web_validation: bool = True) ->
     if len(text_content) < 100:
         result["warnings"].append("Nội dung bài viết quá ngắn, có thể không đủ thông tin để validate")
     
+    # Bước 0: Ước lượng chi phí LLM, từ chối trước nếu vượt quota còn lại trong ngày
+    decision = get_admission_controller().check(
+        _estimate_text_cost(text_content, result["article_title"], use_web_validation)
+    )
+    result["estimated_cost"] = decision.to_dict()
+    if not decision.admitted:
+        result["deferred"] = True
+        result["errors"].append(
+            f"❌ {decision.reason}.\n"
+            f"💡 Quota sẽ reset sau khoảng {decision.retry_after / 3600:.1f} giờ, "
+            f"hoặc thử lại với web validation tắt để tiết kiệm API calls."
+        )
+        return result
+    
     # Bước 1: Extract claims từ text
     try:
         # Tối ưu: Tắt chunking cho bài viết ngắn để tiết kiệm API calls
@@ -206,22 +261,19 @@ def validate_wiki_article(article_path: str, use_web_validation: bool = True) ->
                     # Log để theo dõi
                     print(f"⚠️ Web validation đang chạy cho '{main_subject}' - Có thể tạo ra 25-75+ API calls")
                     
-                    workflow_state = run_agri_workflow(crop=main_subject)
+                    # Chi phí workflow đã được tính trong admission của bài viết
+                    workflow_state = run_agri_workflow(crop=main_subject, check_quota=False)
                     web_claims = workflow_state.get("claims", [])
                     
                     print(f"✅ Web validation hoàn tất - Tìm được {len(web_claims)} claims từ web")
                     
-                    # Chỉ validate các claims quan trọng với web (tác giả, giải thưởng, nguồn gốc)
-                    important_predicates = [
-                        "tác giả", "nguồn gốc", "giải thưởng", "thành tích", "danh hiệu",
-                        "tác giả/nguồn gốc", "giải thưởng/thành tích"
-                    ]
-                    
-                    # So sánh claims từ bài viết với claims từ web
+                    # Gom toàn bộ cặp (claim bài viết, claim web) cần so sánh,
+                    # rồi judge theo lô (nhiều cặp trong một request LLM)
+                    pairs_to_judge = []
                     for article_claim in claims:
                         # Chỉ validate các claims quan trọng
                         predicate_lower = article_claim.predicate.strip().lower()
-                        is_important = any(imp in predicate_lower for imp in important_predicates)
+                        is_important = any(imp in predicate_lower for imp in IMPORTANT_PREDICATES)
                         
                         if not is_important:
                             continue
@@ -232,41 +284,43 @@ def validate_wiki_article(article_path: str, use_web_validation: bool = True) ->
                             if (wc.subject.strip().lower() == article_claim.subject.strip().lower() and
                                 wc.predicate.strip().lower() == article_claim.predicate.strip().lower())
                         ]
+                        pairs_to_judge.extend((article_claim, web_claim) for web_claim in similar_web_claims)
+                    
+                    # Giữ chi phí judge trong phần đã được admission cho phép
+                    if len(pairs_to_judge) > MAX_WEB_JUDGE_PAIRS:
+                        result["warnings"].append(
+                            f"Chỉ so sánh {MAX_WEB_JUDGE_PAIRS}/{len(pairs_to_judge)} cặp claim với nguồn web "
+                            f"để giới hạn số API calls"
+                        )
+                        pairs_to_judge = pairs_to_judge[:MAX_WEB_JUDGE_PAIRS]
+                    
+                    judgments = judge_claim_pairs(pairs_to_judge, use_embedding=True, use_cache=True)
+                    
+                    for (article_claim, web_claim), judgment in zip(pairs_to_judge, judgments):
+                        web_validation_results.append({
+                            "article_claim": {
+                                "subject": article_claim.subject,
+                                "predicate": article_claim.predicate,
+                                "object": article_claim.object
+                            },
+                            "web_claim": {
+                                "subject": web_claim.subject,
+                                "predicate": web_claim.predicate,
+                                "object": web_claim.object,
+                                "source_url": web_claim.source_url
+                            },
+                            "relation": judgment["relation"],
+                            "confidence": judgment["confidence"],
+                            "reasoning": judgment["reasoning"]
+                        })
                         
-                        if similar_web_claims:
-                            # So sánh với từng claim từ web
-                            for web_claim in similar_web_claims:
-                                judgment = judge_claims(
-                                    article_claim,
-                                    web_claim,
-                                    use_embedding=True,
-                                    use_cache=True
-                                )
-                                
-                                web_validation_results.append({
-                                    "article_claim": {
-                                        "subject": article_claim.subject,
-                                        "predicate": article_claim.predicate,
-                                        "object": article_claim.object
-                                    },
-                                    "web_claim": {
-                                        "subject": web_claim.subject,
-                                        "predicate": web_claim.predicate,
-                                        "object": web_claim.object,
-                                        "source_url": web_claim.source_url
-                                    },
-                                    "relation": judgment["relation"],
-                                    "confidence": judgment["confidence"],
-                                    "reasoning": judgment["reasoning"]
-                                })
-                                
-                                # Nếu phát hiện contradiction, thêm warning
-                                if judgment["relation"] == "CONTRADICTED":
-                                    result["warnings"].append(
-                                        f"⚠️ Mâu thuẫn phát hiện: '{article_claim.subject} - {article_claim.predicate}: {article_claim.object}' "
-                                        f"khác với nguồn web '{web_claim.object}' "
-                                        f"(Nguồn: {web_claim.source_url or 'N/A'})"
-                                    )
+                        # Nếu phát hiện contradiction, thêm warning
+                        if judgment["relation"] == "CONTRADICTED":
+                            result["warnings"].append(
+                                f"⚠️ Mâu thuẫn phát hiện: '{article_claim.subject} - {article_claim.predicate}: {article_claim.object}' "
+                                f"khác với nguồn web '{web_claim.object}' "
+                                f"(Nguồn: {web_claim.source_url or 'N/A'})"
+                            )
                 except Exception as e:
                     # Nếu web search thất bại, vẫn tiếp tục với validation nội bộ
                     result["warnings"].append(f"Không thể tìm kiếm web để validate: {str(e)}")
@@ -376,18 +430,62 @@ def validate_all_articles(pages_dir: str = "pages") -> Dict[str, Any]:
             "total_resolved_claims": 0,
             "avg_validation_score": 0.0,
             "articles_with_warnings": 0,
-            "articles_with_errors": 0
+            "articles_with_errors": 0,
+            "articles_deferred": 0
         }
     }
     
-    for md_file in markdown_files:
+    # Ước lượng chi phí trước khi chạy: các bài vượt quota còn lại được hoãn
+    # đến lần reset quota thay vì chạy dở rồi gặp lỗi 429
+    admitted_files = markdown_files
+    if AGRI_AGENT_AVAILABLE and markdown_files:
+        estimates = [estimate_article_cost(str(md_file)) for md_file in markdown_files]
+        controller = get_admission_controller()
+        admitted_idx, deferred_idx = controller.plan(estimates)
+        remaining_requests, remaining_tokens, snapshot = controller.remaining()
+        total_estimate = CostEstimate()
+        for estimate in estimates:
+            total_estimate = total_estimate + estimate
+        results["estimated_cost"] = {
+            "total": total_estimate.to_dict(),
+            "remaining_requests": remaining_requests,
+            "remaining_tokens": remaining_tokens,
+            "admitted_articles": len(admitted_idx),
+            "deferred_articles": len(deferred_idx),
+            "resets_at": datetime.fromtimestamp(snapshot.resets_at).isoformat(),
+        }
+        print(
+            f"💰 Ước lượng chi phí validate {len(markdown_files)} bài: ~{total_estimate.requests} requests, "
+            f"~{total_estimate.total_tokens} tokens (còn {remaining_requests if remaining_requests is not None else '∞'} "
+            f"requests hôm nay) - chạy {len(admitted_idx)} bài, hoãn {len(deferred_idx)} bài"
+        )
+        admitted_files = [markdown_files[i] for i in admitted_idx]
+        for i in deferred_idx:
+            md_file = markdown_files[i]
+            results["validated_articles"].append({
+                "success": False,
+                "deferred": True,
+                "file_path": str(md_file),
+                "file_name": md_file.name,
+                "claims": [],
+                "resolved_claims": [],
+                "validation_score": 0.0,
+                "warnings": [],
+                "errors": ["Hoãn đến lần reset quota: ước lượng chi phí vượt quota LLM còn lại trong ngày"],
+                "estimated_cost": estimates[i].to_dict(),
+            })
+            results["summary"]["articles_deferred"] += 1
+    
+    for md_file in admitted_files:
         validation_result = validate_wiki_article(str(md_file))
         validation_result["file_path"] = str(md_file)
         validation_result["file_name"] = md_file.name
         results["validated_articles"].append(validation_result)
         
         # Cập nhật summary
-        if validation_result["success"]:
+        if validation_result.get("deferred"):
+            results["summary"]["articles_deferred"] += 1
+        elif validation_result["success"]:
             results["summary"]["total_claims"] += len(validation_result["claims"])
             results["summary"]["total_resolved_claims"] += len(validation_result["resolved_claims"])
             if validation_result["warnings"]:
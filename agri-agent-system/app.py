@@ -15,7 +15,8 @@ from typing import Any, Dict, List
 from dotenv import load_dotenv
 import streamlit as st
 
-from src.workflows.main import WorkflowState, run_agri_workflow
+from src.utils.usage_ledger import AdmissionDeniedError
+from src.workflows.main import WorkflowState, WorkflowUpdate, stream_agri_workflow
 
 
 def _ensure_env_loaded() -> None:
@@ -30,6 +31,35 @@ def _ensure_env_loaded() -> None:
     setattr(_ensure_env_loaded, "_loaded", True)
 
 
+# Nhãn tiến độ cho từng node của workflow
+NODE_LABELS = {
+    "lookup": "🗂️ Tra claim store",
+    "search": "🔎 Tìm kiếm nguồn",
+    "extract": "📄 Trích xuất claims",
+    "resolve": "⚖️ Hợp nhất claims",
+    "writer": "✍️ Viết tóm tắt",
+}
+
+
+def _describe_update(item: WorkflowUpdate) -> str:
+    """
+    Mô tả ngắn kết quả của một node để hiển thị tiến độ.
+    """
+    label = NODE_LABELS.get(item.node, item.node)
+    state = item.state
+    debug = state.get("debug_info") or {}
+    if item.node == "lookup":
+        found = debug.get("served_from_store")
+        return f"{label}: {'đã có câu trả lời gần đây' if found else 'chưa có, tìm trên web'}"
+    if item.node == "search":
+        return f"{label}: chọn {len(state.get('search_results') or [])} URL"
+    if item.node == "extract":
+        return f"{label}: {len(state.get('claims') or [])} claims"
+    if item.node == "resolve":
+        return f"{label}: {len(state.get('resolved_claims') or [])} claims đã hợp nhất"
+    return f"{label}: xong"
+
+
 def _render_summary(summary: str) -> None:
     """
     Hiển thị phần tóm tắt kết quả.
@@ -132,12 +162,26 @@ def main() -> None:
             st.error("Vui lòng nhập tên cây trồng hoặc chủ đề.")
             return
 
-        with st.spinner("Đang chạy workflow Agri-Agent (Search -> Extract -> Resolve -> Writer)..."):
+        state: WorkflowState = {}
+        with st.status("Đang chạy workflow Agri-Agent (Search -> Extract -> Resolve -> Writer)...") as status:
             try:
-                state = run_agri_workflow(crop=crop, initial_query=custom_query or None)
+                # Hiển thị tiến độ ngay sau mỗi node thay vì chờ cả workflow
+                for item in stream_agri_workflow(crop=crop, initial_query=custom_query or None):
+                    state = item.state
+                    status.write(_describe_update(item))
+                    if item.node == "search":
+                        for url in state.get("search_results") or []:
+                            status.write(f"- {url}")
+            except AdmissionDeniedError as exc:
+                status.update(label="Vượt quota LLM", state="error")
+                hours = exc.decision.retry_after / 3600
+                st.warning(f"{exc}. Quota sẽ reset sau khoảng {hours:.1f} giờ.", icon="⏳")
+                return
             except Exception as exc:
+                status.update(label="Workflow lỗi", state="error")
                 st.error(f"Có lỗi xảy ra khi chạy workflow: {exc}")
                 return
+            status.update(label="Hoàn tất", state="complete", expanded=False)
 
         # Kết quả chính
         _render_summary(state.get("summary", ""))
@@ -5,23 +5,36 @@ Extractor agent: dùng Gemini 1.5 Flash để trích xuất AgriClaim từ văn
 
 Thiết kế:
 - Hàm extract_claims_from_text: gọi LLM với prompt trong PROMPTS.md và parse JSON.
+- Hàm iter_claims_from_text: chế độ streaming, parse dần output và yield từng claim
+  ngay khi object JSON của nó hoàn chỉnh. Chỉ API này stream: workflow LangGraph
+  vẫn gom claim theo trang và bước Resolve chạy sau khi Extract xong hết.
 - Hàm extract_claims_from_url: dùng scraper.scrape_clean_text rồi gọi extract_claims_from_text.
 
 Yêu cầu biến môi trường:
 - GOOGLE_API_KEY: khóa truy cập Google Gemini 1.5 Flash.
 """
 
-from typing import Iterable, List
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import json
 import os
+import queue
+import random
 import re
+import threading
 import time
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from src.models import AgriClaim
-from src.tools.scraper import scrape_clean_text
+from src.tools.scraper import ScrapeResult, scrape_clean_text
+from src.utils.embedding_cache import normalize_text
+from src.utils.extraction_cache import extraction_cache_key, get_extraction_cache
+from src.utils.llm_router import DEFAULT_LLM_MODEL, LLMEndpoint, get_llm_router, is_quota_error
+from src.utils.usage_ledger import CostEstimate, estimate_tokens, record_llm_usage, usage_tokens
 
 # Import rate limiter và circuit breaker
 try:
@@ -68,27 +81,88 @@ EXTRACTION_SYSTEM_PROMPT = (
 )
 
 
+# Temperature cho extractor (cũng là một phần của khóa extraction cache).
+# Model của từng request do LLM router chọn (AGRI_LLM_MODELS); khóa cache dùng
+# model thực sự đã trả lời (xem `_cache_keys`).
+EXTRACTION_TEMPERATURE = 0.3  # Tăng từ 0.2 lên 0.3 để model sáng tạo hơn trong việc tìm claims
+
+# SystemMessage dùng chung cho mọi request (prompt không đổi giữa các chunk)
+_EXTRACTION_SYSTEM_MESSAGE = SystemMessage(content=EXTRACTION_SYSTEM_PROMPT)
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Số chunk của một văn bản được gửi song song (vẫn bị giới hạn bởi ngân sách RPM/RPD)
+CHUNK_MAX_WORKERS = _env_int("AGRI_EXTRACT_CHUNK_WORKERS", 4)
+# Số ký tự chồng lấp giữa hai chunk liền kề
+CHUNK_OVERLAP = 200
+
+
+def _build_messages(chunk: str) -> list:
+    """Danh sách message cho một chunk (SystemMessage dùng lại, chỉ tạo HumanMessage mới)."""
+    return [_EXTRACTION_SYSTEM_MESSAGE, HumanMessage(content=f"Input Text:\n{chunk}")]
+
+
 def _get_gemini_client() -> ChatGoogleGenerativeAI:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError(
-            "GOOGLE_API_KEY chưa được thiết lập trong môi trường. "
-            "Hãy cấu hình API key trước khi gọi extractor."
-        )
+    """
+    Gemini client của endpoint ưu tiên nhất (dùng lại giữa các lần gọi).
 
-    # Lưu ý:
-    # - Model "gemini-1.5-flash" đã bị deprecated và không còn tồn tại (404 NOT_FOUND).
-    # - Các model hiện có:
-    #   * gemini-2.5-flash: Model mới nhất, nhanh và hiệu quả (ĐÃ VƯỢT LIMIT: 23/20 RPD)
-    #   * gemini-flash-latest: Alias luôn trỏ tới model flash mới nhất (ĐÃ VƯỢT LIMIT)
-    #   * gemini-2.5-flash-lite: Phiên bản nhẹ hơn (CÒN TRỐNG: 0/10 RPM, 0/20 RPD)
-    #   * gemini-3-flash: Model mới (CÒN TRỐNG: 0/5 RPM, 0/20 RPD)
-    # - Đổi sang gemini-2.5-flash-lite để tránh vượt rate limit của gemini-2.5-flash
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",  # Đổi sang flash-lite để tránh rate limit
-        api_key=api_key,
-        temperature=0.3,  # Tăng từ 0.2 lên 0.3 để model sáng tạo hơn trong việc tìm claims
-    )
+    Lưu ý: không cần đổi tay giữa gemini-2.5-flash / flash-lite / flash-latest
+    khi hết quota nữa - khai báo các model trong AGRI_LLM_MODELS (và nhiều key
+    trong GOOGLE_API_KEYS), LLM router tự chuyển endpoint khi gặp lỗi 429.
+    """
+    return get_llm_router().primary.client(EXTRACTION_TEMPERATURE)
+
+
+_SENTENCE_END_RE = re.compile(r"[.!?]\s+")
+
+
+def _cache_key(text: str, model: str) -> str:
+    """Khóa extraction cache của `text` khi được trích xuất bởi `model`."""
+    return extraction_cache_key(text, EXTRACTION_SYSTEM_PROMPT, model, EXTRACTION_TEMPERATURE)
+
+
+def _cache_keys(text: str) -> List[str]:
+    """Khóa cache của `text` cho từng model trong pool của router, theo thứ tự ưu tiên."""
+    models = get_llm_router().models or [DEFAULT_LLM_MODEL]
+    return [_cache_key(text, model) for model in models]
+
+
+def _chunk_spans(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[Tuple[int, int]]:
+    """
+    Chia văn bản thành các khoảng [start, end) theo ranh giới câu.
+
+    Chỉ làm việc với offset (không nối chuỗi), mỗi đoạn gồm các câu trọn vẹn
+    tối đa `chunk_size` ký tự (câu dài hơn `chunk_size` đứng riêng một đoạn),
+    đoạn sau bắt đầu lùi lại `overlap` ký tự để không mất thông tin ở ranh giới.
+    """
+    n = len(text)
+    if n <= chunk_size:
+        return [(0, n)]
+
+    # Vị trí kết thúc câu (sau dấu câu + khoảng trắng)
+    boundaries = [m.end() for m in _SENTENCE_END_RE.finditer(text)]
+    if not boundaries or boundaries[-1] != n:
+        boundaries.append(n)
+
+    spans: List[Tuple[int, int]] = []
+    start, prev_end = 0, 0
+    while prev_end < n:
+        # Câu cuối cùng kết thúc trong giới hạn chunk_size, nhưng phải tiến qua đoạn trước
+        idx = bisect_right(boundaries, start + chunk_size) - 1
+        if idx < 0 or boundaries[idx] <= prev_end:
+            idx = bisect_right(boundaries, prev_end)
+        end = boundaries[idx]
+        spans.append((start, end))
+        prev_end = end
+        start = max(end - overlap, 0)
+    return spans
 
 
 def _chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
@@ -103,299 +177,582 @@ def _chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[s
     Returns:
         List các đoạn văn bản
     """
-    if len(text) <= chunk_size:
-        return [text]
-    
-    chunks = []
-    # Chia theo câu để tránh cắt giữa câu
-    sentences = re.split(r'([.!?]\s+)', text)
-    
-    current_chunk = ""
-    for i in range(0, len(sentences), 2):
-        sentence = sentences[i] + (sentences[i+1] if i+1 < len(sentences) else "")
-        
-        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Bắt đầu đoạn mới với overlap
-            current_chunk = current_chunk[-overlap:] + sentence
-        else:
-            current_chunk += sentence
-    
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
+    chunks = [text[start:end].strip() for start, end in _chunk_spans(text, chunk_size, overlap)]
+    chunks = [chunk for chunk in chunks if chunk]
     return chunks if chunks else [text]
 
 
-def extract_claims_from_text(text: str, use_chunking: bool = True, chunk_size: int = 2000) -> List[AgriClaim]:
+def _content_to_text(content) -> str:
+    """Chuẩn hóa `message.content` (str hoặc list các part) thành chuỗi."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, Iterable):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return str(content)
+
+
+@dataclass
+class ExtractionStatus:
     """
-    Trích xuất danh sách AgriClaim từ đoạn văn bản tiếng Việt liên quan nông nghiệp.
-    
-    Args:
-        text: Văn bản cần trích xuất
-        use_chunking: Có chia nhỏ văn bản dài thành các đoạn không (mặc định True)
-        chunk_size: Kích thước mỗi đoạn khi chia nhỏ (mặc định 2000 ký tự)
-    
-    Returns:
-        List các AgriClaim được trích xuất
-    
-    Raises:
-        RuntimeError: Nếu gặp lỗi quota (429) và đã retry hết số lần
+    Trạng thái trích xuất của một văn bản/trang.
+
+    `complete` chỉ True khi mọi chunk đều có kết quả đầy đủ (từ cache hoặc
+    response kết thúc bình thường). Chunk bị bỏ qua (circuit breaker, hết
+    quota) hoặc lỗi giữa chừng làm kết quả không đầy đủ: claim vẫn dùng được
+    cho lần chạy hiện tại nhưng không nên lưu nguồn như đã xử lý xong.
     """
-    text = (text or "").strip()
-    if not text:
-        return []
 
-    # Tối ưu: Tắt chunking cho bài viết ngắn để tiết kiệm API calls
-    # Chỉ chunk nếu bài viết > 3000 ký tự (thay vì 2000)
-    if use_chunking and len(text) > 3000:
-        use_chunking = True
-        chunk_size = 3000  # Tăng chunk size để ít chunks hơn
-    elif len(text) <= 3000:
-        use_chunking = False  # Tắt chunking cho bài viết ngắn
+    chunks: int = 0
+    completed_chunks: int = 0
+    errors: List[str] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
-    client = _get_gemini_client()
-    
-    # Chia nhỏ văn bản dài để trích xuất nhiều claims hơn
-    if use_chunking and len(text) > chunk_size:
-        chunks = _chunk_text(text, chunk_size=chunk_size)
-        all_claims = []
-        
-        for chunk in chunks:
-            # Kiểm tra Circuit Breaker trước khi gọi API
-            if RATE_LIMITER_AVAILABLE:
-                circuit_breaker = get_circuit_breaker()
-                if circuit_breaker and not circuit_breaker.can_make_request():
-                    print(f"🚨 Circuit Breaker OPEN: Bỏ qua chunk do quá nhiều lỗi 429")
-                    continue
-                
-                # Rate limiting
-                rate_limiter = get_rate_limiter()
-                if rate_limiter:
-                    rate_limiter.wait_if_needed()
-            
-            messages = [
-                SystemMessage(content=EXTRACTION_SYSTEM_PROMPT),
-                HumanMessage(content=f"Input Text:\n{chunk}"),
-            ]
-            
-            # Retry logic cho lỗi quota (429) - GIẢM số lần retry
-            max_retries = 1  # Giảm từ 2 xuống 1 để tránh tạo quá nhiều requests
-            raw_content = None
-            for attempt in range(max_retries + 1):
-                try:
-                    # Ghi nhận request (cho circuit breaker)
-                    if RATE_LIMITER_AVAILABLE:
-                        circuit_breaker = get_circuit_breaker()
-                        if circuit_breaker:
-                            circuit_breaker.record_request()
-                    
-                    response = client.invoke(messages)
-                    raw_content = response.content if isinstance(response.content, str) else (
-                        "".join(part["text"] for part in response.content if isinstance(part, dict) and "text" in part)
-                        if isinstance(response.content, Iterable)
-                        else str(response.content)
-                    )
-                    
-                    # Ghi nhận success
-                    if RATE_LIMITER_AVAILABLE:
-                        circuit_breaker = get_circuit_breaker()
-                        if circuit_breaker:
-                            circuit_breaker.record_success()
-                    
-                    break  # Thành công, thoát khỏi retry loop
-                except Exception as e:
-                    error_str = str(e)
-                    is_429 = "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower()
-                    
-                    # Ghi nhận failure
-                    if RATE_LIMITER_AVAILABLE:
-                        circuit_breaker = get_circuit_breaker()
-                        if circuit_breaker:
-                            circuit_breaker.record_failure(is_429=is_429)
-                    
-                    # Kiểm tra nếu là lỗi quota (429)
-                    if is_429 and attempt < max_retries:
-                        # Nếu circuit breaker đã mở, không retry nữa
-                        if RATE_LIMITER_AVAILABLE:
-                            circuit_breaker = get_circuit_breaker()
-                            if circuit_breaker and circuit_breaker.get_state().name == "OPEN":
-                                print(f"🚨 Circuit Breaker OPEN: Dừng retry do quá nhiều lỗi 429")
-                                raw_content = None
-                                break
-                        
-                        # Exponential backoff với jitter
-                        import random
-                        base_delay = 60  # Tăng lên 60 giây
-                        delay = (2 ** attempt) * base_delay  # 60s, 120s
-                        jitter = random.uniform(0, 20)  # Tăng jitter lên 0-20s
-                        wait_time = delay + jitter
-                        
-                        try:
-                            # Tìm "retry in Xs" hoặc "retryDelay" trong error
-                            import re
-                            retry_match = re.search(r'retry in ([\d.]+)s', error_str, re.IGNORECASE)
-                            if retry_match:
-                                wait_time = max(wait_time, float(retry_match.group(1)) + 10)  # Thêm buffer lớn hơn
-                            else:
-                                retry_delay_match = re.search(r"'retryDelay':\s*'(\d+)s'", error_str)
-                                if retry_delay_match:
-                                    wait_time = max(wait_time, float(retry_delay_match.group(1)) + 10)
-                        except:
-                            pass
-                        
-                        print(f"⚠️ Rate limit hit (429), waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
-                        time.sleep(wait_time)
-                        continue
-                    # Nếu không phải lỗi quota hoặc đã retry hết, bỏ qua chunk này
-                    raw_content = None
-                    break
-            
-            if not raw_content:
-                # Bỏ qua chunk này nếu không lấy được content
-                continue
-            
-            try:
-                data = json.loads(raw_content)
-            except json.JSONDecodeError:
-                # Thử tìm đoạn JSON trong output
-                start = raw_content.find("[")
-                end = raw_content.rfind("]")
-                if start == -1 or end == -1 or end <= start:
-                    continue
-                try:
-                    data = json.loads(raw_content[start : end + 1])
-                except json.JSONDecodeError:
-                    continue
-            
-            if isinstance(data, list):
-                for item in data:
-                    try:
-                        claim = AgriClaim(**item)
-                        all_claims.append(claim)
-                    except Exception:
-                        continue
-        
-        # Loại bỏ claims trùng lặp (dựa trên subject + predicate + object)
-        seen = set()
-        unique_claims = []
-        for claim in all_claims:
-            key = (claim.subject, claim.predicate, claim.object)
-            if key not in seen:
-                seen.add(key)
-                unique_claims.append(claim)
-        
-        return unique_claims
-    else:
-        # Xử lý văn bản ngắn hoặc không chia nhỏ
-        messages = [
-            SystemMessage(content=EXTRACTION_SYSTEM_PROMPT),
-            HumanMessage(content=f"Input Text:\n{text}"),
-        ]
-
-        # Kiểm tra Circuit Breaker trước khi gọi API
-        if RATE_LIMITER_AVAILABLE:
-            circuit_breaker = get_circuit_breaker()
-            if circuit_breaker and not circuit_breaker.can_make_request():
+    @property
+    def complete(self) -> bool:
+        return self.completed_chunks >= self.chunks and not self.errors
+
+    def mark_completed(self) -> None:
+        with self._lock:
+            self.completed_chunks += 1
+
+    def add_error(self, error: str) -> None:
+        with self._lock:
+            self.errors.append(error)
+
+
+class IncrementalClaimParser:
+    """
+    Parse dần output JSON (dạng stream) thành AgriClaim.
+
+    Mỗi lần `feed` nhận thêm một đoạn text; mỗi object `{...}` cấp ngoài cùng
+    vừa đóng ngoặc được parse và validate ngay. Object hỏng chỉ bị bỏ qua riêng
+    nó, không làm mất các claim khác trong cùng response. Text ngoài object
+    (```json, dấu `[`, `,`, lời giải thích) được bỏ qua.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0  # vị trí đã quét trong buffer
+        self._start = -1  # vị trí `{` mở object hiện tại
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[AgriClaim]:
+        """Nhận thêm text, trả về các claim vừa hoàn chỉnh."""
+        self._buffer += text
+        claims: List[AgriClaim] = []
+        buffer = self._buffer
+        for pos in range(self._pos, len(buffer)):
+            ch = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = pos
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    claim = self._parse_object(buffer[self._start:pos + 1])
+                    if claim is not None:
+                        claims.append(claim)
+                    self._start = -1
+
+        # Bỏ phần đã xử lý xong để buffer không phình theo độ dài response
+        keep_from = self._start if self._start >= 0 else len(buffer)
+        self._buffer = buffer[keep_from:]
+        self._pos = len(buffer) - keep_from
+        if self._start >= 0:
+            self._start = 0
+        return claims
+
+    @staticmethod
+    def _parse_object(raw: str) -> Optional[AgriClaim]:
+        try:
+            item = json.loads(raw)
+            return AgriClaim(**item) if isinstance(item, dict) else None
+        except Exception:
+            # Bỏ qua record sai định dạng
+            return None
+
+
+def _retry_wait_seconds(error_str: str, attempt: int) -> float:
+    """Thời gian chờ trước khi retry lỗi 429: exponential backoff + jitter, tôn trọng retryDelay."""
+    base_delay = 60
+    wait_time = (2 ** attempt) * base_delay + random.uniform(0, 20)  # 60s, 120s (+0-20s)
+    try:
+        # Tìm "retry in Xs" hoặc "retryDelay" trong error
+        retry_match = re.search(r'retry in ([\d.]+)s', error_str, re.IGNORECASE)
+        if retry_match:
+            wait_time = max(wait_time, float(retry_match.group(1)) + 10)
+        else:
+            retry_delay_match = re.search(r"'retryDelay':\s*'(\d+)s'", error_str)
+            if retry_delay_match:
+                wait_time = max(wait_time, float(retry_delay_match.group(1)) + 10)
+    except ValueError:
+        pass
+    return wait_time
+
+
+def _admit_llm_call(raise_on_block: bool) -> Optional[LLMEndpoint]:
+    """
+    Kiểm tra circuit breaker, rate limiter rồi chọn endpoint (model, key) còn
+    ngân sách RPM/RPD qua LLM router.
+
+    Trả về endpoint đã lấy token (phải được `release` sau khi gọi), hoặc None
+    (raise RuntimeError nếu `raise_on_block`) khi không được gọi.
+    """
+    if RATE_LIMITER_AVAILABLE:
+        circuit_breaker = get_circuit_breaker()
+        if circuit_breaker and not circuit_breaker.can_make_request():
+            if raise_on_block:
                 raise RuntimeError("Circuit Breaker OPEN: Quá nhiều lỗi 429, vui lòng thử lại sau")
-            
-            # Rate limiting
-            rate_limiter = get_rate_limiter()
-            if rate_limiter:
-                rate_limiter.wait_if_needed()
-        
-        # Retry logic cho lỗi quota (429) - GIẢM số lần retry
-        max_retries = 1  # Giảm từ 2 xuống 1
-        for attempt in range(max_retries + 1):
+            print(f"🚨 Circuit Breaker OPEN: Bỏ qua chunk do quá nhiều lỗi 429")
+            return None
+
+        # Rate limiting
+        rate_limiter = get_rate_limiter()
+        if rate_limiter:
+            rate_limiter.wait_if_needed()
+
+    # Ngân sách RPM/RPD của từng endpoint: chờ đúng lượng cần thiết, dừng nếu mọi endpoint hết quota ngày
+    endpoint = get_llm_router().acquire()
+    if endpoint is None:
+        if raise_on_block:
+            raise RuntimeError("Đã hết quota LLM trong ngày (AGRI_LLM_RPD), vui lòng thử lại sau")
+        print(f"🚨 Đã hết ngân sách LLM trong ngày: Bỏ qua chunk")
+    return endpoint
+
+
+def _stream_claims_from_llm(
+    endpoint: LLMEndpoint,
+    messages: list,
+    raise_errors: bool,
+    max_retries: int = 1,  # Giảm từ 2 xuống 1 để tránh tạo quá nhiều requests
+    on_complete: Optional[Callable[[List[AgriClaim], str], None]] = None,
+    status: Optional[ExtractionStatus] = None,
+) -> Iterator[AgriClaim]:
+    """
+    Gọi Gemini ở chế độ stream trên `endpoint` (đã được `_admit_llm_call` cấp)
+    và yield từng claim ngay khi object JSON của nó hoàn chỉnh.
+
+    Lỗi quota (429) khi chưa yield claim nào (tránh trùng lặp): chuyển ngay sang
+    endpoint khác còn khỏe; nếu không còn endpoint nào thì retry với backoff.
+    Lỗi giữa chừng giữ lại các claim đã nhận; lỗi trước khi có claim nào thì
+    raise nếu `raise_errors`, ngược lại bỏ qua.
+    `on_complete` chỉ được gọi (với toàn bộ claims và model của endpoint đã trả lời)
+    khi response kết thúc bình thường;
+    lỗi bị bỏ qua được ghi vào `status` (nếu có).
+    """
+    router = get_llm_router()
+    circuit_breaker = get_circuit_breaker() if RATE_LIMITER_AVAILABLE else None
+    attempt = 0
+    leased: Optional[LLMEndpoint] = endpoint
+    try:
+        while leased is not None:
+            endpoint = leased
+            parser = IncrementalClaimParser()
+            received: List[AgriClaim] = []
+            yielded = False
+            input_tokens = output_tokens = 0
             try:
-                # Ghi nhận request
-                if RATE_LIMITER_AVAILABLE:
-                    circuit_breaker = get_circuit_breaker()
-                    if circuit_breaker:
-                        circuit_breaker.record_request()
-                
-                response = client.invoke(messages)
-                raw_content = response.content if isinstance(response.content, str) else (
-                    "".join(part["text"] for part in response.content if isinstance(part, dict) and "text" in part)
-                    if isinstance(response.content, Iterable)
-                    else str(response.content)
-                )
-                
-                # Ghi nhận success
-                if RATE_LIMITER_AVAILABLE:
-                    circuit_breaker = get_circuit_breaker()
-                    if circuit_breaker:
-                        circuit_breaker.record_success()
-                
-                break  # Thành công, thoát khỏi retry loop
+                # Ghi nhận request (cho circuit breaker)
+                if circuit_breaker:
+                    circuit_breaker.record_request()
+
+                for chunk in endpoint.client(EXTRACTION_TEMPERATURE).stream(messages):
+                    chunk_input, chunk_output = usage_tokens(chunk)
+                    input_tokens += chunk_input
+                    output_tokens += chunk_output
+                    for claim in parser.feed(_content_to_text(chunk.content)):
+                        yielded = True
+                        received.append(claim.model_copy())
+                        yield claim
             except Exception as e:
                 error_str = str(e)
-                is_429 = "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower()
-                
-                # Ghi nhận failure
-                if RATE_LIMITER_AVAILABLE:
-                    circuit_breaker = get_circuit_breaker()
-                    if circuit_breaker:
-                        circuit_breaker.record_failure(is_429=is_429)
-                
+                is_429 = is_quota_error(e)
+                leased = None
+                router.release(endpoint, error=e)
+                failover = is_429 and router.has_available_endpoint()
+
+                # Ghi nhận failure (429 còn endpoint khác để failover không tính vào circuit breaker)
+                if circuit_breaker:
+                    circuit_breaker.record_failure(is_429=is_429 and not failover)
+                if not is_429:
+                    # Request bị từ chối vì quota (429) không tính vào usage
+                    record_llm_usage(endpoint.model, input_tokens=input_tokens, output_tokens=output_tokens)
+
+                if yielded:
+                    # Đã nhận một phần output: giữ các claim đã có, không retry
+                    if status is not None:
+                        status.add_error(f"Response bị ngắt giữa chừng: {error_str}")
+                    return
+
+                if failover:
+                    # Chuyển ngay sang endpoint khác (endpoint lỗi đang cooldown), không sleep
+                    leased = _admit_llm_call(raise_on_block=raise_errors)
+                    continue
+
                 # Kiểm tra nếu là lỗi quota (429)
                 if is_429 and attempt < max_retries:
-                    # Nếu circuit breaker đã mở, không retry
-                    if RATE_LIMITER_AVAILABLE:
-                        circuit_breaker = get_circuit_breaker()
-                        if circuit_breaker and circuit_breaker.get_state().name == "OPEN":
+                    # Nếu circuit breaker đã mở, không retry nữa
+                    if circuit_breaker and circuit_breaker.get_state().name == "OPEN":
+                        if raise_errors:
                             raise RuntimeError("Circuit Breaker OPEN: Quá nhiều lỗi 429, vui lòng thử lại sau")
-                    
-                    # Exponential backoff
-                    import random
-                    base_delay = 60
-                    delay = (2 ** attempt) * base_delay
-                    jitter = random.uniform(0, 20)
-                    wait_time = delay + jitter
-                    
-                    try:
-                        retry_match = re.search(r'retry in ([\d.]+)s', error_str, re.IGNORECASE)
-                        if retry_match:
-                            wait_time = max(wait_time, float(retry_match.group(1)) + 10)
-                        else:
-                            retry_delay_match = re.search(r"'retryDelay':\s*'(\d+)s'", error_str)
-                            if retry_delay_match:
-                                wait_time = max(wait_time, float(retry_delay_match.group(1)) + 10)
-                    except:
-                        pass
-                    
+                        print(f"🚨 Circuit Breaker OPEN: Dừng retry do quá nhiều lỗi 429")
+                        if status is not None:
+                            status.add_error("Circuit Breaker OPEN")
+                        return
+
+                    wait_time = _retry_wait_seconds(error_str, attempt)
                     print(f"⚠️ Rate limit hit (429), waiting {wait_time:.1f}s before retry {attempt + 1}/{max_retries}")
                     time.sleep(wait_time)
+                    attempt += 1
+                    leased = _admit_llm_call(raise_on_block=raise_errors)
                     continue
-                # Nếu không phải lỗi quota hoặc đã retry hết, raise lỗi
-                raise
+                # Nếu không phải lỗi quota hoặc đã retry hết
+                if raise_errors:
+                    raise
+                if status is not None:
+                    status.add_error(error_str)
+                return
+            else:
+                # Ghi nhận success
+                leased = None
+                router.release(endpoint)
+                if circuit_breaker:
+                    circuit_breaker.record_success()
+                record_llm_usage(endpoint.model, input_tokens=input_tokens, output_tokens=output_tokens)
+                if on_complete is not None:
+                    on_complete(received, endpoint.model)
+                return
+    finally:
+        # Caller dừng đọc giữa chừng: trả endpoint đang giữ
+        if leased is not None:
+            router.release(leased)
 
-        try:
-            data = json.loads(raw_content)
-        except json.JSONDecodeError:
-            # Thử tìm đoạn JSON trong output (phòng khi model nói nhiều)
-            start = raw_content.find("[")
-            end = raw_content.rfind("]")
-            if start == -1 or end == -1 or end <= start:
-                return []
+
+def _iter_text_claims(
+    text: str,
+    raise_errors: bool,
+    status: Optional[ExtractionStatus] = None,
+) -> Iterator[AgriClaim]:
+    """
+    Trích xuất claims của một đoạn text: trả từ extraction cache nếu có,
+    ngược lại gọi LLM (qua circuit breaker/ngân sách) và lưu kết quả vào cache.
+
+    Đoạn text chỉ được đánh dấu hoàn tất trong `status` khi lấy từ cache hoặc
+    response kết thúc bình thường.
+    """
+    cache = get_extraction_cache()
+    if cache is not None:
+        # Kết quả của bất kỳ model nào trong pool đều dùng được, ưu tiên model đứng trước
+        cached = None
+        for cache_key in _cache_keys(text):
             try:
-                data = json.loads(raw_content[start : end + 1])
-            except json.JSONDecodeError:
-                return []
+                cached = cache.get(cache_key)
+            except Exception:
+                cached = None  # Cache lỗi thì gọi LLM như bình thường
+            if cached is not None:
+                break
+        if cached is not None:
+            yield from cached
+            if status is not None:
+                status.mark_completed()
+            return
 
-        if not isinstance(data, list):
-            return []
+    endpoint = _admit_llm_call(raise_on_block=raise_errors)
+    if endpoint is None:
+        if status is not None:
+            status.add_error("Bỏ qua chunk: circuit breaker mở hoặc hết ngân sách LLM")
+        return
 
-        claims: List[AgriClaim] = []
-        for item in data:
+    def _store(claims: List[AgriClaim], model: str) -> None:
+        if status is not None:
+            status.mark_completed()
+        if cache is not None:
             try:
-                claim = AgriClaim(**item)
-                claims.append(claim)
+                # Khóa theo model đã trả lời (router có thể failover sang model khác)
+                cache.put(_cache_key(text, model), claims)
             except Exception:
-                # Bỏ qua record sai định dạng
+                pass  # Bỏ qua lỗi cache
+
+    yield from _stream_claims_from_llm(
+        endpoint, _build_messages(text), raise_errors=raise_errors, on_complete=_store, status=status
+    )
+
+
+class _OverlapDeduplicator:
+    """
+    Loại claim bị trùng chỉ vì vùng chồng lấp giữa hai chunk liền kề.
+
+    Vị trí (span) của claim trong văn bản được xác định bằng cách tìm `object`
+    trong chunk sinh ra nó. Hai claim cùng (subject, predicate) đến từ hai
+    chunk kề nhau, cùng nằm trong vùng chồng lấp và span giao nhau được coi
+    là một (kể cả khi model diễn đạt object hơi khác). Trùng lặp hoàn toàn
+    (subject + predicate + object) vẫn bị loại như trước.
+    """
+
+    def __init__(self, text: str, spans: List[Tuple[int, int]]) -> None:
+        self._text_lower = text.lower()
+        self._spans = spans
+        self._seen = set()
+        # index vùng chồng lấp (giữa chunk k và k+1) -> [(sp_key, span, chunk)]
+        self._overlap_claims: Dict[int, List[Tuple[Tuple[str, str], Tuple[int, int], int]]] = {}
+
+    def _locate(self, claim: AgriClaim, chunk_idx: int) -> Optional[Tuple[int, int]]:
+        needle = (claim.object or "").strip().lower()
+        if not needle:
+            return None
+        start, end = self._spans[chunk_idx]
+        pos = self._text_lower.find(needle, start, end)
+        return (pos, pos + len(needle)) if pos >= 0 else None
+
+    def _overlap_region(self, span: Tuple[int, int], chunk_idx: int) -> Optional[int]:
+        a, b = span
+        if chunk_idx > 0 and a >= self._spans[chunk_idx][0] and b <= self._spans[chunk_idx - 1][1]:
+            return chunk_idx - 1
+        if chunk_idx + 1 < len(self._spans) and a >= self._spans[chunk_idx + 1][0] and b <= self._spans[chunk_idx][1]:
+            return chunk_idx
+        return None
+
+    def accept(self, claim: AgriClaim, chunk_idx: int) -> bool:
+        """True nếu claim chưa xuất hiện (và ghi nhận nó)."""
+        key = (claim.subject, claim.predicate, claim.object)
+        if key in self._seen:
+            return False
+
+        span = self._locate(claim, chunk_idx)
+        region = self._overlap_region(span, chunk_idx) if span else None
+        if region is not None:
+            sp_key = (normalize_text(claim.subject), normalize_text(claim.predicate))
+            entries = self._overlap_claims.setdefault(region, [])
+            for other_key, other_span, other_chunk in entries:
+                if (other_key == sp_key and other_chunk != chunk_idx
+                        and other_span[0] < span[1] and span[0] < other_span[1]):
+                    return False
+            entries.append((sp_key, span, chunk_idx))
+
+        self._seen.add(key)
+        return True
+
+
+def _iter_chunks_parallel(
+    chunks: List[str],
+    max_workers: int,
+    status: Optional[ExtractionStatus] = None,
+) -> Iterator[Tuple[int, AgriClaim]]:
+    """
+    Trích xuất các chunk song song (tối đa `max_workers` request cùng lúc),
+    yield (chunk index, claim) theo thứ tự claim được sinh ra.
+
+    Chunk đã có trong extraction cache không gọi API; các request còn lại vẫn
+    phải qua `_admit_llm_call` (circuit breaker + ngân sách RPM/RPD) nên song
+    song không làm vượt quota. Chunk lỗi/hết quota bị bỏ qua (ghi vào `status`).
+    """
+    results: "queue.Queue[Tuple[int, object]]" = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def _run(idx: int) -> None:
+        try:
+            if stop.is_set():
+                return
+            for claim in _iter_text_claims(chunks[idx], raise_errors=False, status=status):
+                if stop.is_set():
+                    return
+                results.put((idx, claim))
+        except Exception as e:
+            # Lỗi không thuộc về LLM (VD: thiếu GOOGLE_API_KEY): chuyển cho caller
+            results.put((idx, e))
+        finally:
+            results.put((idx, done))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="agri-chunk")
+    try:
+        for idx in range(len(chunks)):
+            pool.submit(_run, idx)
+        remaining = len(chunks)
+        while remaining:
+            idx, item = results.get()
+            if item is done:
+                remaining -= 1
                 continue
+            if isinstance(item, Exception):
+                raise item
+            yield idx, item
+    finally:
+        # Caller dừng sớm: báo các worker dừng, bỏ các chunk chưa chạy
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _plan_chunks(text: str, use_chunking: bool, chunk_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Các span chunk sẽ gửi cho LLM, hoặc None nếu văn bản được gửi nguyên một request.
+    """
+    # Tối ưu: Tắt chunking cho bài viết ngắn để tiết kiệm API calls
+    # Chỉ chunk nếu bài viết > 3000 ký tự (thay vì 2000)
+    if use_chunking and len(text) > 3000:
+        use_chunking = True
+        chunk_size = 3000  # Tăng chunk size để ít chunks hơn
+    elif len(text) <= 3000:
+        use_chunking = False  # Tắt chunking cho bài viết ngắn
+
+    if not (use_chunking and len(text) > chunk_size):
+        return None
+    return [
+        (start, end)
+        for start, end in _chunk_spans(text, chunk_size=chunk_size, overlap=CHUNK_OVERLAP)
+        if text[start:end].strip()
+    ]
+
+
+# Ước lượng số output token cho một request trích xuất (JSON array các claim)
+ESTIMATED_OUTPUT_TOKENS_PER_CALL = 1500
+
+
+def estimate_extraction_cost(
+    text: Optional[str] = None,
+    use_chunking: bool = True,
+    chunk_size: int = 2000,
+    *,
+    num_chars: Optional[int] = None,
+) -> CostEstimate:
+    """
+    Ước lượng chi phí LLM để trích xuất claims từ `text` (không gọi API).
+
+    Chunk đã có trong extraction cache không được tính. Khi chưa có nội dung
+    (VD: trang web chưa scrape), truyền `num_chars` để ước lượng theo độ dài giả định.
+    """
+    if text is None:
+        # Văn bản giả định gồm các câu ~100 ký tự để chia chunk như văn bản thật
+        num_chars = max(int(num_chars or 0), 0)
+        text = ("x" * 98 + ". ") * (num_chars // 100 + 1)
+        text = text[:num_chars]
+        cache = None
+    else:
+        cache = get_extraction_cache()
+    text = text.strip()
+    if not text:
+        return CostEstimate()
+
+    spans = _plan_chunks(text, use_chunking=use_chunking, chunk_size=chunk_size)
+    chunks = [text] if spans is None else [text[start:end] for start, end in spans]
+    prompt_tokens = estimate_tokens(EXTRACTION_SYSTEM_PROMPT)
+    estimate = CostEstimate()
+    for chunk in chunks:
+        if cache is not None:
+            try:
+                if any(cache.contains(key) for key in _cache_keys(chunk)):
+                    continue
+            except Exception:
+                pass
+        estimate += CostEstimate(
+            requests=1,
+            input_tokens=prompt_tokens + estimate_tokens(chunk),
+            output_tokens=ESTIMATED_OUTPUT_TOKENS_PER_CALL,
+        )
+    return estimate
+
+
+def iter_claims_from_text(
+    text: str,
+    use_chunking: bool = True,
+    chunk_size: int = 2000,
+    status: Optional[ExtractionStatus] = None,
+) -> Iterator[AgriClaim]:
+    """
+    Chế độ streaming của `extract_claims_from_text`: yield từng AgriClaim
+    ngay khi model sinh xong object JSON của claim đó.
+
+    Văn bản dài được chia chunk và các chunk được gửi song song
+    (AGRI_EXTRACT_CHUNK_WORKERS request cùng lúc, trong giới hạn ngân sách LLM).
+    Claims trùng lặp giữa các chunk (kể cả do vùng chồng lấp) chỉ được yield một lần.
+    Nếu truyền `status`, sau khi đọc hết iterator `status.complete` cho biết
+    mọi chunk có kết quả đầy đủ hay không.
+
+    Raises:
+        RuntimeError: Nếu văn bản không chia chunk và gặp lỗi quota (429)/hết ngân sách
+    """
+    text = (text or "").strip()
+    if not text:
+        return
+
+    spans = _plan_chunks(text, use_chunking=use_chunking, chunk_size=chunk_size)
+    if status is not None:
+        status.chunks += 1 if spans is None else len(spans)
+
+    if spans is None:
+        # Văn bản ngắn hoặc không chia nhỏ: lỗi được raise cho caller
+        seen = set()
+        for claim in _iter_text_claims(text, raise_errors=True, status=status):
+            key = (claim.subject, claim.predicate, claim.object)
+            if key not in seen:
+                seen.add(key)
+                yield claim
+        return
+
+    # Chia nhỏ văn bản dài: chunk lỗi/hết quota thì bỏ qua, không dừng cả bài
+    chunks = [text[start:end] for start, end in spans]
+    dedup = _OverlapDeduplicator(text, spans)
+    for chunk_idx, claim in _iter_chunks_parallel(chunks, CHUNK_MAX_WORKERS, status=status):
+        if dedup.accept(claim, chunk_idx):
+            yield claim
+
+
+def extract_claims_from_text(text: str, use_chunking: bool = True, chunk_size: int = 2000) -> List[AgriClaim]:
+    """
+    Trích xuất danh sách AgriClaim từ đoạn văn bản tiếng Việt liên quan nông nghiệp.
+    
+    Args:
+        text: Văn bản cần trích xuất
+        use_chunking: Có chia nhỏ văn bản dài thành các đoạn không (mặc định True)
+        chunk_size: Kích thước mỗi đoạn khi chia nhỏ (mặc định 2000 ký tự)
+    
+    Returns:
+        List các AgriClaim được trích xuất
+    
+    Raises:
+        RuntimeError: Nếu gặp lỗi quota (429) và đã retry hết số lần
+    """
+    return list(iter_claims_from_text(text, use_chunking=use_chunking, chunk_size=chunk_size))
 
-        return claims
+
+def iter_claims_from_page(page: ScrapeResult, status: Optional[ExtractionStatus] = None) -> Iterator[AgriClaim]:
+    """
+    Chế độ streaming của `extract_claims_from_page`: yield từng claim (đã gắn source_url).
+    """
+    if not page.text.strip():
+        return
+
+    for claim in iter_claims_from_text(page.text, status=status):
+        # Gắn source_url cho từng claim để dùng downstream (resolver, logging, ...)
+        claim.source_url = page.url
+        yield claim
+
+
+def extract_claims_from_page(page: ScrapeResult, status: Optional[ExtractionStatus] = None) -> List[AgriClaim]:
+    """
+    Trích xuất claims từ một trang đã scrape (VD: kết quả của scraper.scrape_many).
+
+    Truyền `status` để biết trang có được trích xuất đầy đủ không (chunk lỗi/
+    bị bỏ qua do quota thì `status.complete` là False).
+    """
+    return list(iter_claims_from_page(page, status=status))
 
 
 def extract_claims_from_url(url: str) -> List[AgriClaim]:
@@ -405,19 +762,17 @@ def extract_claims_from_url(url: str) -> List[AgriClaim]:
     if not url:
         return []
 
-    result = scrape_clean_text(url)
-    if not result.text.strip():
-        return []
-
-    claims = extract_claims_from_text(result.text)
-    # Gắn source_url cho từng claim để dùng downstream (resolver, logging, ...)
-    for c in claims:
-        c.source_url = url
-    return claims
+    return extract_claims_from_page(scrape_clean_text(url))
 
 
 __all__ = [
+    "ExtractionStatus",
+    "IncrementalClaimParser",
+    "estimate_extraction_cost",
     "extract_claims_from_text",
+    "iter_claims_from_text",
+    "iter_claims_from_page",
+    "extract_claims_from_page",
     "extract_claims_from_url",
 ]
 
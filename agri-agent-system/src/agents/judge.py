@@ -3,30 +3,55 @@ NLI Judge: Phát hiện mâu thuẫn giữa các claims bằng LLM và Embedding
 
 Tính năng:
 - Sử dụng Gemini để phát hiện contradictions (NLI Judge)
-- Sử dụng embedding models để semantic comparison
-- Cache kết quả để tiết kiệm API calls
+- Sử dụng embedding models để semantic comparison (judge backend: Gemini hoặc
+  backend local char n-gram chạy offline, xem `src/utils/judge_backends.py`)
+- Cache kết quả để tiết kiệm API calls (SQLite judgement store, có version theo prompt)
 """
 
 from __future__ import annotations
 
 import json
-import os
 import hashlib
+import re
+import threading
 from pathlib import Path
 from typing import Dict, List, Literal, Optional, Tuple
-import pickle
 
 import numpy as np
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from src.models import AgriClaim
+from src.utils.embedding_cache import EmbeddingCache
+from src.utils.judge_backends import (
+    CONTRADICTION_KEYWORDS,
+    GEMINI_EMBEDDING_MODEL,
+    JudgeBackend,
+    get_gemini_backend,
+    get_judge_backend,
+    get_local_backend,
+)
+from src.utils.judge_store import JudgeStore
+from src.utils.vector_index import ClusterIndex
+from src.utils.llm_router import DEFAULT_LLM_MODEL, get_llm_router
+from src.utils.rate_limiter import get_llm_budget
+from src.utils.usage_ledger import CostEstimate, estimate_tokens, record_llm_usage
 
 
 # Cache directory
 CACHE_DIR = Path(__file__).parent.parent.parent / "data" / "judge_cache"
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
+JUDGE_STORE_PATH = CACHE_DIR / "judgements.sqlite3"
+
+EMBEDDING_MODEL = GEMINI_EMBEDDING_MODEL
+JUDGE_TEMPERATURE = 0.1
+# Tăng khi đổi logic rule-based (bước 1-3 trong judge_claims) để vô hiệu hóa verdict cũ
+JUDGE_RULES_VERSION = "1"
+
+# Số cặp tối đa trong một request NLI theo lô
+JUDGE_BATCH_SIZE = 20
+VALID_RELATIONS = ("SUPPORTED", "CONTRADICTED", "NEUTRAL")
 
 
 NLI_JUDGE_SYSTEM_PROMPT = """Bạn là Thẩm phán Logic (NLI Judge) chuyên về dữ liệu nông nghiệp Việt Nam.
@@ -50,35 +75,47 @@ Trả về JSON với format:
 }
 """
 
+# Prompt cho chế độ lô: dùng lại phần quy tắc/ví dụ của prompt đơn (nên version
+# của verdict vẫn theo NLI_JUDGE_SYSTEM_PROMPT), chỉ đổi định dạng output.
+NLI_BATCH_JUDGE_SYSTEM_PROMPT = NLI_JUDGE_SYSTEM_PROMPT.split("Trả về JSON với format:")[0] + """Bạn sẽ nhận NHIỀU cặp mệnh đề, mỗi cặp có chỉ số [i].
+Đánh giá TỪNG cặp độc lập và trả về DUY NHẤT một JSON array, mỗi cặp đúng một phần tử:
+[
+  {"index": i, "relation": "SUPPORTED" | "CONTRADICTED" | "NEUTRAL", "confidence": 0.0-1.0, "reasoning": "Giải thích ngắn gọn"}
+]
+"""
+
+
+def _judge_model() -> str:
+    """
+    Model dùng cho NLI Judge: model ưu tiên nhất trong AGRI_LLM_MODELS.
+
+    Judge chỉ failover giữa các key của model này (không sang model khác) để
+    verdict trong judgement store luôn khớp với version của nó.
+    """
+    return next(iter(get_llm_router().models), DEFAULT_LLM_MODEL)
+
 
 def _get_gemini_client() -> ChatGoogleGenerativeAI:
-    """Lấy Gemini client cho NLI Judge."""
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("GOOGLE_API_KEY chưa được thiết lập")
-    
-    # Đổi sang gemini-2.5-flash-lite để tránh rate limit của gemini-2.5-flash
-    # gemini-2.5-flash đã vượt limit (23/20 RPD), flash-lite còn trống (0/10 RPM, 0/20 RPD)
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",  # Đổi sang flash-lite để tránh rate limit
-        api_key=api_key,
-        temperature=0.1,  # Thấp để có kết quả nhất quán
-    )
+    """
+    Gemini client cho NLI Judge trên endpoint ưu tiên nhất (dùng lại giữa các lần gọi).
+    Các lần judge thực tế đi qua LLM router (`_invoke_judge`) để failover khi hết quota.
+    """
+    return get_llm_router().primary.client(JUDGE_TEMPERATURE)  # Temperature thấp để có kết quả nhất quán
 
 
-def _get_embedding_model() -> Optional[GoogleGenerativeAIEmbeddings]:
-    """Lấy embedding model cho semantic comparison."""
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        return None
-    
-    try:
-        return GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=api_key,
-        )
-    except Exception:
-        return None
+def _invoke_judge(messages: list, client: Optional[ChatGoogleGenerativeAI] = None):
+    """
+    Gọi LLM cho NLI Judge: mặc định qua LLM router (chọn key ít tải nhất của
+    `_judge_model()`, chuyển key ngay khi gặp 429); nếu truyền `client` thì gọi trực tiếp
+    client đó trong ngân sách LLM toàn cục.
+    """
+    if client is None:
+        return get_llm_router().invoke(messages, temperature=JUDGE_TEMPERATURE, model=_judge_model())
+    if not get_llm_budget().acquire():
+        raise RuntimeError("Đã hết quota LLM trong ngày (AGRI_LLM_RPD)")
+    response = client.invoke(messages)
+    record_llm_usage(_judge_model(), response)
+    return response
 
 
 def _get_cache_key(claim1: AgriClaim, claim2: AgriClaim) -> str:
@@ -88,68 +125,325 @@ def _get_cache_key(claim1: AgriClaim, claim2: AgriClaim) -> str:
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
+def _judge_version() -> str:
+    """
+    Version của verdict: đổi prompt/model/rules thì verdict cũ tự động bị bỏ qua.
+
+    Verdict similarity (bước 3 của `judge_claims`) chỉ được cache khi do backend
+    Gemini tạo ra, nên version gồm cả embedding model và ngưỡng của backend đó.
+    """
+    gemini = get_gemini_backend()
+    key_str = (
+        f"{NLI_JUDGE_SYSTEM_PROMPT}|{_judge_model()}|{JUDGE_TEMPERATURE}|{JUDGE_RULES_VERSION}|"
+        f"{gemini.name}:{gemini.model}:{gemini.support_threshold}"
+    )
+    return hashlib.sha1(key_str.encode()).hexdigest()[:16]
+
+
+_judge_store: Optional[JudgeStore] = None
+_judge_store_lock = threading.Lock()
+
+
+def get_judge_store() -> JudgeStore:
+    """
+    Lấy judgement store dùng chung (SQLite, WAL).
+
+    Lần đầu mở sẽ nhập các file `.pkl` cũ trong CACHE_DIR vào store.
+    """
+    global _judge_store
+    if _judge_store is None:
+        with _judge_store_lock:
+            if _judge_store is None:
+                store = JudgeStore(JUDGE_STORE_PATH, version=_judge_version())
+                try:
+                    store.import_legacy_pickles(CACHE_DIR)
+                except Exception:
+                    pass  # Bỏ qua lỗi migrate, cache cũ không bắt buộc
+                _judge_store = store
+    return _judge_store
+
+
 def _load_from_cache(cache_key: str) -> Optional[Dict]:
     """Load kết quả từ cache."""
-    cache_file = CACHE_DIR / f"{cache_key}.pkl"
-    if cache_file.exists():
-        try:
-            with open(cache_file, 'rb') as f:
-                return pickle.load(f)
-        except Exception:
-            return None
-    return None
+    try:
+        return get_judge_store().get(cache_key)
+    except Exception:
+        return None
 
 
 def _save_to_cache(cache_key: str, result: Dict) -> None:
     """Lưu kết quả vào cache."""
-    cache_file = CACHE_DIR / f"{cache_key}.pkl"
     try:
-        with open(cache_file, 'wb') as f:
-            pickle.dump(result, f)
+        get_judge_store().put(cache_key, result)
     except Exception:
         pass  # Bỏ qua lỗi cache
 
 
-def _semantic_similarity_embedding(
-    text1: str, 
-    text2: str, 
-    embedding_model: GoogleGenerativeAIEmbeddings
-) -> float:
+def _load_many_from_cache(cache_keys: List[str]) -> Dict[str, Dict]:
+    """Load nhiều kết quả từ cache trong một lượt truy vấn."""
+    try:
+        return get_judge_store().get_many(cache_keys)
+    except Exception:
+        return {}
+
+
+def _save_many_to_cache(items: List[Tuple[str, Dict]]) -> None:
+    """Lưu nhiều kết quả vào cache trong một transaction."""
+    try:
+        get_judge_store().put_many(items)
+    except Exception:
+        pass  # Bỏ qua lỗi cache
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Lấy embedding cache on-disk dùng chung của backend Gemini (None nếu không mở được)."""
+    return get_gemini_backend().cache()
+
+
+def _embed_texts(
+    texts: List[str],
+    claims: Optional[List[AgriClaim]] = None,
+) -> Tuple[Optional[np.ndarray], Optional[JudgeBackend]]:
+    """
+    Embed nhiều text (hoặc `claims`, theo `claim_text` của từng backend) bằng
+    judge backend hiện tại; ma trận đã chuẩn hóa L2 (dot product = cosine).
+    Backend chính lỗi (VD: API embedding lỗi) thì dùng backend local để vẫn lọc
+    được các cặp hiển nhiên mà không cần LLM.
+
+    Returns
+    -------
+    (vectors, backend)
+        backend là backend đã thực sự tạo ra vectors (None nếu không embed được).
+    """
+    for backend in dict.fromkeys([get_judge_backend(), get_local_backend()]):
+        try:
+            inputs = texts if claims is None else [backend.claim_text(claim) for claim in claims]
+            return backend.embed(inputs), backend
+        except Exception:
+            continue
+    return None, None
+
+
+def _new_result(relation: str, confidence: float, reasoning: str) -> Dict:
+    """Tạo dict kết quả judge chuẩn."""
+    return {
+        "relation": relation,
+        "confidence": confidence,
+        "reasoning": reasoning,
+        "from_cache": False,
+    }
+
+
+def _format_claim_for_judge(claim: AgriClaim) -> str:
+    """Format claim thành mệnh đề đưa vào prompt NLI Judge."""
+    claim_str = f"{claim.subject} - {claim.predicate}: {claim.object}"
+    if claim.context:
+        claim_str += f" (Context: {claim.context})"
+    return claim_str
+
+
+def _judge_with_llm(
+    claim1: AgriClaim,
+    claim2: AgriClaim,
+    result: Dict,
+    client: Optional[ChatGoogleGenerativeAI] = None,
+) -> Dict:
     """
-    Tính độ tương đồng semantic bằng embedding.
-    Returns: 0.0-1.0 (1.0 = giống nhau hoàn toàn)
+    Bước 4 của judge_claims: gọi LLM (NLI Judge) cho một cặp claims.
+
+    Cập nhật và trả về `result` (relation/confidence/reasoning). Lỗi LLM
+    không raise mà được ghi vào reasoning với confidence thấp và đánh dấu
+    `llm_error=True` (giống `_judge_batch_with_llm`, không nên cache).
     """
+    obj1 = (claim1.object or "").strip()
+    obj2 = (claim2.object or "").strip()
     try:
-        emb1 = embedding_model.embed_query(text1)
-        emb2 = embedding_model.embed_query(text2)
+        # Format claims
+        claim1_str = _format_claim_for_judge(claim1)
+        claim2_str = _format_claim_for_judge(claim2)
+        
+        prompt = f"""Mệnh đề 1: {claim1_str}
+Mệnh đề 2: {claim2_str}
+
+Hãy phân tích và trả về JSON theo format đã quy định."""
         
-        # Cosine similarity
-        dot_product = np.dot(emb1, emb2)
-        norm1 = np.linalg.norm(emb1)
-        norm2 = np.linalg.norm(emb2)
+        messages = [
+            SystemMessage(content=NLI_JUDGE_SYSTEM_PROMPT),
+            HumanMessage(content=prompt)
+        ]
         
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
+        response = _invoke_judge(messages, client)
+        content = response.content if isinstance(response.content, str) else str(response.content)
         
-        similarity = dot_product / (norm1 * norm2)
-        return float(similarity)
-    except Exception:
-        return 0.0
+        # Parse JSON
+        try:
+            # Tìm JSON trong response
+            start = content.find("{")
+            end = content.rfind("}")
+            if start != -1 and end != -1:
+                json_str = content[start:end+1]
+                llm_result = json.loads(json_str)
+                
+                result["relation"] = llm_result.get("relation", "NEUTRAL")
+                result["confidence"] = float(llm_result.get("confidence", 0.5))
+                result["reasoning"] = llm_result.get("reasoning", "")
+            else:
+                # Fallback: tìm keywords trong response
+                content_lower = content.lower()
+                if "contradicted" in content_lower or "mâu thuẫn" in content_lower:
+                    result["relation"] = "CONTRADICTED"
+                elif "supported" in content_lower or "trùng khớp" in content_lower:
+                    result["relation"] = "SUPPORTED"
+                result["reasoning"] = content[:200]  # Lấy 200 ký tự đầu
+        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            # Fallback: phân tích đơn giản (verdict tạm, không cache)
+            result["llm_error"] = True
+            if obj1 and obj2:
+                # Kiểm tra các từ khóa mâu thuẫn
+                for kw1, kw2 in CONTRADICTION_KEYWORDS:
+                    if (kw1 in obj1.lower() and kw2 in obj2.lower()) or \
+                       (kw2 in obj1.lower() and kw1 in obj2.lower()):
+                        result["relation"] = "CONTRADICTED"
+                        result["reasoning"] = f"Phát hiện từ khóa mâu thuẫn: {kw1} vs {kw2}"
+                        result["confidence"] = 0.7
+                        break
+                
+                if result["relation"] == "NEUTRAL":
+                    result["reasoning"] = f"Không thể parse kết quả từ LLM: {str(e)}"
+    except Exception as e:
+        # Fallback cuối cùng
+        result["reasoning"] = f"Lỗi khi gọi LLM: {str(e)}"
+        result["confidence"] = 0.3
+        result["llm_error"] = True
+    
+    return result
 
 
-def _simple_text_similarity(text1: str, text2: str) -> float:
+def _parse_batch_response(content: str, expected: int) -> Dict[int, Dict]:
     """
-    Tính độ tương đồng đơn giản bằng string matching (fallback).
+    Parse output JSON array của NLI theo lô, kiểm tra từng phần tử.
+
+    Phần tử hợp lệ phải có `index` trong [0, expected), `relation` thuộc
+    VALID_RELATIONS và `confidence` là số. Nếu cả array hỏng, vẫn cố cứu
+    từng object `{...}` riêng lẻ.
+
+    Returns
+    -------
+    Dict[int, Dict]
+        Map index -> kết quả judge (chỉ gồm các cặp hợp lệ).
     """
-    from difflib import SequenceMatcher
-    
-    text1 = (text1 or "").strip().lower()
-    text2 = (text2 or "").strip().lower()
-    
-    if text1 == text2:
-        return 1.0
-    
-    return SequenceMatcher(None, text1, text2).ratio()
+    items = None
+    start = content.find("[")
+    end = content.rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            items = None
+
+    if not isinstance(items, list):
+        items = []
+        for match in re.finditer(r"\{[^{}]*\}", content):
+            try:
+                items.append(json.loads(match.group(0)))
+            except json.JSONDecodeError:
+                continue
+
+    parsed: Dict[int, Dict] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("index"))
+            confidence = float(item.get("confidence"))
+        except (TypeError, ValueError):
+            continue
+        relation = str(item.get("relation", "")).strip().upper()
+        if relation not in VALID_RELATIONS or not (0 <= index < expected) or index in parsed:
+            continue
+        parsed[index] = _new_result(
+            relation,
+            min(max(confidence, 0.0), 1.0),
+            str(item.get("reasoning") or ""),
+        )
+    return parsed
+
+
+def _judge_batch_with_llm(
+    pairs: List[Tuple[AgriClaim, AgriClaim]],
+    client: Optional[ChatGoogleGenerativeAI] = None,
+    batch_size: int = JUDGE_BATCH_SIZE,
+    max_retries: int = 1,
+) -> List[Dict]:
+    """
+    Judge nhiều cặp claims, đóng gói tối đa `batch_size` cặp trong một request.
+
+    Các cặp bị thiếu/sai định dạng trong output được gửi lại (tối đa
+    `max_retries` lần), không gửi lại cả lô. Cặp vẫn lỗi sau cùng hoặc lô gặp
+    lỗi LLM được đánh dấu `llm_error=True` (confidence thấp, không nên cache).
+
+    Returns
+    -------
+    List[Dict]
+        Kết quả cùng thứ tự với `pairs`.
+    """
+    results: List[Optional[Dict]] = [None] * len(pairs)
+    if not pairs:
+        return []
+
+    def _error_result(reasoning: str) -> Dict:
+        result = _new_result("NEUTRAL", 0.3, reasoning)
+        result["llm_error"] = True
+        return result
+
+    try:
+        if client is None:
+            get_llm_router().primary  # Thiếu API key thì báo lỗi ngay, không gửi lô nào
+    except Exception as e:
+        return [_error_result(f"Lỗi khi gọi LLM: {str(e)}") for _ in pairs]
+
+    pending = list(range(len(pairs)))
+    for _attempt in range(max_retries + 1):
+        if not pending:
+            break
+        malformed: List[int] = []
+        for start in range(0, len(pending), max(1, batch_size)):
+            chunk = pending[start:start + max(1, batch_size)]
+            prompt_lines = []
+            for local_idx, pair_idx in enumerate(chunk):
+                claim1, claim2 = pairs[pair_idx]
+                prompt_lines.append(
+                    f"[{local_idx}] Mệnh đề 1: {_format_claim_for_judge(claim1)}\n"
+                    f"    Mệnh đề 2: {_format_claim_for_judge(claim2)}"
+                )
+            prompt = (
+                "\n".join(prompt_lines)
+                + f"\n\nHãy phân tích {len(chunk)} cặp trên và trả về JSON array theo format đã quy định."
+            )
+            messages = [
+                SystemMessage(content=NLI_BATCH_JUDGE_SYSTEM_PROMPT),
+                HumanMessage(content=prompt),
+            ]
+            try:
+                response = _invoke_judge(messages, client)
+                content = response.content if isinstance(response.content, str) else str(response.content)
+            except Exception as e:
+                # Lỗi LLM (quota, mạng...): gửi lại không giúp gì, đánh dấu lỗi cả lô
+                for pair_idx in chunk:
+                    results[pair_idx] = _error_result(f"Lỗi khi gọi LLM: {str(e)}")
+                continue
+
+            parsed = _parse_batch_response(content, len(chunk))
+            for local_idx, pair_idx in enumerate(chunk):
+                if local_idx in parsed:
+                    results[pair_idx] = parsed[local_idx]
+                else:
+                    malformed.append(pair_idx)
+        pending = malformed
+
+    for pair_idx in pending:
+        results[pair_idx] = _error_result("Không thể parse kết quả từ LLM (batch)")
+    return results  # type: ignore[return-value]
 
 
 def judge_claims(
@@ -216,114 +510,198 @@ def judge_claims(
                 _save_to_cache(cache_key, result)
             return result
     
-    # Bước 3: Semantic similarity check (nếu có embedding)
+    # Bước 3: Semantic similarity check (embedding của judge backend)
     if use_embedding and obj1 and obj2:
-        embedding_model = _get_embedding_model()
-        if embedding_model:
-            similarity = _semantic_similarity_embedding(obj1, obj2, embedding_model)
+        matrix, backend = _pairwise_similarity_matrix([obj1, obj2], use_embedding)
+        if matrix is not None and backend is not None:
+            similarity = float(matrix[0, 1])
             
-            # Nếu similarity rất cao (>0.95) → SUPPORTED
-            if similarity > 0.95:
+            # Similarity rất cao (> ngưỡng của backend) → SUPPORTED
+            if similarity > backend.support_threshold:
                 result["relation"] = "SUPPORTED"
-                result["reasoning"] = f"Giá trị tương đồng cao (similarity: {similarity:.2f})"
+                result["reasoning"] = f"{backend.similarity_label} (similarity: {similarity:.2f})"
                 result["confidence"] = similarity
-                if use_cache:
+                # Verdict của backend local (kể cả khi fallback vì Gemini lỗi) không
+                # được cache, như ở bước 4: ngưỡng khác nên không lẫn với verdict Gemini
+                if use_cache and backend.name == get_gemini_backend().name:
                     _save_to_cache(cache_key, result)
                 return result
             
-            # Nếu similarity rất thấp (<0.3) và cùng predicate → có thể CONTRADICTED
-            # Nhưng cần LLM để xác nhận
-        else:
-            # Fallback: string similarity
-            similarity = _simple_text_similarity(obj1, obj2)
-            if similarity > 0.9:
-                result["relation"] = "SUPPORTED"
-                result["reasoning"] = f"Giá trị tương đồng (similarity: {similarity:.2f})"
-                result["confidence"] = similarity
-                if use_cache:
-                    _save_to_cache(cache_key, result)
-                return result
+            # Similarity thấp và cùng predicate → có thể CONTRADICTED
+            # Nhưng cần NLI để xác nhận
     
-    # Bước 4: Gọi LLM để phát hiện mâu thuẫn (NLI Judge)
-    try:
-        client = _get_gemini_client()
-        
-        # Format claims
-        claim1_str = f"{claim1.subject} - {claim1.predicate}: {claim1.object}"
-        if claim1.context:
-            claim1_str += f" (Context: {claim1.context})"
-        
-        claim2_str = f"{claim2.subject} - {claim2.predicate}: {claim2.object}"
-        if claim2.context:
-            claim2_str += f" (Context: {claim2.context})"
-        
-        prompt = f"""Mệnh đề 1: {claim1_str}
-Mệnh đề 2: {claim2_str}
-
-Hãy phân tích và trả về JSON theo format đã quy định."""
-        
-        messages = [
-            SystemMessage(content=NLI_JUDGE_SYSTEM_PROMPT),
-            HumanMessage(content=prompt)
-        ]
-        
-        response = client.invoke(messages)
-        content = response.content if isinstance(response.content, str) else str(response.content)
-        
-        # Parse JSON
-        try:
-            # Tìm JSON trong response
-            start = content.find("{")
-            end = content.rfind("}")
-            if start != -1 and end != -1:
-                json_str = content[start:end+1]
-                llm_result = json.loads(json_str)
-                
-                result["relation"] = llm_result.get("relation", "NEUTRAL")
-                result["confidence"] = float(llm_result.get("confidence", 0.5))
-                result["reasoning"] = llm_result.get("reasoning", "")
-            else:
-                # Fallback: tìm keywords trong response
-                content_lower = content.lower()
-                if "contradicted" in content_lower or "mâu thuẫn" in content_lower:
-                    result["relation"] = "CONTRADICTED"
-                elif "supported" in content_lower or "trùng khớp" in content_lower:
-                    result["relation"] = "SUPPORTED"
-                result["reasoning"] = content[:200]  # Lấy 200 ký tự đầu
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            # Fallback: phân tích đơn giản
-            if obj1 and obj2:
-                # Kiểm tra các từ khóa mâu thuẫn
-                contradiction_keywords = [
-                    ("giải nhất", "giải khuyến khích"),
-                    ("giải nhất", "giải nhì"),
-                    ("giải nhất", "giải ba"),
-                    ("có", "không có"),
-                    ("đúng", "sai"),
-                ]
-                
-                for kw1, kw2 in contradiction_keywords:
-                    if (kw1 in obj1.lower() and kw2 in obj2.lower()) or \
-                       (kw2 in obj1.lower() and kw1 in obj2.lower()):
-                        result["relation"] = "CONTRADICTED"
-                        result["reasoning"] = f"Phát hiện từ khóa mâu thuẫn: {kw1} vs {kw2}"
-                        result["confidence"] = 0.7
-                        break
-                
-                if result["relation"] == "NEUTRAL":
-                    result["reasoning"] = f"Không thể parse kết quả từ LLM: {str(e)}"
-    except Exception as e:
-        # Fallback cuối cùng
-        result["reasoning"] = f"Lỗi khi gọi LLM: {str(e)}"
-        result["confidence"] = 0.3
+    # Bước 4: NLI - backend local tự phán quyết offline, ngược lại gọi LLM (NLI Judge)
+    local_results = get_judge_backend().judge_pairs([(claim1, claim2)])
+    if local_results is not None:
+        # Verdict theo luật của backend local không được cache (rẻ, và không lẫn với verdict LLM)
+        return local_results[0]
+    result = _judge_with_llm(claim1, claim2, result)
     
-    # Lưu vào cache
-    if use_cache:
+    # Lưu vào cache (kết quả lỗi LLM thì không, để lần sau gọi lại)
+    if use_cache and not result.get("llm_error"):
         _save_to_cache(cache_key, result)
     
     return result
 
 
+def _pairwise_similarity_matrix(
+    objects: List[str],
+    use_embedding: bool,
+) -> Tuple[Optional[np.ndarray], Optional[JudgeBackend]]:
+    """
+    Tính ma trận độ tương đồng giữa các object (duy nhất) của nhóm.
+
+    Returns
+    -------
+    (matrix, backend)
+        matrix[a, b] = cosine similarity theo vector của `backend` (ngưỡng
+        SUPPORTED là `backend.support_threshold`). None nếu không cần/không thể tính.
+    """
+    if not use_embedding or not objects:
+        return None, None
+
+    vectors, backend = _embed_texts(objects)
+    if vectors is None:
+        return None, None
+    return vectors @ vectors.T, backend
+
+
+def _judge_residual_pairs(
+    pairs: List[Tuple[AgriClaim, AgriClaim]],
+    use_cache: bool = True,
+    batch_size: int = JUDGE_BATCH_SIZE,
+) -> List[Dict]:
+    """
+    Judge các cặp không quyết định được bằng luật/similarity.
+
+    Đọc cache theo lô, khử trùng lặp theo cache key, gửi phần còn thiếu tới
+    LLM theo lô rồi ghi cache theo lô (bỏ qua kết quả lỗi để lần sau thử lại).
+    """
+    if not pairs:
+        return []
+
+    keys = [_get_cache_key(c1, c2) for c1, c2 in pairs]
+    known: Dict[str, Dict] = {}
+    if use_cache:
+        for key, cached in _load_many_from_cache(keys).items():
+            cached["from_cache"] = True
+            known[key] = cached
+
+    # Cặp trùng nội dung (cùng cache key) chỉ cần judge một lần
+    todo: Dict[str, Tuple[AgriClaim, AgriClaim]] = {}
+    for key, pair in zip(keys, pairs):
+        if key not in known:
+            todo.setdefault(key, pair)
+
+    if todo:
+        todo_keys = list(todo.keys())
+        todo_pairs = [todo[key] for key in todo_keys]
+        # Backend local phán quyết offline (không cache); backend Gemini gửi tới LLM theo lô
+        local_results = get_judge_backend().judge_pairs(todo_pairs)
+        if local_results is not None:
+            known.update(zip(todo_keys, local_results))
+            return [known[key] for key in keys]
+        judged = _judge_batch_with_llm(todo_pairs, batch_size=batch_size)
+        known.update(zip(todo_keys, judged))
+        if use_cache:
+            _save_many_to_cache(
+                [(key, result) for key, result in zip(todo_keys, judged) if not result.get("llm_error")]
+            )
+
+    return [known[key] for key in keys]
+
+
+# Ước lượng số token cho mỗi cặp claim trong prompt/response của batch judge
+_ESTIMATED_TOKENS_PER_PAIR = 80
+
+
+def estimate_judge_cost(num_pairs: int, batch_size: int = JUDGE_BATCH_SIZE) -> CostEstimate:
+    """
+    Ước lượng chi phí LLM tối đa để judge `num_pairs` cặp (giả sử không cặp
+    nào được cache/embedding xử lý trước).
+    """
+    if num_pairs <= 0:
+        return CostEstimate()
+    num_batches = -(-num_pairs // max(batch_size, 1))
+    return CostEstimate(
+        requests=num_batches,
+        input_tokens=num_batches * estimate_tokens(NLI_BATCH_JUDGE_SYSTEM_PROMPT)
+        + num_pairs * _ESTIMATED_TOKENS_PER_PAIR,
+        output_tokens=num_pairs * _ESTIMATED_TOKENS_PER_PAIR,
+    )
+
+
+def judge_claim_pairs(
+    pairs: List[Tuple[AgriClaim, AgriClaim]],
+    use_embedding: bool = True,
+    use_cache: bool = True,
+    batch_size: int = JUDGE_BATCH_SIZE,
+) -> List[Dict]:
+    """
+    So sánh nhiều cặp claims, gom các cặp cần LLM vào ít request nhất.
+
+    Cùng quy tắc với `judge_claims` (khác subject/predicate -> NEUTRAL, object
+    giống hệt hoặc similarity cao -> SUPPORTED), nhưng object của mọi cặp được
+    embed một lần và các cặp còn lại được gửi tới LLM theo lô `batch_size`
+    cặp/request.
+
+    Parameters
+    ----------
+    pairs: List[Tuple[AgriClaim, AgriClaim]]
+        Các cặp claims cần so sánh
+    use_embedding: bool
+        Sử dụng embedding để semantic comparison trước khi gọi LLM
+    use_cache: bool
+        Sử dụng cache để tránh gọi API nhiều lần
+    batch_size: int
+        Số cặp tối đa trong một request LLM
+
+    Returns
+    -------
+    List[Dict]
+        Kết quả (cùng format với `judge_claims`) theo đúng thứ tự `pairs`.
+    """
+    results: List[Optional[Dict]] = [None] * len(pairs)
+    candidates: List[int] = []
+    objects: List[str] = []
+    obj_ids: Dict[str, int] = {}
+    pair_objs: List[Tuple[int, int]] = []
+
+    for idx, (claim1, claim2) in enumerate(pairs):
+        if (claim1.subject.strip().lower() != claim2.subject.strip().lower() or
+                claim1.predicate.strip().lower() != claim2.predicate.strip().lower()):
+            results[idx] = _new_result("NEUTRAL", 1.0, "Khác subject hoặc predicate")
+            continue
+        obj1 = (claim1.object or "").strip()
+        obj2 = (claim2.object or "").strip()
+        if obj1 and obj2 and obj1.lower() == obj2.lower():
+            results[idx] = _new_result("SUPPORTED", 1.0, "Giá trị giống nhau hoàn toàn")
+            continue
+        if obj1 and obj2:
+            for obj in (obj1, obj2):
+                if obj.lower() not in obj_ids:
+                    obj_ids[obj.lower()] = len(objects)
+                    objects.append(obj)
+            candidates.append(idx)
+            pair_objs.append((obj_ids[obj1.lower()], obj_ids[obj2.lower()]))
+
+    residual = [idx for idx, result in enumerate(results) if result is None]
+    if candidates:
+        matrix, backend = _pairwise_similarity_matrix(objects, use_embedding)
+        if matrix is not None and backend is not None:
+            label = backend.similarity_label
+            a_ids, b_ids = np.array(pair_objs).T
+            for idx, similarity in zip(candidates, matrix[a_ids, b_ids].tolist()):
+                if similarity > backend.support_threshold:
+                    results[idx] = _new_result("SUPPORTED", similarity, f"{label} (similarity: {similarity:.2f})")
+            residual = [idx for idx, result in enumerate(results) if result is None]
+
+    judged = _judge_residual_pairs([pairs[idx] for idx in residual], use_cache=use_cache, batch_size=batch_size)
+    for idx, result in zip(residual, judged):
+        results[idx] = result
+    return results  # type: ignore[return-value]
+
+
 def detect_contradictions_in_group(
     claims: List[AgriClaim],
     use_embedding: bool = True,
@@ -332,6 +710,11 @@ def detect_contradictions_in_group(
     """
     Phát hiện contradictions trong một nhóm claims.
     
+    Chế độ ma trận: embed nhóm một lần, tính toàn bộ ma trận cosine bằng NumPy
+    rồi quyết định hàng loạt các cặp hiển nhiên (khác subject/predicate -> NEUTRAL,
+    object giống hệt hoặc similarity cao -> SUPPORTED). Chỉ các cặp còn lại
+    (mơ hồ) mới được tra cache và gửi tới LLM.
+    
     Parameters
     ----------
     claims: List[AgriClaim]
@@ -357,34 +740,84 @@ def detect_contradictions_in_group(
             "all_relations": {}
         }
     
+    n = len(claims)
+    rows, cols = np.triu_indices(n, k=1)
+    
+    # Mã hóa (subject, predicate) và object thành id nguyên để so sánh vector hóa
+    sp_ids: Dict[Tuple[str, str], int] = {}
+    obj_ids: Dict[str, int] = {}
+    objects: List[str] = []
+    claim_sp = np.empty(n, dtype=np.int64)
+    claim_obj = np.full(n, -1, dtype=np.int64)
+    for idx, claim in enumerate(claims):
+        sp_key = (claim.subject.strip().lower(), claim.predicate.strip().lower())
+        claim_sp[idx] = sp_ids.setdefault(sp_key, len(sp_ids))
+        obj = (claim.object or "").strip()
+        if obj:
+            obj_key = obj.lower()
+            if obj_key not in obj_ids:
+                obj_ids[obj_key] = len(objects)
+                objects.append(obj)
+            claim_obj[idx] = obj_ids[obj_key]
+    
+    same_sp = claim_sp[rows] == claim_sp[cols]
+    both_obj = (claim_obj[rows] >= 0) & (claim_obj[cols] >= 0)
+    exact = same_sp & both_obj & (claim_obj[rows] == claim_obj[cols])
+    
+    similar = np.zeros_like(exact)
+    sim_values = np.zeros(len(rows), dtype=np.float32)
+    candidates = same_sp & both_obj & ~exact
+    label = ""
+    if candidates.any():
+        matrix, backend = _pairwise_similarity_matrix(objects, use_embedding)
+        if matrix is not None and backend is not None:
+            sim_values = matrix[np.maximum(claim_obj[rows], 0), np.maximum(claim_obj[cols], 0)]
+            similar = candidates & (sim_values > backend.support_threshold)
+            label = backend.similarity_label
+    
+    residual = same_sp & ~exact & ~similar
+    
+    # Kết quả hàng loạt cho các cặp hiển nhiên
+    results: Dict[Tuple[int, int], Dict] = {}
+    neutral_result = _new_result("NEUTRAL", 1.0, "Khác subject hoặc predicate")
+    exact_result = _new_result("SUPPORTED", 1.0, "Giá trị giống nhau hoàn toàn")
+    for k in np.flatnonzero(~same_sp):
+        results[(int(rows[k]), int(cols[k]))] = neutral_result
+    for k in np.flatnonzero(exact):
+        results[(int(rows[k]), int(cols[k]))] = exact_result
+    for k in np.flatnonzero(similar):
+        similarity = float(sim_values[k])
+        results[(int(rows[k]), int(cols[k]))] = _new_result(
+            "SUPPORTED", similarity, f"{label} (similarity: {similarity:.2f})"
+        )
+    
+    # Các cặp mơ hồ: đọc cache theo lô, gửi phần còn thiếu tới LLM theo lô
+    residual_pairs = [(int(rows[k]), int(cols[k])) for k in np.flatnonzero(residual)]
+    residual_results = _judge_residual_pairs(
+        [(claims[i], claims[j]) for i, j in residual_pairs],
+        use_cache=use_cache,
+    )
+    results.update(zip(residual_pairs, residual_results))
+    
     contradictions = []
     details = []
     all_relations = {}
-    
-    # So sánh từng cặp
-    for i in range(len(claims)):
-        for j in range(i + 1, len(claims)):
-            result = judge_claims(
-                claims[i], 
-                claims[j],
-                use_embedding=use_embedding,
-                use_cache=use_cache
-            )
-            
-            relation = result["relation"]
-            all_relations[(i, j)] = relation
-            
-            if relation == "CONTRADICTED":
-                contradictions.append((i, j))
-                details.append({
-                    "claim1_index": i,
-                    "claim2_index": j,
-                    "claim1": f"{claims[i].subject} - {claims[i].predicate}: {claims[i].object}",
-                    "claim2": f"{claims[j].subject} - {claims[j].predicate}: {claims[j].object}",
-                    "reasoning": result["reasoning"],
-                    "confidence": result["confidence"],
-                    "from_cache": result.get("from_cache", False)
-                })
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        result = results[(i, j)]
+        relation = result["relation"]
+        all_relations[(i, j)] = relation
+        
+        if relation == "CONTRADICTED":
+            contradictions.append((i, j))
+            details.append({
+                "claim1_index": i,
+                "claim2_index": j,
+                "claim1": f"{claims[i].subject} - {claims[i].predicate}: {claims[i].object}",
+                "claim2": f"{claims[j].subject} - {claims[j].predicate}: {claims[j].object}",
+                "reasoning": result["reasoning"],
+                "confidence": result["confidence"],
+                "from_cache": result.get("from_cache", False)
+            })
     
     return {
         "has_contradictions": len(contradictions) > 0,
@@ -401,6 +834,10 @@ def cluster_claims_by_semantic_similarity(
     """
     Cluster claims theo semantic similarity.
     
+    Claims được embed bằng judge backend (Gemini hoặc char n-gram local) rồi
+    thêm dần vào `ClusterIndex` (LSH + cosine chính xác), mỗi claim vào cluster
+    head gần nhất đạt ngưỡng thay vì quét mọi head.
+    
     Parameters
     ----------
     claims: List[AgriClaim]
@@ -415,49 +852,29 @@ def cluster_claims_by_semantic_similarity(
     if not claims:
         return []
     
-    embedding_model = _get_embedding_model()
-    clusters: List[List[AgriClaim]] = []
+    claim_values = [
+        f"{claim.subject} - {claim.predicate}: {claim.object or ''}" for claim in claims
+    ]
     
-    for claim in claims:
-        claim_value = f"{claim.subject} - {claim.predicate}: {claim.object or ''}"
-        
-        matched = False
-        for cluster in clusters:
-            # So sánh với claim đầu tiên trong cluster
-            cluster_value = f"{cluster[0].subject} - {cluster[0].predicate}: {cluster[0].object or ''}"
-            
-            # Kiểm tra giống nhau hoàn toàn
-            if claim_value.lower() == cluster_value.lower():
-                cluster.append(claim)
-                matched = True
-                break
-            
-            # Semantic similarity
-            if embedding_model:
-                similarity = _semantic_similarity_embedding(
-                    claim_value,
-                    cluster_value,
-                    embedding_model
-                )
-            else:
-                similarity = _simple_text_similarity(
-                    claim.object or "",
-                    cluster[0].object or ""
-                )
-            
-            if similarity >= similarity_threshold:
-                cluster.append(claim)
-                matched = True
-                break
-        
-        if not matched:
-            clusters.append([claim])
+    # Embed toàn bộ claims một lần (judge backend, qua cache nếu là Gemini)
+    # rồi gán cluster qua vector index (LSH + cosine chính xác)
+    vectors, _backend = _embed_texts(claim_values, claims=claims)
+    if vectors is None or not len(vectors):
+        return [[claim] for claim in claims]
     
+    index = ClusterIndex(dim=vectors.shape[1], threshold=similarity_threshold)
+    clusters: List[List[AgriClaim]] = []
+    for claim, cluster_id in zip(claims, index.add_many(vectors, [v.lower() for v in claim_values])):
+        if cluster_id == len(clusters):
+            clusters.append([])
+        clusters[cluster_id].append(claim)
     return clusters
 
 
 __all__ = [
     "judge_claims",
+    "judge_claim_pairs",
+    "estimate_judge_cost",
     "detect_contradictions_in_group",
     "cluster_claims_by_semantic_similarity",
 ]
@@ -16,8 +16,18 @@ from typing import Dict, Iterable, List, Optional, Tuple
 import math
 import re
 
+import numpy as np
+
 from src.models import AgriClaim
 from src.tools.filter import calculate_trust_score
+from src.utils.numeric_cluster import (
+    DEFAULT_NUMERIC_ABS_TOLERANCE,
+    DEFAULT_NUMERIC_TOLERANCE,
+    cluster_numeric_values,
+    numeric_abs_tolerance,
+    numeric_tolerance,
+)
+from src.utils.numeric_value import NumericValue
 
 
 CURRENT_YEAR_BOOST = 1.2
@@ -78,38 +88,6 @@ def _time_weight_for_claim(claim: AgriClaim) -> float:
     return OLDER_YEAR_FACTOR
 
 
-def _parse_numeric_value(value: str) -> Optional[float]:
-    """
-    Cố gắng trích xuất giá trị số đại diện từ chuỗi (VD: '8.5 tấn/ha', '95-100 ngày').
-    Ưu tiên:
-    - Nếu có khoảng a-b -> lấy trung bình (a+b)/2
-    - Nếu chỉ có một số -> lấy số đó
-    """
-    if not value:
-        return None
-
-    # Tìm tất cả số (hỗ trợ số thập phân với dấu . hoặc ,)
-    numbers = re.findall(r"\d+(?:[.,]\d+)?", value)
-    if not numbers:
-        return None
-
-    floats = []
-    for n in numbers:
-        try:
-            floats.append(float(n.replace(",", ".")))
-        except ValueError:
-            continue
-
-    if not floats:
-        return None
-
-    if len(floats) == 1:
-        return floats[0]
-
-    # Nếu có nhiều số, coi như khoảng và lấy trung bình
-    return sum(floats) / len(floats)
-
-
 def _cluster_text_values_simple(claims: List[AgriClaim]) -> List[List[AgriClaim]]:
     """
     Cluster text values đơn giản bằng exact matching (fallback).
@@ -135,43 +113,28 @@ def _cluster_text_values_simple(claims: List[AgriClaim]) -> List[List[AgriClaim]
     return clusters
 
 
-def _cluster_numeric_values(values: List[Tuple[AgriClaim, float]]) -> List[List[Tuple[AgriClaim, float]]]:
+def _cluster_numeric_values(
+    values: List[Tuple[AgriClaim, float]],
+    tolerance: float = DEFAULT_NUMERIC_TOLERANCE,
+    abs_tolerance: float = DEFAULT_NUMERIC_ABS_TOLERANCE,
+) -> List[List[Tuple[AgriClaim, float]]]:
     """
     Gom nhóm các claim có giá trị số xấp xỉ nhau.
 
-    values: List[(claim, numeric_value)]
-    Chiến lược đơn giản:
-    - Sắp xếp theo numeric_value
-    - Duyệt từ trái sang phải, nếu chênh lệch tương đối <= 5% với tâm cụm hiện tại thì vào cùng cụm,
-      ngược lại tạo cụm mới.
+    values: List[(claim, numeric_value)] (cùng đại lượng, đơn vị chuẩn)
+    Dùng `cluster_numeric_values` (NumPy, tuyến tính sau khi sắp xếp): mọi giá
+    trị trong cụm lệch không quá `tolerance` so với tâm cụm (hoặc `abs_tolerance`
+    với các giá trị quanh 0), chuỗi giá trị trôi dần bị tách thành nhiều cụm. Các cụm và phần tử theo thứ tự giá trị tăng dần.
     """
     if not values:
         return []
 
-    # Sắp xếp theo numeric_value
-    values_sorted = sorted(values, key=lambda x: x[1])
-
-    clusters: List[List[Tuple[AgriClaim, float]]] = []
-    current_cluster: List[Tuple[AgriClaim, float]] = [values_sorted[0]]
-    cluster_center = values_sorted[0][1]
+    nums = np.fromiter((v for _, v in values), dtype=np.float64, count=len(values))
+    labels, centroids = cluster_numeric_values(nums, tolerance=tolerance, abs_tolerance=abs_tolerance)
 
-    for claim, num in values_sorted[1:]:
-        # chênh lệch tương đối so với tâm cụm
-        if cluster_center == 0:
-            rel_diff = abs(num - cluster_center)
-        else:
-            rel_diff = abs(num - cluster_center) / abs(cluster_center)
-
-        if rel_diff <= 0.05:  # 5%
-            current_cluster.append((claim, num))
-            # cập nhật tâm cụm là trung bình
-            cluster_center = sum(v for _, v in current_cluster) / len(current_cluster)
-        else:
-            clusters.append(current_cluster)
-            current_cluster = [(claim, num)]
-            cluster_center = num
-
-    clusters.append(current_cluster)
+    clusters: List[List[Tuple[AgriClaim, float]]] = [[] for _ in range(len(centroids))]
+    for idx in np.argsort(nums, kind="stable").tolist():
+        clusters[labels[idx]].append(values[idx])
     return clusters
 
 
@@ -184,25 +147,26 @@ def resolve_claims_for_group(claims: Iterable[AgriClaim]) -> Optional[ResolvedCl
     if not claim_list:
         return None
 
-    # Tách các claim có giá trị số (để cluster)
-    numeric_items: List[Tuple[AgriClaim, float]] = []
+    # Tách các claim có giá trị số (để cluster), nhóm theo đại lượng/đơn vị
+    # (giá trị đã quy về đơn vị chuẩn, parse một lần và lưu trên claim)
+    numeric_items: Dict[str, List[Tuple[AgriClaim, float]]] = {}
     non_numeric_items: List[AgriClaim] = []
 
     for c in claim_list:
-        if c.object is None:
-            non_numeric_items.append(c)
-            continue
-        num = _parse_numeric_value(c.object)
-        if num is None:
+        parsed: Optional[NumericValue] = c.numeric_value()
+        if parsed is None:
             non_numeric_items.append(c)
         else:
-            numeric_items.append((c, num))
+            numeric_items.setdefault(parsed.unit_key, []).append((c, parsed.value))
 
     clusters_scores: List[Tuple[float, List[AgriClaim]]] = []
 
-    # 1) Xử lý cụm numeric
-    if numeric_items:
-        clusters = _cluster_numeric_values(numeric_items)
+    # 1) Xử lý cụm numeric: chỉ so sánh các giá trị cùng đại lượng,
+    #    sai số cho phép theo predicate/đại lượng (AGRI_NUMERIC_TOLERANCES)
+    for unit_key, unit_items in numeric_items.items():
+        tolerance = numeric_tolerance(claim_list[0].predicate, unit_key)
+        abs_tolerance = numeric_abs_tolerance(claim_list[0].predicate, unit_key)
+        clusters = _cluster_numeric_values(unit_items, tolerance=tolerance, abs_tolerance=abs_tolerance)
         for cluster in clusters:
             score = 0.0
             cluster_claims: List[AgriClaim] = []
@@ -244,12 +208,11 @@ def resolve_claims_for_group(claims: Iterable[AgriClaim]) -> Optional[ResolvedCl
     # Chọn gold_claim:
     # - Nếu cluster numeric: lấy claim có numeric_value gần trung bình nhất
     # - Nếu non-numeric: lấy claim có confidence cao nhất (tie-break: trust score)
-    if best_cluster_claims and _parse_numeric_value(best_cluster_claims[0].object or "") is not None:
-        # numeric cluster
+    if best_cluster_claims and best_cluster_claims[0].numeric_value() is not None:
+        # numeric cluster (các claim cùng đại lượng, giá trị theo đơn vị chuẩn)
         numeric_pairs = [
-            (c, _parse_numeric_value(c.object or ""))
+            (c, c.numeric_value().value)
             for c in best_cluster_claims
-            if _parse_numeric_value(c.object or "") is not None
         ]
         avg_val = sum(v for _, v in numeric_pairs) / len(numeric_pairs)
 
@@ -7,9 +7,11 @@ Hiện tại bao gồm:
 - AgriClaim: biểu diễn một khẳng định trích xuất từ văn bản nông nghiệp.
 """
 
-from typing import Optional
+from typing import Optional, Tuple
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from src.utils.numeric_value import NumericValue, parse_numeric_value
 
 
 class AgriClaim(BaseModel):
@@ -57,6 +59,18 @@ class AgriClaim(BaseModel):
         description="URL nơi claim được trích xuất (thêm cho downstream processing).",
     )
 
+    # Cache kết quả parse số của object: (object đã parse, kết quả). Không serialize.
+    _numeric: Optional[Tuple[Optional[str], Optional[NumericValue]]] = PrivateAttr(default=None)
+
+    def numeric_value(self) -> Optional[NumericValue]:
+        """
+        Giá trị số (đã quy về đơn vị chuẩn) của object, None nếu không có số.
+        Parse một lần rồi lưu trên claim; object đổi thì tự parse lại.
+        """
+        if self._numeric is None or self._numeric[0] != self.object:
+            self._numeric = (self.object, parse_numeric_value(self.object))
+        return self._numeric[1]
+
 
 __all__ = ["AgriClaim"]
 
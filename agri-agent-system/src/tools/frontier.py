@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+"""
+URL frontier: chọn URL nào được scrape/trích xuất trong giới hạn AGRI_MAX_URLS.
+
+Thay cho việc lọc trust score rồi cắt `final_urls[:3]` theo thứ tự search engine
+(URL .gov.vn ở vị trí 9 bị bỏ trong khi trang shop 0.5 điểm lại được scrape):
+- Điểm ưu tiên = trust score + chất lượng nội dung đã biết:
+  - URL đã trích xuất (claim store): có claim thì được cộng điểm (không tốn LLM),
+    không có claim nào thì bị trừ điểm;
+  - trang đã có trong page cache: text quá ngắn bị trừ điểm, text đủ dài được cộng.
+- URL chưa biết gì trong nhóm đầu frontier được prefetch song song bằng HEAD
+  (connection pool dùng chung, nên kết nối keep-alive được tái sử dụng khi
+  scrape): URL chết (404/410/5xx, lỗi kết nối) bị loại, nội dung không phải
+  HTML/PDF/text bị loại, trang quá nhỏ bị trừ điểm.
+- Đa dạng domain: chọn lần lượt URL điểm cao nhất; mỗi URL đã chọn cùng host
+  làm các URL còn lại của host đó bị trừ điểm, và mỗi host có số URL tối đa.
+
+Cấu hình qua biến môi trường:
+- AGRI_FRONTIER_PREFETCH: số URL đầu frontier được prefetch (mặc định 2×số URL cần, 0 = tắt)
+- AGRI_FRONTIER_PREFETCH_TIMEOUT: thời gian tối đa (giây) cho lượt prefetch (mặc định 5)
+- AGRI_FRONTIER_MAX_PER_HOST: số URL tối đa trên cùng một host (mặc định 1)
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from src.tools.http_pool import get_http_pool
+from src.tools.page_cache import get_page_cache
+from src.tools.scraper import DEFAULT_HEADERS, _normalize_url
+from src.tools.search import SearchHit
+from src.utils.claim_store import get_claim_store
+
+
+# Trust score tối thiểu (DuckDuckGo thường trả về domain 0.5 điểm nên ngưỡng thấp)
+MIN_TRUST_SCORE = 0.3
+# Điểm trừ cho mỗi URL đã chọn cùng host
+DOMAIN_DIVERSITY_PENALTY = 0.15
+# Text đã extract (ký tự) ngắn hơn ngưỡng này coi như trang rỗng/menu
+MIN_USEFUL_TEXT_CHARS = 500
+# Text đủ dài để có khả năng chứa số liệu
+GOOD_TEXT_CHARS = 3000
+# Content-Length (byte) nhỏ hơn ngưỡng này thường là trang lỗi/redirect
+MIN_CONTENT_LENGTH = 2048
+# Status coi như URL chết (405/501 = server không hỗ trợ HEAD, vẫn giữ lại)
+DEAD_STATUSES = {404, 410}
+ACCEPTED_CONTENT_TYPES = ("text/html", "application/xhtml", "application/pdf", "text/plain")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float, fallback về default nếu không hợp lệ."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class FrontierCandidate:
+    """Một URL ứng viên trong frontier, kèm các tín hiệu dùng để chấm điểm."""
+
+    url: str
+    trust_score: float
+    host: str
+    order: int  # Thứ hạng sau fan-out search (hòa điểm thì giữ thứ tự này)
+    known_claims: Optional[int] = None  # Số claim đã lưu nếu URL đã được trích xuất
+    cached_chars: Optional[int] = None  # Độ dài text trong page cache
+    prefetch: Optional[str] = None  # "ok" | "small" | "dead" | "type" | "error" | "timeout"
+    status: Optional[int] = None
+    content_type: Optional[str] = None
+    quality: float = 0.0
+
+    @property
+    def score(self) -> float:
+        return self.trust_score + self.quality
+
+    @property
+    def rejected(self) -> bool:
+        return self.prefetch in ("dead", "type")
+
+    def needs_prefetch(self) -> bool:
+        return self.known_claims is None and self.cached_chars is None
+
+    def debug(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "trust_score": self.trust_score,
+            "score": round(self.score, 3),
+            "known_claims": self.known_claims,
+            "cached_chars": self.cached_chars,
+            "prefetch": self.prefetch,
+            "status": self.status,
+        }
+
+
+@dataclass
+class FrontierResult:
+    """URL đã chọn (theo thứ tự xử lý) và thông tin debug của frontier."""
+
+    urls: List[str] = field(default_factory=list)
+    candidates: List[FrontierCandidate] = field(default_factory=list)  # Theo điểm giảm dần
+    prefetched: int = 0
+    prefetch_elapsed: float = 0.0
+
+    @property
+    def rejected(self) -> List[str]:
+        return [c.url for c in self.candidates if c.rejected]
+
+
+def _host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _content_quality(candidate: FrontierCandidate) -> float:
+    """Điểm cộng/trừ theo claim store và page cache."""
+    if candidate.known_claims is not None:
+        # Đã trích xuất: có claim thì dùng lại miễn phí, không có claim thì khó có lần sau
+        return 0.3 if candidate.known_claims > 0 else -0.4
+    if candidate.cached_chars is not None:
+        if candidate.cached_chars < MIN_USEFUL_TEXT_CHARS:
+            return -0.3
+        if candidate.cached_chars >= GOOD_TEXT_CHARS:
+            return 0.1
+    return 0.0
+
+
+def _annotate_from_stores(candidates: List[FrontierCandidate]) -> None:
+    """Gắn số claim đã lưu và độ dài text đã cache; lỗi store chỉ làm mất tín hiệu."""
+    urls = [c.url for c in candidates]
+    try:
+        store = get_claim_store()
+        known = store.known_sources(urls)
+        claims = store.claims_for_sources(sorted(known)) if known else {}
+        for candidate in candidates:
+            if candidate.url in known:
+                candidate.known_claims = len(claims.get(candidate.url, []))
+    except Exception:
+        pass
+    try:
+        lengths = get_page_cache().text_lengths(urls)
+        for candidate in candidates:
+            if candidate.url in lengths:
+                candidate.cached_chars = lengths[candidate.url]
+    except Exception:
+        pass
+
+
+def _head(url: str, timeout: float) -> tuple:
+    """HEAD request qua connection pool, trả về (status, headers)."""
+    resp = get_http_pool().request(_normalize_url(url), method="HEAD", headers=DEFAULT_HEADERS, timeout=timeout)
+    return resp.status, resp.headers
+
+
+def _apply_prefetch(candidate: FrontierCandidate, status: int, headers: Dict[str, str]) -> None:
+    candidate.status = status
+    candidate.content_type = (headers.get("content-type") or "").split(";", 1)[0].strip().lower()
+    if status in DEAD_STATUSES or (status >= 500 and status != 501):
+        candidate.prefetch = "dead"
+    elif status < 400 and candidate.content_type and not candidate.content_type.startswith(ACCEPTED_CONTENT_TYPES):
+        candidate.prefetch = "type"
+    else:
+        try:
+            length = int(headers.get("content-length", ""))
+        except ValueError:
+            length = None
+        small = status < 400 and length is not None and length < MIN_CONTENT_LENGTH
+        candidate.prefetch = "small" if small else "ok"
+        if small:
+            candidate.quality -= 0.2
+
+
+def prefetch_candidates(candidates: Sequence[FrontierCandidate], timeout: float) -> float:
+    """
+    HEAD song song các URL ứng viên, ghi kết quả lên từng candidate.
+
+    Không chờ request quá `timeout` giây (candidate đó được đánh dấu "timeout"
+    và giữ nguyên điểm). Trả về thời gian đã dùng (giây).
+    """
+    start = time.monotonic()
+    if not candidates:
+        return 0.0
+    executor = ThreadPoolExecutor(max_workers=min(8, len(candidates)), thread_name_prefix="agri-prefetch")
+    try:
+        futures = {executor.submit(_head, c.url, timeout): c for c in candidates}
+        done, pending = wait(futures, timeout=timeout)
+        for future in done:
+            candidate = futures[future]
+            try:
+                status, headers = future.result()
+            except Exception:
+                # Lỗi DNS/kết nối/TLS: scraper gần như chắc chắn cũng lỗi
+                candidate.prefetch = "error"
+                candidate.quality -= 0.5
+                continue
+            _apply_prefetch(candidate, status, headers)
+        for future in pending:
+            futures[future].prefetch = "timeout"
+    finally:
+        # Không chờ các request chậm (chúng tự kết thúc theo timeout của pool)
+        executor.shutdown(wait=False, cancel_futures=True)
+    return time.monotonic() - start
+
+
+def _select_diverse(candidates: List[FrontierCandidate], limit: int, max_per_host: int) -> List[FrontierCandidate]:
+    """Chọn tham lam URL điểm cao nhất, trừ điểm theo số URL đã chọn cùng host."""
+    selected: List[FrontierCandidate] = []
+    per_host: Dict[str, int] = {}
+    remaining = list(candidates)
+    while remaining and len(selected) < limit:
+        best = None
+        best_key = None
+        for candidate in remaining:
+            used = per_host.get(candidate.host, 0)
+            if max_per_host > 0 and used >= max_per_host:
+                continue
+            key = (-(candidate.score - DOMAIN_DIVERSITY_PENALTY * used), candidate.order)
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        if best is None:
+            break
+        selected.append(best)
+        remaining.remove(best)
+        per_host[best.host] = per_host.get(best.host, 0) + 1
+    return selected
+
+
+def rank_frontier(
+    hits: Sequence[SearchHit],
+    limit: int,
+    *,
+    prefetch: Optional[int] = None,
+    prefetch_timeout: Optional[float] = None,
+    max_per_host: Optional[int] = None,
+    min_trust: float = MIN_TRUST_SCORE,
+) -> FrontierResult:
+    """
+    Xếp hạng URL từ fan-out search và chọn tối đa `limit` URL để trích xuất.
+
+    Parameters
+    ----------
+    hits: Sequence[SearchHit]
+        URL đã khử trùng lặp (thứ tự của `SearchOutcome.hits`).
+    limit: int
+        Số URL cần chọn (AGRI_MAX_URLS).
+    prefetch: int
+        Số URL đầu frontier được HEAD trước (mặc định AGRI_FRONTIER_PREFETCH,
+        hoặc 2×limit); 0 = không prefetch.
+    prefetch_timeout: float
+        Thời gian tối đa cho lượt prefetch (mặc định AGRI_FRONTIER_PREFETCH_TIMEOUT).
+    max_per_host: int
+        Số URL tối đa trên một host (mặc định AGRI_FRONTIER_MAX_PER_HOST); 0 = không giới hạn.
+        Nếu không đủ URL, phần còn thiếu được lấy từ các host đã chọn.
+    min_trust: float
+        Trust score tối thiểu; nếu không URL nào đạt thì dùng toàn bộ.
+
+    Returns
+    -------
+    FrontierResult
+        `urls` theo thứ tự ưu tiên xử lý.
+    """
+    result = FrontierResult()
+    limit = max(limit, 0)
+    if not hits or limit == 0:
+        return result
+
+    eligible = [h for h in hits if h.trust_score >= min_trust] or list(hits)
+    candidates = [
+        FrontierCandidate(url=h.url, trust_score=h.trust_score, host=_host(h.url), order=i)
+        for i, h in enumerate(eligible)
+    ]
+    _annotate_from_stores(candidates)
+    for candidate in candidates:
+        candidate.quality = _content_quality(candidate)
+
+    prefetch = _env_int("AGRI_FRONTIER_PREFETCH", 2 * limit) if prefetch is None else prefetch
+    if prefetch > 0:
+        timeout = (
+            _env_float("AGRI_FRONTIER_PREFETCH_TIMEOUT", 5.0) if prefetch_timeout is None else prefetch_timeout
+        )
+        # Prefetch theo thứ tự điểm hiện tại; URL đã có trong store/cache không cần
+        by_score = sorted(candidates, key=lambda c: (-c.score, c.order))
+        targets = [c for c in by_score if c.needs_prefetch()][:prefetch]
+        result.prefetch_elapsed = round(prefetch_candidates(targets, timeout), 2)
+        result.prefetched = len(targets)
+
+    ranked = sorted(candidates, key=lambda c: (-c.score, c.order))
+    result.candidates = ranked
+    usable = [c for c in ranked if not c.rejected]
+
+    max_per_host = _env_int("AGRI_FRONTIER_MAX_PER_HOST", 1) if max_per_host is None else max_per_host
+    selected = _select_diverse(usable, limit, max_per_host)
+    if len(selected) < limit:
+        # Không đủ host khác nhau: lấy thêm từ các host đã chọn
+        rest = [c for c in usable if c not in selected]
+        selected.extend(_select_diverse(rest, limit - len(selected), 0))
+    result.urls = [c.url for c in selected]
+    return result
+
+
+__all__ = [
+    "FrontierCandidate",
+    "FrontierResult",
+    "MIN_TRUST_SCORE",
+    "prefetch_candidates",
+    "rank_frontier",
+]
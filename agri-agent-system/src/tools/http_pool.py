@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+"""
+HTTP connection pool dùng chung cho scraper.
+
+Mục tiêu:
+- Giữ kết nối keep-alive theo từng host để không phải bắt tay TCP/TLS lại
+  cho mỗi URL (urlopen mở kết nối mới mỗi lần gọi).
+- Giới hạn số request đồng thời trên mỗi host (lịch sự với web nông nghiệp nhỏ).
+- Tự xử lý redirect và giải nén gzip/deflate.
+
+Chỉ dùng `http.client` trong stdlib để tránh phụ thuộc thêm thư viện HTTP.
+"""
+
+import http.client
+import ssl
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import quote, urljoin, urlsplit
+
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Lỗi xảy ra khi server đã đóng kết nối keep-alive mà ta chưa biết
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+_HostKey = Tuple[str, str, int]
+
+
+@dataclass
+class HttpResponse:
+    """Response đã đọc toàn bộ body (bytes đã giải nén)."""
+
+    url: str  # URL cuối cùng sau khi theo redirect
+    status: int
+    reason: str
+    headers: Dict[str, str] = field(default_factory=dict)  # key viết thường
+    body: bytes = b""
+
+    def raise_for_status(self) -> None:
+        """Raise HTTPError (giống urlopen) nếu status >= 400."""
+        if self.status >= 400:
+            raise HTTPError(self.url, self.status, self.reason, None, None)
+
+
+def _decompress(body: bytes, content_encoding: str) -> bytes:
+    """Giải nén body theo Content-Encoding (gzip/deflate)."""
+    encoding = (content_encoding or "").strip().lower()
+    if not body or encoding in ("", "identity"):
+        return body
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        if encoding == "deflate":
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except zlib.error:
+        return body
+    return body
+
+
+class HttpConnectionPool:
+    """
+    Pool kết nối HTTP/HTTPS keep-alive, thread-safe.
+
+    - max_per_host: số request đồng thời tối đa trên mỗi host
+    - max_idle_per_host: số kết nối nhàn rỗi giữ lại cho mỗi host
+    - max_redirects: số lần redirect tối đa cho một request
+    """
+
+    def __init__(
+        self,
+        max_per_host: int = 4,
+        max_idle_per_host: int = 4,
+        timeout: float = 20.0,
+        max_redirects: int = 5,
+    ) -> None:
+        self.max_per_host = max(1, max_per_host)
+        self.max_idle_per_host = max(0, max_idle_per_host)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._lock = threading.Lock()
+        self._idle: Dict[_HostKey, List[http.client.HTTPConnection]] = {}
+        self._host_slots: Dict[_HostKey, threading.BoundedSemaphore] = {}
+        self._ssl_context = ssl.create_default_context()
+
+    @staticmethod
+    def _host_key(url: str) -> _HostKey:
+        parts = urlsplit(url)
+        scheme = (parts.scheme or "https").lower()
+        host = (parts.hostname or "").lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, host, port
+
+    def _slot(self, key: _HostKey) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._host_slots[key] = slot
+            return slot
+
+    def _checkout(self, key: _HostKey, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """Lấy kết nối nhàn rỗi nếu có, ngược lại tạo mới. Trả về (conn, reused)."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _checkin(self, key: _HostKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send_once(
+        self,
+        url: str,
+        method: str,
+        headers: Dict[str, str],
+        timeout: float,
+    ) -> HttpResponse:
+        """Gửi một request (không theo redirect) trên kết nối của pool."""
+        key = self._host_key(url)
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        request_headers = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        request_headers.update(headers)
+
+        with self._slot(key):
+            for attempt in range(2):
+                conn, reused = self._checkout(key, timeout)
+                try:
+                    conn.request(method, path, headers=request_headers)
+                    resp = conn.getresponse()
+                    raw = resp.read()
+                except _STALE_CONNECTION_ERRORS:
+                    conn.close()
+                    # Kết nối keep-alive cũ đã bị server đóng: thử lại một lần với kết nối mới
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+
+                resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._checkin(key, conn)
+
+                body = raw if method == "HEAD" else _decompress(raw, resp_headers.get("content-encoding", ""))
+                return HttpResponse(
+                    url=url,
+                    status=resp.status,
+                    reason=resp.reason,
+                    headers=resp_headers,
+                    body=body,
+                )
+        raise RuntimeError(f"Không thể gửi request tới {url}")  # pragma: no cover
+
+    def request(
+        self,
+        url: str,
+        method: str = "GET",
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> HttpResponse:
+        """
+        Gửi request và tự theo redirect.
+
+        Parameters
+        ----------
+        url: str
+            URL đã chuẩn hóa (ASCII).
+        method: str
+            GET hoặc HEAD.
+        headers: Dict[str, str]
+            Header bổ sung (User-Agent, If-None-Match, ...).
+        timeout: float
+            Timeout cho mỗi lần kết nối/đọc (giây).
+
+        Returns
+        -------
+        HttpResponse
+            Response cuối cùng; không raise khi status >= 400
+            (dùng `raise_for_status()` nếu cần).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        headers = dict(headers or {})
+        current_url = url
+        current_method = method.upper()
+
+        for _ in range(self.max_redirects + 1):
+            resp = self._send_once(current_url, current_method, headers, timeout)
+            location = resp.headers.get("location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                return resp
+            # Location có thể chứa ký tự Unicode chưa mã hóa (web Việt Nam hay gặp)
+            current_url = urljoin(current_url, quote(location, safe=":/?#[]@!$&'()*+,;=%"))
+            # 303 See Other: request tiếp theo luôn là GET
+            if resp.status == 303 and current_method != "HEAD":
+                current_method = "GET"
+
+        raise HTTPError(current_url, 310, "Too many redirects", None, None)
+
+    def close(self) -> None:
+        """Đóng toàn bộ kết nối nhàn rỗi."""
+        with self._lock:
+            idle_lists = list(self._idle.values())
+            self._idle.clear()
+        for conns in idle_lists:
+            for conn in conns:
+                conn.close()
+
+
+_global_pool: Optional[HttpConnectionPool] = None
+_global_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HttpConnectionPool:
+    """Lấy HTTP connection pool dùng chung cho toàn process."""
+    global _global_pool
+    if _global_pool is None:
+        with _global_pool_lock:
+            if _global_pool is None:
+                _global_pool = HttpConnectionPool()
+    return _global_pool
+
+
+__all__ = [
+    "HttpResponse",
+    "HttpConnectionPool",
+    "get_http_pool",
+]
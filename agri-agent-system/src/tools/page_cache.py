@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+"""
+Page cache on-disk cho scraper.
+
+Thiết kế:
+- Index SQLite (`data/page_cache/index.sqlite3`) keyed theo URL đã chuẩn hóa:
+  encoding đã phát hiện, text đã extract, ETag/Last-Modified, thời điểm fetch/truy cập.
+- Raw bytes lưu theo kiểu content-addressed (`blobs/<sha256>`): nhiều URL trùng
+  nội dung chỉ tốn một file.
+- TTL: entry còn "fresh" thì trả về ngay (không network, không trafilatura);
+  hết TTL thì revalidate bằng conditional GET (If-None-Match / If-Modified-Since).
+- Giới hạn dung lượng: vượt `max_bytes` thì xóa entry ít được truy cập nhất (LRU).
+
+Cấu hình qua biến môi trường:
+- AGRI_PAGE_CACHE_TTL: số giây một trang được coi là fresh (mặc định 7 ngày)
+- AGRI_PAGE_CACHE_MAX_MB: dung lượng raw bytes tối đa (mặc định 256 MB)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+PAGE_CACHE_DIR = DATA_DIR / "page_cache"
+
+# Tham số tracking không ảnh hưởng nội dung trang
+_TRACKING_PARAMS = {"fbclid", "gclid", "zarsrc", "utm_zaloapp"}
+
+
+def normalize_cache_key(url: str) -> str:
+    """
+    Chuẩn hóa URL làm cache key:
+    - scheme/host viết thường, bỏ port mặc định
+    - bỏ fragment (#...) và tham số tracking (utm_*, fbclid, ...)
+    - sắp xếp query params để thứ tự không ảnh hưởng key
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query_items = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    ]
+    query = urlencode(sorted(query_items))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+@dataclass
+class CachedPage:
+    """Một entry trong page cache."""
+
+    url: str
+    content_hash: str
+    encoding: str
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    body: bytes = b""
+
+    def is_fresh(self, ttl: float) -> bool:
+        """Entry còn trong TTL (không cần revalidate)."""
+        return (time.time() - self.fetched_at) < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Header cho conditional GET dựa trên ETag/Last-Modified đã lưu."""
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def decode_html(self) -> str:
+        """Decode lại raw bytes bằng encoding đã phát hiện (không chạy charset_normalizer)."""
+        try:
+            return self.body.decode(self.encoding or "utf-8", errors="replace")
+        except LookupError:
+            return self.body.decode("utf-8", errors="replace")
+
+
+class PageCache(SQLiteStore):
+    """
+    Page cache content-addressed trên đĩa, an toàn cho nhiều thread/process.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS pages (
+            url_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            encoding TEXT,
+            text TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages(last_access)",
+        "CREATE INDEX IF NOT EXISTS idx_pages_content_hash ON pages(content_hash)",
+    )
+
+    def __init__(
+        self,
+        cache_dir: Path = PAGE_CACHE_DIR,
+        ttl: float = 7 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        super().__init__(self.cache_dir / "index.sqlite3")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "revalidated": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    # ------------------------------------------------------------------ blobs
+    def _blob_path(self, content_hash: str) -> Path:
+        return self.blob_dir / content_hash[:2] / content_hash
+
+    def _write_blob(self, content_hash: str, body: bytes) -> None:
+        path = self._blob_path(content_hash)
+        if path.exists():
+            return  # content-addressed: nội dung giống nhau đã có sẵn
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def _remove_blob(self, content_hash: str) -> None:
+        try:
+            self._blob_path(content_hash).unlink()
+        except OSError:
+            pass
+
+    def _read_blob(self, content_hash: str) -> Optional[bytes]:
+        try:
+            return self._blob_path(content_hash).read_bytes()
+        except OSError:
+            return None
+
+    # ---------------------------------------------------------------- counters
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Thống kê cache: hits/misses/stale/revalidated/stores/evictions của process
+        hiện tại, cộng số entry và tổng dung lượng trên đĩa.
+        """
+        with self._stats_lock:
+            data: Dict[str, float] = dict(self._stats)
+        row = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        data["entries"] = row[0]
+        data["total_bytes"] = row[1]
+        lookups = data["hits"] + data["misses"] + data["stale"]
+        data["hit_rate"] = (data["hits"] + data["revalidated"]) / lookups if lookups else 0.0
+        return data
+
+    # ------------------------------------------------------------------ lookup
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Lấy entry theo URL (đã chuẩn hóa). Cập nhật last_access cho LRU.
+
+        Trả về None nếu chưa có hoặc blob đã mất.
+        """
+        key = normalize_cache_key(url)
+        row = self.conn.execute(
+            "SELECT url, content_hash, encoding, text, etag, last_modified, fetched_at "
+            "FROM pages WHERE url_key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+
+        body = self._read_blob(row[1])
+        if body is None:
+            with self.conn:
+                self.conn.execute("DELETE FROM pages WHERE url_key = ?", (key,))
+            self._count("misses")
+            return None
+
+        with self.conn:
+            self.conn.execute("UPDATE pages SET last_access = ? WHERE url_key = ?", (time.time(), key))
+
+        page = CachedPage(
+            url=row[0],
+            content_hash=row[1],
+            encoding=row[2] or "utf-8",
+            text=row[3] or "",
+            etag=row[4],
+            last_modified=row[5],
+            fetched_at=row[6],
+            body=body,
+        )
+        self._count("hits" if page.is_fresh(self.ttl) else "stale")
+        return page
+
+    def text_lengths(self, urls: Sequence[str]) -> Dict[str, int]:
+        """
+        Độ dài text đã extract của các URL (trong `urls`) đang có trong cache.
+
+        Chỉ đọc index: không đọc blob, không cập nhật LRU/thống kê (dùng để
+        xếp hạng URL trước khi scrape).
+        """
+        keys = {normalize_cache_key(u): u for u in urls}
+        lengths: Dict[str, int] = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):
+            batch = key_list[start:start + 500]
+            rows = self.conn.execute(
+                "SELECT url_key, LENGTH(COALESCE(text, '')) FROM pages "
+                f"WHERE url_key IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            for url_key, length in rows:
+                lengths[keys[url_key]] = length
+        return lengths
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        encoding: str,
+        text: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedPage:
+        """
+        Lưu (hoặc thay thế) entry cho URL rồi evict nếu vượt dung lượng.
+
+        Khi thay thế, blob cũ của URL bị xóa nếu không còn URL nào khác trỏ tới.
+        """
+        key = normalize_cache_key(url)
+        content_hash = hashlib.sha256(body).hexdigest()
+        self._write_blob(content_hash, body)
+        now = time.time()
+        orphaned = None
+        with self.conn:
+            previous = self.conn.execute(
+                "SELECT content_hash FROM pages WHERE url_key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(url_key, url, content_hash, size, encoding, text, etag, last_modified, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, content_hash, len(body), encoding, text, etag, last_modified, now, now),
+            )
+            if previous is not None and previous[0] != content_hash:
+                still_used = self.conn.execute(
+                    "SELECT 1 FROM pages WHERE content_hash = ? LIMIT 1", (previous[0],)
+                ).fetchone()
+                if not still_used:
+                    orphaned = previous[0]
+        if orphaned is not None:
+            self._remove_blob(orphaned)
+        self._count("stores")
+        self._evict_if_needed()
+        return CachedPage(
+            url=url,
+            content_hash=content_hash,
+            encoding=encoding,
+            text=text,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=now,
+            body=body,
+        )
+
+    def mark_revalidated(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Server trả 304 Not Modified: gia hạn TTL, cập nhật validator nếu có."""
+        key = normalize_cache_key(url)
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pages SET fetched_at = ?, last_access = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE url_key = ?",
+                (now, now, etag, last_modified, key),
+            )
+        self._count("revalidated")
+
+    # ---------------------------------------------------------------- eviction
+    def _evict_if_needed(self) -> None:
+        """Xóa entry ít được truy cập nhất cho đến khi tổng dung lượng <= max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted_hashes = []
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT url_key, content_hash, size FROM pages ORDER BY last_access ASC"
+            ).fetchall()
+            for url_key, content_hash, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM pages WHERE url_key = ?", (url_key,))
+                total -= size
+                evicted_hashes.append(content_hash)
+
+        for content_hash in set(evicted_hashes):
+            # Chỉ xóa blob khi không còn URL nào trỏ tới nội dung này
+            still_used = self.conn.execute(
+                "SELECT 1 FROM pages WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+            if not still_used:
+                self._remove_blob(content_hash)
+        self._count("evictions", len(evicted_hashes))
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache."""
+        with self.conn:
+            hashes = [r[0] for r in self.conn.execute("SELECT DISTINCT content_hash FROM pages")]
+            self.conn.execute("DELETE FROM pages")
+        for content_hash in hashes:
+            self._remove_blob(content_hash)
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float, fallback về default nếu không hợp lệ."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_page_cache: Optional[PageCache] = None
+_global_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Lấy page cache dùng chung cho toàn process."""
+    global _global_page_cache
+    if _global_page_cache is None:
+        with _global_page_cache_lock:
+            if _global_page_cache is None:
+                _global_page_cache = PageCache(
+                    ttl=_env_float("AGRI_PAGE_CACHE_TTL", 7 * 24 * 3600),
+                    max_bytes=int(_env_float("AGRI_PAGE_CACHE_MAX_MB", 256) * 1024 * 1024),
+                )
+    return _global_page_cache
+
+
+__all__ = [
+    "CachedPage",
+    "PageCache",
+    "get_page_cache",
+    "normalize_cache_key",
+]
@@ -7,17 +7,26 @@ Yêu cầu chính:
 - Sử dụng `trafilatura` để lấy main text sạch.
 - Dùng `charset_normalizer` để tự động phát hiện và decode các bảng mã cũ
   (Windows-1258, VNI, ...) thường gặp ở web nông nghiệp Việt Nam.
+- `scrape_many`: scrape song song nhiều URL bằng asyncio trên HTTP connection
+  pool dùng chung (keep-alive, giới hạn theo host), trả kết quả ngay khi xong.
+- Page cache on-disk (`page_cache.py`): trang còn fresh không cần network hay
+  trafilatura; trang hết TTL được revalidate bằng conditional GET.
 """
 
+import asyncio
+import queue
+import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional
 from urllib.parse import quote, urlsplit, urlunsplit
-from urllib.request import Request, urlopen
 
 from bs4 import BeautifulSoup
 from charset_normalizer import from_bytes
 import trafilatura
 
+from src.tools.http_pool import get_http_pool
+from src.tools.page_cache import CachedPage, PageCache, get_page_cache
+
 
 DEFAULT_HEADERS = {
     "User-Agent": (
@@ -35,6 +44,7 @@ class ScrapeResult:
     encoding: str
     raw_html: str
     text: str
+    error: Optional[str] = None
 
 
 def _normalize_url(url: str) -> str:
@@ -53,16 +63,47 @@ def _normalize_url(url: str) -> str:
     return urlunsplit((parts.scheme or "https", parts.netloc, path, query, parts.fragment))
 
 
-def fetch_raw_bytes(url: str, timeout: int = 20) -> bytes:
+def _get_cache(use_cache: bool) -> Optional[PageCache]:
+    """Lấy page cache nếu được bật (lỗi mở cache không làm hỏng scraping)."""
+    if not use_cache:
+        return None
+    try:
+        return get_page_cache()
+    except Exception:
+        return None
+
+
+def _cache_lookup(cache: Optional[PageCache], url: str) -> Optional[CachedPage]:
+    """Tra cache, bỏ qua lỗi SQLite/đĩa."""
+    if cache is None:
+        return None
+    try:
+        return cache.get(url)
+    except Exception:
+        return None
+
+
+def fetch_raw_bytes(url: str, timeout: int = 20, use_cache: bool = True) -> bytes:
     """
     Tải nội dung từ URL dưới dạng bytes (chưa decode).
 
-    Sử dụng urllib trong stdlib để tránh phụ thuộc thêm thư viện HTTP.
+    Dùng HTTP connection pool (stdlib `http.client`) để tái sử dụng kết nối
+    keep-alive giữa các lần gọi cùng host. Nếu page cache có bản còn fresh
+    thì trả về ngay, không gọi network.
+
+    Chỉ đọc cache, không ghi: entry cache cần text đã extract (trafilatura),
+    mà hàm này không decode/extract. Ghi entry thiếu text thì
+    `scrape_clean_text` sẽ trả text rỗng cho trang đó đến hết TTL.
     """
+    cache = _get_cache(use_cache)
+    cached = _cache_lookup(cache, url)
+    if cached is not None and cached.is_fresh(cache.ttl):
+        return cached.body
+
     normalized = _normalize_url(url)
-    req = Request(normalized, headers=DEFAULT_HEADERS)
-    with urlopen(req, timeout=timeout) as resp:  # type: ignore[union-attr]
-        return resp.read()
+    resp = get_http_pool().request(normalized, headers=DEFAULT_HEADERS, timeout=timeout)
+    resp.raise_for_status()
+    return resp.body
 
 
 def decode_with_charset_normalizer(data: bytes) -> tuple[str, str]:
@@ -122,42 +163,172 @@ def extract_main_text(html: str, url: Optional[str] = None) -> str:
         return ""
 
 
-def scrape_clean_text(url: str, timeout: int = 20) -> ScrapeResult:
+def _result_from_cache(url: str, cached: CachedPage) -> ScrapeResult:
+    """Dựng ScrapeResult từ cache (không chạy lại charset_normalizer/trafilatura)."""
+    return ScrapeResult(
+        url=url,
+        encoding=cached.encoding,
+        raw_html=cached.decode_html(),
+        text=cached.text,
+    )
+
+
+def scrape_clean_text(url: str, timeout: int = 20, use_cache: bool = True) -> ScrapeResult:
     """
     Pipeline đầy đủ:
-    1) Thử dùng trafilatura.fetch_url (có sẵn logic HTTP & decode).
-    2) Nếu thất bại, fallback:
-       - Download HTML (bytes)
-       - Phát hiện encoding bằng charset_normalizer
-       - Decode sang Unicode
-    3) Extract main text bằng trafilatura (có fallback BeautifulSoup)
+    0) Tra page cache: bản còn fresh -> trả về ngay (không network, không trafilatura).
+    1) Download HTML (bytes) qua connection pool, kèm conditional GET
+       (If-None-Match / If-Modified-Since) nếu cache có bản cũ; 304 -> dùng bản cũ.
+    2) Phát hiện encoding bằng charset_normalizer và decode sang Unicode.
+    3) Extract main text bằng trafilatura (có fallback BeautifulSoup), lưu vào cache.
+    Nếu download thất bại: dùng bản cũ trong cache (nếu có), cuối cùng fallback
+    sang trafilatura.fetch_url.
     """
-    html: str
-    encoding: str = "utf-8"
+    cache = _get_cache(use_cache)
+    cached = _cache_lookup(cache, url)
+    if cached is not None and cached.is_fresh(cache.ttl):
+        return _result_from_cache(url, cached)
+
+    headers = dict(DEFAULT_HEADERS)
+    if cached is not None:
+        headers.update(cached.conditional_headers())
 
-    # Bước 1: ưu tiên fetch_url của trafilatura (đã xử lý khá tốt redirect, encoding...)
     try:
-        downloaded = trafilatura.fetch_url(url)
+        resp = get_http_pool().request(_normalize_url(url), headers=headers, timeout=timeout)
+        if resp.status == 304 and cached is not None:
+            cache.mark_revalidated(url, resp.headers.get("etag"), resp.headers.get("last-modified"))
+            return _result_from_cache(url, cached)
+        resp.raise_for_status()
     except Exception:
-        downloaded = None
-
-    if downloaded:
-        # fetch_url trả về string HTML đã decode
-        html = downloaded
-    else:
-        # Bước 2: fallback sang urllib + charset_normalizer
-        raw_bytes = fetch_raw_bytes(url, timeout=timeout)
-        encoding, html = decode_with_charset_normalizer(raw_bytes)
-
+        if cached is not None:
+            # Bản cũ vẫn tốt hơn không có gì
+            return _result_from_cache(url, cached)
+
+        # Fallback cuối: trafilatura.fetch_url (đã xử lý khá tốt redirect, encoding...)
+        try:
+            downloaded = trafilatura.fetch_url(url)
+        except Exception:
+            downloaded = None
+        if not downloaded:
+            raise
+        text = extract_main_text(downloaded, url=url)
+        if cache is not None:
+            try:
+                cache.put(url, downloaded.encode("utf-8"), "utf-8", text)
+            except Exception:
+                pass
+        return ScrapeResult(url=url, encoding="utf-8", raw_html=downloaded, text=text)
+
+    encoding, html = decode_with_charset_normalizer(resp.body)
     text = extract_main_text(html, url=url)
+    if cache is not None:
+        try:
+            cache.put(
+                url,
+                resp.body,
+                encoding,
+                text,
+                etag=resp.headers.get("etag"),
+                last_modified=resp.headers.get("last-modified"),
+            )
+        except Exception:
+            pass  # Bỏ qua lỗi cache
     return ScrapeResult(url=url, encoding=encoding, raw_html=html, text=text)
 
 
+async def scrape_many(
+    urls: Iterable[str],
+    *,
+    max_concurrency: int = 16,
+    per_host_limit: Optional[int] = None,
+    timeout: int = 20,
+    use_cache: bool = True,
+) -> AsyncIterator[ScrapeResult]:
+    """
+    Scrape song song nhiều URL, yield từng ScrapeResult ngay khi trang đó xong.
+
+    Parameters
+    ----------
+    urls: Iterable[str]
+        Danh sách URL (trùng lặp sẽ bị bỏ qua).
+    max_concurrency: int
+        Số trang được xử lý đồng thời tối đa.
+    per_host_limit: int
+        Số request đồng thời tối đa trên mỗi host (mặc định theo pool).
+    timeout: int
+        Timeout cho mỗi request (giây).
+    use_cache: bool
+        Dùng page cache on-disk (mặc định True).
+
+    Yields
+    ------
+    ScrapeResult
+        Theo thứ tự hoàn thành. Nếu lỗi, `text` rỗng và `error` chứa thông báo lỗi.
+    """
+    unique_urls = list(dict.fromkeys(u for u in urls if u and u.strip()))
+    if not unique_urls:
+        return
+
+    pool = get_http_pool()
+    global_slots = asyncio.Semaphore(max(1, max_concurrency))
+    host_limit = max(1, per_host_limit or pool.max_per_host)
+    host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def _one(url: str) -> ScrapeResult:
+        host = (urlsplit(url).hostname or "").lower()
+        host_slot = host_slots.setdefault(host, asyncio.Semaphore(host_limit))
+        async with global_slots, host_slot:
+            try:
+                # I/O socket + trafilatura đều blocking nên chạy trong thread
+                return await asyncio.to_thread(scrape_clean_text, url, timeout, use_cache)
+            except Exception as exc:
+                return ScrapeResult(url=url, encoding="utf-8", raw_html="", text="", error=str(exc))
+
+    tasks = [asyncio.create_task(_one(u)) for u in unique_urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Consumer dừng sớm hoặc bị cancel: hủy các task còn lại
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def iter_scrape_many(urls: Iterable[str], **kwargs) -> Iterator[ScrapeResult]:
+    """
+    Phiên bản đồng bộ của `scrape_many` cho code không chạy trong event loop
+    (LangGraph node đồng bộ, validator, ...).
+
+    Event loop chạy trong một thread riêng nên an toàn cả khi caller đang ở
+    trong một event loop khác (VD: endpoint async của FastAPI).
+    """
+    results: "queue.Queue" = queue.Queue()
+    done = object()
+
+    async def _pump() -> None:
+        try:
+            async for item in scrape_many(urls, **kwargs):
+                results.put(item)
+        finally:
+            results.put(done)
+
+    worker = threading.Thread(target=lambda: asyncio.run(_pump()), name="agri-scrape", daemon=True)
+    worker.start()
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        yield item
+    worker.join()
+
+
 __all__ = [
     "ScrapeResult",
     "fetch_raw_bytes",
     "decode_with_charset_normalizer",
     "extract_main_text",
     "scrape_clean_text",
+    "scrape_many",
+    "iter_scrape_many",
 ]
-
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+"""
+Search fan-out: chạy song song các biến thể truy vấn trên DuckDuckGo và Tavily.
+
+Thay cho chuỗi fallback tuần tự (vn-vi -> query rút gọn -> chỉ tên cây ->
+tiếng Anh -> Tavily, mỗi bước chỉ chạy khi bước trước không có kết quả):
+- Mọi biến thể được gửi cùng lúc, giới hạn số request đồng thời theo từng
+  provider (DuckDuckGo dễ bị rate limit hơn Tavily).
+- Kết quả được gộp, khử trùng lặp và xếp hạng theo trust score ngay khi từng
+  biến thể trả về (hòa điểm thì ưu tiên biến thể đứng trước, rồi thứ hạng gốc).
+- Khi đã có đủ URL tin cậy cao thì hủy các biến thể còn chờ/đang chạy.
+- Kết quả từng biến thể đi qua search cache on-disk (`search_cache.py`):
+  cache hit trả về ngay, entry cũ được làm mới ở nền (stale-while-revalidate).
+
+Cấu hình qua biến môi trường:
+- AGRI_SEARCH_DDG_CONCURRENCY: số request DuckDuckGo đồng thời (mặc định 3)
+- AGRI_SEARCH_TAVILY_CONCURRENCY: số request Tavily đồng thời (mặc định 2)
+- AGRI_SEARCH_TIMEOUT: thời gian tối đa cho cả lượt search, giây (mặc định 20)
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+try:
+    from ddgs import DDGS  # Package mới (ddgs)
+except ImportError:
+    # Fallback cho package cũ (duckduckgo-search)
+    from duckduckgo_search import DDGS
+
+from src.tools.filter import calculate_trust_score
+from src.tools.search_cache import SearchCache, get_search_cache, normalize_query
+
+# Thử import Tavily nếu có
+try:
+    from tavily import TavilyClient
+    TAVILY_AVAILABLE = True
+except ImportError:
+    TAVILY_AVAILABLE = False
+
+
+# Một số domain cần loại bỏ hoàn toàn (forum, spam, không liên quan nông nghiệp)
+DISALLOWED_HOSTS = {
+    "vfo.vn",
+}
+# Host chứa các chuỗi này cũng bị loại ngay khi nhận kết quả search
+BLOCKED_HOST_PARTS = ("vfo.vn", "zhihu.com", "yahoo", "seek.com", "forum")
+
+# Trust score từ ngưỡng này trở lên được tính là URL tin cậy cao (báo chính thống, .edu.vn, .gov.vn)
+HIGH_TRUST_SCORE = 0.8
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class SearchVariant:
+    """Một biến thể truy vấn trên một provider (priority nhỏ = ưu tiên hơn khi hòa điểm)."""
+
+    provider: str  # "ddg" | "tavily"
+    query: str
+    region: Optional[str] = None
+    priority: int = 0
+
+
+@dataclass
+class SearchHit:
+    """URL tìm được, kèm trust score và biến thể đã tìm ra nó."""
+
+    url: str
+    trust_score: float
+    variant: SearchVariant
+    rank: int  # Thứ hạng trong kết quả của biến thể
+
+    def sort_key(self) -> tuple:
+        return (-self.trust_score, self.variant.priority, self.rank)
+
+
+@dataclass
+class VariantResult:
+    """Kết quả của một biến thể (URL thô theo thứ tự provider trả về)."""
+
+    variant: SearchVariant
+    urls: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    cache: str = "miss"  # "fresh" | "stale" (đang làm mới ở nền) | "miss" | "off"
+
+
+@dataclass
+class SearchOutcome:
+    """Kết quả gộp của một lượt fan-out search."""
+
+    hits: List[SearchHit] = field(default_factory=list)  # Đã xếp hạng
+    variants: List[Dict[str, Any]] = field(default_factory=list)  # Debug theo biến thể
+    errors: List[str] = field(default_factory=list)
+    cancelled: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def urls(self) -> List[str]:
+        return [hit.url for hit in self.hits]
+
+
+def build_search_variants(crop: str, query: str) -> List[SearchVariant]:
+    """
+    Các biến thể truy vấn cho một cây trồng, theo thứ tự ưu tiên của chuỗi
+    fallback cũ. Tavily chỉ được thêm khi có package và TAVILY_API_KEY.
+    """
+    crop = crop.strip()
+    # Với query tiếng Việt, region "vn-vi" cho kết quả tốt hơn (không có region thường ra 0 kết quả)
+    variants = [SearchVariant("ddg", query, region="vn-vi")]
+    if crop:
+        variants += [
+            SearchVariant("ddg", f"{crop} năng suất", region="vn-vi"),
+            SearchVariant("ddg", crop, region="vn-vi"),
+            SearchVariant("ddg", f"{crop} rice yield Vietnam"),
+            SearchVariant("ddg", f"{crop} rice variety Vietnam"),
+        ]
+        if TAVILY_AVAILABLE and os.getenv("TAVILY_API_KEY"):
+            variants.append(SearchVariant("tavily", f"{crop} năng suất giống lúa"))
+    # Bỏ biến thể trùng (VD: query chính trùng query rút gọn), đánh priority theo thứ tự
+    unique = list(dict.fromkeys((v.provider, v.query, v.region) for v in variants))
+    return [SearchVariant(p, q, region=r, priority=i) for i, (p, q, r) in enumerate(unique)]
+
+
+def is_acceptable_url(url: str) -> bool:
+    """URL tuyệt đối http(s), không thuộc domain bị chặn."""
+    if not url or not url.strip():
+        return False
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    # Bỏ URL không có scheme/netloc (relative URL) và scheme khác http/https
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return False
+    host = parsed.netloc.split(":", 1)[0].lower()
+    if host in DISALLOWED_HOSTS:
+        return False
+    return not any(bad in host for bad in BLOCKED_HOST_PARTS)
+
+
+def _search_ddg(query: str, region: Optional[str], max_results: int = 15) -> List[str]:
+    """DuckDuckGo text search (blocking), trả về URL theo thứ tự kết quả."""
+    with DDGS() as ddgs:
+        kwargs: Dict[str, Any] = {"safesearch": "moderate", "max_results": max_results}
+        if region:
+            kwargs["region"] = region
+        results = list(ddgs.text(query, **kwargs))
+    return [r.get("href") or r.get("url") for r in results if r.get("href") or r.get("url")]
+
+
+def _search_tavily(query: str, max_results: int = 10) -> List[str]:
+    """Tavily search (blocking), trả về URL theo thứ tự kết quả."""
+    client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    response = client.search(query, max_results=max_results, search_depth="basic")
+    return [result.get("url") for result in response.get("results", []) if result.get("url")]
+
+
+def _fetch_variant(variant: SearchVariant, cache: Optional[SearchCache]) -> List[str]:
+    """Gọi provider cho một biến thể rồi lưu kết quả vào search cache (raise nếu provider lỗi)."""
+    if variant.provider == "tavily":
+        urls = _search_tavily(variant.query)
+    else:
+        urls = _search_ddg(variant.query, variant.region)
+    if cache is not None:
+        try:
+            cache.put(variant.provider, variant.query, variant.region, urls)
+        except Exception:
+            pass  # Bỏ qua lỗi cache
+    return urls
+
+
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+_refreshing: Set[Tuple[str, str, Optional[str]]] = set()
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background(variant: SearchVariant, cache: SearchCache) -> None:
+    """Làm mới entry stale ở nền (mỗi biến thể tối đa một lần làm mới cùng lúc)."""
+    global _refresh_executor
+    key = (variant.provider, normalize_query(variant.query), variant.region)
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agri-search-refresh")
+
+    def _refresh() -> None:
+        try:
+            _fetch_variant(variant, cache)
+        except Exception:
+            pass  # Giữ entry cũ, lần search sau sẽ thử làm mới lại
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.submit(_refresh)
+
+
+def _run_variant(variant: SearchVariant, use_cache: bool = True) -> VariantResult:
+    """
+    Chạy một biến thể; lỗi provider được ghi vào kết quả thay vì raise.
+
+    Có search cache: entry fresh được trả về ngay; entry stale cũng được trả về
+    ngay và được làm mới ở nền.
+    """
+    start = time.monotonic()
+    cache = None
+    if use_cache:
+        try:
+            cache = get_search_cache()
+        except Exception:
+            cache = None  # Cache lỗi thì search trực tiếp
+    if cache is not None:
+        try:
+            cached = cache.get(variant.provider, variant.query, variant.region)
+        except Exception:
+            cached = None
+        if cached is not None:
+            if not cached.fresh:
+                _refresh_in_background(variant, cache)
+            return VariantResult(
+                variant,
+                urls=cached.urls,
+                elapsed=time.monotonic() - start,
+                cache="fresh" if cached.fresh else "stale",
+            )
+    status = "miss" if cache is not None else "off"
+    try:
+        urls = _fetch_variant(variant, cache)
+        return VariantResult(variant, urls=urls, elapsed=time.monotonic() - start, cache=status)
+    except Exception as exc:
+        return VariantResult(variant, error=str(exc), elapsed=time.monotonic() - start, cache=status)
+
+
+async def search_many(
+    variants: Iterable[SearchVariant],
+    *,
+    provider_limits: Optional[Dict[str, int]] = None,
+    timeout: Optional[float] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[VariantResult]:
+    """
+    Chạy song song các biến thể, yield từng VariantResult ngay khi biến thể đó xong.
+
+    Consumer dừng sớm (break / aclose) hoặc hết `timeout` (giây) thì các biến
+    thể còn lại bị hủy. `use_cache=False` bỏ qua search cache.
+    """
+    limits = {
+        "ddg": _env_int("AGRI_SEARCH_DDG_CONCURRENCY", 3),
+        "tavily": _env_int("AGRI_SEARCH_TAVILY_CONCURRENCY", 2),
+        **(provider_limits or {}),
+    }
+    slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def _one(variant: SearchVariant) -> VariantResult:
+        slot = slots.setdefault(variant.provider, asyncio.Semaphore(max(1, limits.get(variant.provider, 2))))
+        async with slot:
+            # Client search đều blocking nên chạy trong thread
+            return await asyncio.to_thread(_run_variant, variant, use_cache)
+
+    tasks = [asyncio.create_task(_one(v)) for v in variants]
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            try:
+                result = await next_done
+            except asyncio.TimeoutError:
+                return
+            yield result
+    finally:
+        # Consumer dừng sớm, hết giờ hoặc bị cancel: hủy các biến thể còn lại
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class _HitMerger:
+    """Gộp URL từ các biến thể: lọc, khử trùng lặp, giữ lần xuất hiện tốt nhất."""
+
+    def __init__(self) -> None:
+        self.best: Dict[str, SearchHit] = {}
+
+    def add(self, result: VariantResult) -> int:
+        """Thêm URL của một biến thể; trả về số URL mới."""
+        added = 0
+        for rank, url in enumerate(result.urls):
+            url = (url or "").strip()
+            if not is_acceptable_url(url):
+                continue
+            hit = SearchHit(url, calculate_trust_score(url), result.variant, rank)
+            current = self.best.get(url)
+            if current is None:
+                added += 1
+            if current is None or hit.sort_key() < current.sort_key():
+                self.best[url] = hit
+        return added
+
+    def count_at_least(self, trust_score: float) -> int:
+        return sum(1 for hit in self.best.values() if hit.trust_score >= trust_score)
+
+    def ranked(self) -> List[SearchHit]:
+        return sorted(self.best.values(), key=SearchHit.sort_key)
+
+
+async def afan_out_search(
+    variants: List[SearchVariant],
+    *,
+    enough: int = 3,
+    high_trust: float = HIGH_TRUST_SCORE,
+    timeout: Optional[float] = None,
+    provider_limits: Optional[Dict[str, int]] = None,
+    use_cache: bool = True,
+) -> SearchOutcome:
+    """
+    Chạy song song các biến thể search và gộp kết quả theo trust score.
+
+    Parameters
+    ----------
+    variants: List[SearchVariant]
+        Các biến thể (xem `build_search_variants`).
+    enough: int
+        Dừng sớm (hủy các biến thể còn lại) khi đã có `enough` URL có trust
+        score >= `high_trust`.
+    timeout: float
+        Thời gian tối đa (giây) cho cả lượt search (mặc định AGRI_SEARCH_TIMEOUT);
+        hết giờ thì dùng các kết quả đã có.
+    provider_limits: Dict[str, int]
+        Ghi đè số request đồng thời theo provider.
+    use_cache: bool
+        Dùng search cache on-disk (mặc định True, stale-while-revalidate).
+
+    Returns
+    -------
+    SearchOutcome
+        URL đã xếp hạng (trust score giảm dần) + debug từng biến thể.
+    """
+    outcome = SearchOutcome()
+    if not variants:
+        return outcome
+
+    timeout = timeout if timeout is not None else _env_int("AGRI_SEARCH_TIMEOUT", 20)
+    start = time.monotonic()
+    merger = _HitMerger()
+    finished = 0
+
+    results = search_many(variants, provider_limits=provider_limits, timeout=timeout, use_cache=use_cache)
+    try:
+        async for item in results:
+            finished += 1
+            new_urls = merger.add(item)
+            outcome.variants.append({
+                "provider": item.variant.provider,
+                "query": item.variant.query,
+                "region": item.variant.region or "default",
+                "count": len(item.urls),
+                "new_urls": new_urls,
+                "elapsed": round(item.elapsed, 2),
+                "cache": item.cache,
+                "error": item.error,
+            })
+            if item.error:
+                outcome.errors.append(
+                    f"{item.variant.provider} search error for query '{item.variant.query}' "
+                    f"(region={item.variant.region}): {item.error}"
+                )
+            if merger.count_at_least(high_trust) >= enough:
+                break  # Đủ URL tin cậy cao: hủy các biến thể còn lại
+    finally:
+        await results.aclose()
+
+    outcome.cancelled = len(variants) - finished
+    if outcome.cancelled and merger.count_at_least(high_trust) < enough:
+        outcome.errors.append(f"Search timeout sau {timeout}s ({outcome.cancelled} biến thể bị hủy)")
+    outcome.hits = merger.ranked()
+    outcome.elapsed = round(time.monotonic() - start, 2)
+    return outcome
+
+
+def fan_out_search(variants: List[SearchVariant], **kwargs) -> SearchOutcome:
+    """
+    Phiên bản đồng bộ của `afan_out_search` cho code không chạy trong event loop.
+
+    Event loop chạy trong một thread riêng (an toàn cả khi caller đang ở trong
+    event loop khác); kết quả được trả về ngay khi có, không chờ các request
+    đã bị hủy nhưng còn đang chạy trong thread nền.
+    """
+    box: "queue.Queue" = queue.Queue()
+
+    async def _main() -> None:
+        try:
+            box.put(await afan_out_search(variants, **kwargs))
+        except BaseException as exc:
+            box.put(exc)
+
+    threading.Thread(target=lambda: asyncio.run(_main()), name="agri-search", daemon=True).start()
+    result = box.get()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+__all__ = [
+    "DISALLOWED_HOSTS",
+    "HIGH_TRUST_SCORE",
+    "SearchHit",
+    "SearchOutcome",
+    "SearchVariant",
+    "VariantResult",
+    "afan_out_search",
+    "build_search_variants",
+    "fan_out_search",
+    "is_acceptable_url",
+    "search_many",
+]
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+"""
+Search cache on-disk: danh sách URL kết quả search theo (provider, region, query).
+
+Streamlit app và bước web validation của wiki thường search lại đúng cây trồng
+đó; cache giúp không phải gọi lại DuckDuckGo/Tavily:
+- Key = hash(provider + region + query đã chuẩn hóa: NFC, casefold, gộp khoảng
+  trắng), nên "Lúa  ST25" và "lúa st25" dùng chung một entry.
+- Entry còn trong TTL ("fresh") được trả về ngay.
+- Entry quá TTL nhưng chưa quá `max_stale` ("stale") vẫn được trả về ngay,
+  đồng thời caller làm mới nó ở nền (stale-while-revalidate).
+- Giới hạn số entry: vượt `max_entries` thì xóa entry ít được truy cập nhất (LRU).
+
+Cấu hình qua biến môi trường:
+- AGRI_SEARCH_CACHE_TTL: số giây kết quả được coi là fresh (mặc định 1 ngày)
+- AGRI_SEARCH_CACHE_MAX_STALE: tuổi tối đa (giây) của entry còn được dùng khi
+  đang làm mới ở nền (mặc định 7 ngày)
+- AGRI_SEARCH_CACHE_MAX_ENTRIES: số entry tối đa (mặc định 5000, 0 = tắt cache)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+SEARCH_CACHE_PATH = DATA_DIR / "search_cache.sqlite3"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa query làm cache key (NFC, casefold, gộp khoảng trắng)."""
+    query = unicodedata.normalize("NFC", query or "").casefold()
+    return _WHITESPACE_RE.sub(" ", query).strip()
+
+
+def search_cache_key(provider: str, query: str, region: Optional[str]) -> str:
+    """Khóa cache cho một lần search."""
+    key_str = "\x00".join([provider, region or "", normalize_query(query)])
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedSearch:
+    """Một entry trong search cache."""
+
+    urls: List[str]
+    fetched_at: float
+    fresh: bool  # False = stale, nên làm mới ở nền
+
+
+class SearchCache(SQLiteStore):
+    """
+    Cache (provider, region, query) -> List[URL] on-disk, thread/process-safe.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS searches (
+            cache_key TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            region TEXT NOT NULL,
+            query TEXT NOT NULL,
+            urls TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_searches_last_access ON searches(last_access)",
+    )
+
+    def __init__(
+        self,
+        path: Path = SEARCH_CACHE_PATH,
+        ttl: float = 24 * 3600,
+        max_stale: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+    ) -> None:
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, int] = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get(self, provider: str, query: str, region: Optional[str] = None) -> Optional[CachedSearch]:
+        """
+        Kết quả đã lưu nếu còn dùng được (fresh hoặc stale trong `max_stale`),
+        None nếu chưa có hoặc đã quá cũ.
+        """
+        cache_key = search_cache_key(provider, query, region)
+        row = self.conn.execute(
+            "SELECT urls, fetched_at FROM searches WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row[1] >= self.max_stale:
+            self._count("misses")
+            return None
+        try:
+            urls = json.loads(row[0])
+        except (TypeError, ValueError):
+            self._count("misses")
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE searches SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+        fresh = now - row[1] < self.ttl
+        self._count("fresh_hits" if fresh else "stale_hits")
+        return CachedSearch(urls=urls, fetched_at=row[1], fresh=fresh)
+
+    def put(self, provider: str, query: str, region: Optional[str], urls: List[str]) -> None:
+        """Lưu kết quả search (kể cả danh sách rỗng) rồi evict nếu vượt số entry."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO searches "
+                "(cache_key, provider, region, query, urls, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    search_cache_key(provider, query, region),
+                    provider,
+                    region or "",
+                    normalize_query(query),
+                    json.dumps(list(urls), ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+        self._count("stores")
+        self._evict_if_needed()
+
+    def _evict_if_needed(self) -> None:
+        """Xóa entry ít được truy cập nhất cho đến khi số entry <= max_entries."""
+        total = self.conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM searches WHERE cache_key IN "
+                "(SELECT cache_key FROM searches ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+        self._count("evictions", excess)
+
+    def stats(self) -> Dict[str, float]:
+        """Thống kê cache của process hiện tại, cộng số entry trên đĩa."""
+        with self._stats_lock:
+            data: Dict[str, float] = dict(self._stats)
+        data["entries"] = self.conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        lookups = data["fresh_hits"] + data["stale_hits"] + data["misses"]
+        data["hit_rate"] = (data["fresh_hits"] + data["stale_hits"]) / lookups if lookups else 0.0
+        return data
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache."""
+        with self.conn:
+            self.conn.execute("DELETE FROM searches")
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float, fallback về default nếu không hợp lệ."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_search_cache: Optional[SearchCache] = None
+_global_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Lấy search cache dùng chung cho toàn process (None nếu bị tắt)."""
+    global _global_search_cache
+    max_entries = int(_env_float("AGRI_SEARCH_CACHE_MAX_ENTRIES", 5000))
+    if max_entries <= 0:
+        return None
+    if _global_search_cache is None:
+        with _global_search_cache_lock:
+            if _global_search_cache is None:
+                _global_search_cache = SearchCache(
+                    ttl=_env_float("AGRI_SEARCH_CACHE_TTL", 24 * 3600),
+                    max_stale=_env_float("AGRI_SEARCH_CACHE_MAX_STALE", 7 * 24 * 3600),
+                    max_entries=max_entries,
+                )
+    return _global_search_cache
+
+
+__all__ = [
+    "CachedSearch",
+    "SearchCache",
+    "get_search_cache",
+    "normalize_query",
+    "search_cache_key",
+]
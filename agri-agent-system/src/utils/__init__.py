@@ -6,14 +6,24 @@ from src.utils.rate_limiter import (
     RateLimiter,
     CircuitBreaker,
     CircuitState,
+    RequestBudget,
+    RateLimitStore,
+    SharedRequestBudget,
+    get_rate_limit_store,
     get_rate_limiter,
     get_circuit_breaker,
+    get_llm_budget,
 )
 
 __all__ = [
     "RateLimiter",
     "CircuitBreaker",
     "CircuitState",
+    "RequestBudget",
+    "RateLimitStore",
+    "SharedRequestBudget",
+    "get_rate_limit_store",
     "get_rate_limiter",
     "get_circuit_breaker",
+    "get_llm_budget",
 ]
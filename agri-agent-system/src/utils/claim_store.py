@@ -0,0 +1,338 @@
+"""
+Claim store: knowledge base các claim đã trích xuất/hợp nhất, giữ qua nhiều lần chạy workflow.
+
+Thiết kế (SQLite, `data/knowledge/claims.sqlite3`):
+- `claims`: claim thô theo nguồn (URL), khóa = hash(URL + subject + predicate + object + context).
+- `sources`: các URL đã trích xuất xong -> lần chạy sau không scrape/gọi LLM lại.
+- `resolved`: ResolvedClaim theo nhóm (subject, predicate) kèm fingerprint tập claim
+  của nhóm -> nhóm không có claim mới thì dùng lại kết quả cũ, không resolve lại.
+- `queries`: cây trồng/câu hỏi -> danh sách nhóm đã trả lời, để truy vấn lặp lại
+  (VD: "Lúa ST25") được trả lời thẳng từ store.
+
+Cấu hình qua biến môi trường:
+- AGRI_CLAIM_STORE_TTL: số giây một nguồn/câu trả lời được coi là còn mới
+  (mặc định 7 ngày; 0 = luôn trích xuất lại, không trả lời trực tiếp từ store).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.agents.resolver import ResolvedClaim
+from src.models import AgriClaim
+from src.tools.page_cache import normalize_cache_key
+from src.utils.embedding_cache import normalize_text
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+CLAIM_STORE_PATH = DATA_DIR / "knowledge" / "claims.sqlite3"
+
+# SQLite giới hạn số tham số trong một câu lệnh
+_MAX_SQL_PARAMS = 900
+
+
+def claim_group_key(claim: AgriClaim) -> str:
+    """Khóa nhóm (subject, predicate) - cùng cách group của resolver."""
+    return f"{claim.subject.strip().lower()}\x1f{claim.predicate.strip().lower()}"
+
+
+def _claim_id(claim: AgriClaim) -> str:
+    key_str = "|".join(
+        [
+            normalize_cache_key(claim.source_url) if claim.source_url else "",
+            normalize_text(claim.subject),
+            normalize_text(claim.predicate),
+            normalize_text(claim.object or ""),
+            normalize_text(claim.context or ""),
+        ]
+    )
+    return hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+
+
+def _fingerprint(claim_ids: Iterable[str]) -> str:
+    return hashlib.sha1("\n".join(sorted(claim_ids)).encode("ascii")).hexdigest()
+
+
+def _resolved_to_json(resolved: ResolvedClaim) -> str:
+    data = asdict(resolved)
+    data["gold_claim"] = resolved.gold_claim.model_dump()
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _resolved_from_json(payload: str) -> ResolvedClaim:
+    data = json.loads(payload)
+    data["gold_claim"] = AgriClaim(**data["gold_claim"])
+    return ResolvedClaim(**data)
+
+
+class ClaimStore(SQLiteStore):
+    """
+    Knowledge base claim on-disk, dùng chung giữa các lần chạy và các process.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS claims (
+            claim_id TEXT PRIMARY KEY,
+            group_key TEXT NOT NULL,
+            source_key TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_claims_group ON claims(group_key)",
+        "CREATE INDEX IF NOT EXISTS idx_claims_source ON claims(source_key)",
+        """
+        CREATE TABLE IF NOT EXISTS sources (
+            source_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            num_claims INTEGER NOT NULL,
+            processed_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS resolved (
+            group_key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS queries (
+            query_key TEXT PRIMARY KEY,
+            group_keys TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    )
+
+    def __init__(self, path=CLAIM_STORE_PATH, ttl: float = 7 * 24 * 3600) -> None:
+        super().__init__(path)
+        self.ttl = ttl
+
+    def _select_in(self, sql: str, values: Sequence[str], *params) -> List[Tuple]:
+        """Chạy `sql` (chứa `{placeholders}`) theo lô để tránh giới hạn tham số."""
+        rows: List[Tuple] = []
+        values = list(dict.fromkeys(values))
+        for start in range(0, len(values), _MAX_SQL_PARAMS):
+            batch = values[start:start + _MAX_SQL_PARAMS]
+            query = sql.format(placeholders=",".join("?" * len(batch)))
+            rows.extend(self.conn.execute(query, (*params, *batch)).fetchall())
+        return rows
+
+    # ----------------------------------------------------------------- sources
+    def known_sources(self, urls: Sequence[str]) -> Set[str]:
+        """Các URL (trong `urls`) đã được trích xuất và còn trong TTL."""
+        keys = {normalize_cache_key(u): u for u in urls}
+        rows = self._select_in(
+            "SELECT source_key FROM sources WHERE processed_at >= ? AND source_key IN ({placeholders})",
+            list(keys),
+            time.time() - self.ttl,
+        )
+        return {keys[row[0]] for row in rows}
+
+    def claims_for_sources(self, urls: Sequence[str]) -> Dict[str, List[AgriClaim]]:
+        """Claim đã lưu của từng URL."""
+        keys = {normalize_cache_key(u): u for u in urls}
+        found: Dict[str, List[AgriClaim]] = {u: [] for u in urls}
+        rows = self._select_in(
+            "SELECT source_key, payload FROM claims WHERE source_key IN ({placeholders}) ORDER BY rowid",
+            list(keys),
+        )
+        for source_key, payload in rows:
+            found[keys[source_key]].append(AgriClaim.model_validate_json(payload))
+        return found
+
+    def record_source(self, url: str, claims: Sequence[AgriClaim]) -> None:
+        """Upsert claim của một URL (thay thế claim cũ của URL đó) và đánh dấu đã xử lý."""
+        source_key = normalize_cache_key(url)
+        now = time.time()
+        rows = [
+            (_claim_id(c), claim_group_key(c), source_key, c.model_dump_json(), now)
+            for c in claims
+        ]
+        with self.conn:
+            self.conn.execute("DELETE FROM claims WHERE source_key = ?", (source_key,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO claims (claim_id, group_key, source_key, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (source_key, url, num_claims, processed_at) VALUES (?, ?, ?, ?)",
+                (source_key, url, len(rows), now),
+            )
+
+    # ------------------------------------------------------------------ groups
+    def claims_for_groups(self, group_keys: Sequence[str]) -> Dict[str, List[Tuple[str, AgriClaim]]]:
+        """Toàn bộ claim đã biết của từng nhóm, dạng (claim_id, claim)."""
+        found: Dict[str, List[Tuple[str, AgriClaim]]] = {k: [] for k in group_keys}
+        rows = self._select_in(
+            "SELECT group_key, claim_id, payload FROM claims WHERE group_key IN ({placeholders}) ORDER BY rowid",
+            list(group_keys),
+        )
+        for group_key, claim_id, payload in rows:
+            found[group_key].append((claim_id, AgriClaim.model_validate_json(payload)))
+        return found
+
+    def resolved_for_groups(self, group_keys: Sequence[str]) -> Dict[str, Tuple[str, ResolvedClaim]]:
+        """ResolvedClaim đã lưu của từng nhóm, dạng (fingerprint, resolved)."""
+        rows = self._select_in(
+            "SELECT group_key, fingerprint, payload FROM resolved WHERE group_key IN ({placeholders})",
+            list(group_keys),
+        )
+        found: Dict[str, Tuple[str, ResolvedClaim]] = {}
+        for group_key, fingerprint, payload in rows:
+            try:
+                found[group_key] = (fingerprint, _resolved_from_json(payload))
+            except Exception:
+                continue  # Bản ghi hỏng/khác schema: resolve lại
+        return found
+
+    def put_resolved(self, items: Iterable[Tuple[str, str, ResolvedClaim]]) -> None:
+        """Lưu ResolvedClaim theo nhóm: (group_key, fingerprint, resolved)."""
+        now = time.time()
+        rows = [(key, fp, _resolved_to_json(rc), now) for key, fp, rc in items]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO resolved (group_key, fingerprint, payload, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    # ----------------------------------------------------------------- queries
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return normalize_text(query)
+
+    def answer_for_query(self, query: str) -> Optional[Tuple[List[ResolvedClaim], List[AgriClaim]]]:
+        """
+        Câu trả lời đã lưu cho truy vấn: (resolved claims, claim thô của các nhóm).
+
+        None nếu chưa có, đã quá TTL hoặc TTL = 0.
+        """
+        if self.ttl <= 0:
+            return None
+        row = self.conn.execute(
+            "SELECT group_keys FROM queries WHERE query_key = ? AND updated_at >= ?",
+            (self._query_key(query), time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        group_keys = json.loads(row[0])
+        resolved = self.resolved_for_groups(group_keys)
+        if not group_keys or len(resolved) < len(group_keys):
+            return None
+        claims = self.claims_for_groups(group_keys)
+        return (
+            [resolved[k][1] for k in group_keys],
+            [claim for k in group_keys for _, claim in claims[k]],
+        )
+
+    def record_query(self, query: str, group_keys: Sequence[str]) -> None:
+        """Ghi nhớ các nhóm đã dùng để trả lời truy vấn."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO queries (query_key, group_keys, updated_at) VALUES (?, ?, ?)",
+                (self._query_key(query), json.dumps(list(group_keys), ensure_ascii=False), time.time()),
+            )
+
+    def upsert_and_resolve(
+        self,
+        claims: Sequence[AgriClaim],
+        new_sources: Sequence[str],
+        resolve_group,
+    ) -> Tuple[List[str], List[ResolvedClaim], int]:
+        """
+        Upsert claim của các nguồn mới rồi resolve phần delta.
+
+        Parameters
+        ----------
+        claims:
+            Claim của lần chạy hiện tại (gồm cả claim lấy lại từ store).
+        new_sources:
+            Các URL vừa được trích xuất đầy đủ (claim của chúng sẽ được ghi vào
+            store). Claim của URL khác chưa có trong store chỉ được dùng để
+            resolve lần chạy này, không được lưu.
+        resolve_group:
+            Hàm resolve một nhóm claim (VD: resolver.resolve_claims_for_group).
+
+        Returns
+        -------
+        (group_keys, resolved, num_resolved_fresh)
+            Các nhóm liên quan, ResolvedClaim theo thứ tự nhóm, và số nhóm
+            thực sự phải resolve lại (các nhóm còn lại dùng kết quả đã lưu).
+        """
+        by_source: Dict[str, List[AgriClaim]] = {u: [] for u in new_sources}
+        for claim in claims:
+            if claim.source_url in by_source:
+                by_source[claim.source_url].append(claim)
+        for url, source_claims in by_source.items():
+            self.record_source(url, source_claims)
+
+        group_keys = list(dict.fromkeys(claim_group_key(c) for c in claims))
+        # Nhóm gồm toàn bộ claim đã biết (từ các lần chạy trước), không chỉ lần này
+        known = self.claims_for_groups(group_keys)
+        # Claim chưa lưu (không có URL, hoặc URL trích xuất dở nên không được
+        # ghi vào store) vẫn được resolve cho lần chạy này
+        known_ids = {key: {cid for cid, _ in items} for key, items in known.items()}
+        for claim in claims:
+            key = claim_group_key(claim)
+            claim_id = _claim_id(claim)
+            if claim_id not in known_ids[key]:
+                known_ids[key].add(claim_id)
+                known[key].append((claim_id, claim))
+        stored = self.resolved_for_groups(group_keys)
+
+        results: Dict[str, ResolvedClaim] = {}
+        to_save: List[Tuple[str, str, ResolvedClaim]] = []
+        for key in group_keys:
+            fingerprint = _fingerprint(cid for cid, _ in known[key])
+            if key in stored and stored[key][0] == fingerprint:
+                results[key] = stored[key][1]
+                continue
+            resolved = resolve_group([c for _, c in known[key]])
+            if resolved is not None:
+                results[key] = resolved
+                to_save.append((key, fingerprint, resolved))
+        self.put_resolved(to_save)
+
+        answered = [k for k in group_keys if k in results]
+        return answered, [results[k] for k in answered], len(to_save)
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float, fallback về default nếu không hợp lệ."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_claim_store: Optional[ClaimStore] = None
+_global_claim_store_lock = threading.Lock()
+
+
+def get_claim_store() -> ClaimStore:
+    """Lấy claim store dùng chung cho toàn process."""
+    global _global_claim_store
+    if _global_claim_store is None:
+        with _global_claim_store_lock:
+            if _global_claim_store is None:
+                _global_claim_store = ClaimStore(ttl=_env_float("AGRI_CLAIM_STORE_TTL", 7 * 24 * 3600))
+    return _global_claim_store
+
+
+__all__ = [
+    "ClaimStore",
+    "claim_group_key",
+    "get_claim_store",
+]
@@ -0,0 +1,190 @@
+"""
+Embedding cache: lưu vector embedding text -> float32 trên đĩa.
+
+Định dạng file (`data/embedding_cache/<model>.d<dim>.f32`): chuỗi record kích
+thước cố định, mỗi record = key (32 byte hex) + `dim` số float32. File chỉ được
+append (mỗi lô một lần ghi O_APPEND) nên:
+- Ghi thêm O(số vector mới), không phải ghi lại toàn bộ file.
+- Nhiều process có thể dùng chung; process khác append thì lần tra cứu sau
+  chỉ đọc phần đuôi mới.
+
+Key = hash(model name + text đã chuẩn hóa: NFC, lowercase, gộp khoảng trắng).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.sqlite_store import DATA_DIR
+
+
+EMBEDDING_CACHE_DIR = DATA_DIR / "embedding_cache"
+
+# Giới hạn số text trong một lần gọi embed_documents của Gemini
+EMBED_BATCH_LIMIT = 100
+
+_KEY_BYTES = 32
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa text trước khi tạo key (NFC, lowercase, gộp khoảng trắng)."""
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Cache text -> vector float32 cho một embedding model, thread-safe.
+    """
+
+    def __init__(self, model_name: str, cache_dir: Path = EMBEDDING_CACHE_DIR) -> None:
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self._lock = threading.Lock()
+        self._vectors: Dict[bytes, np.ndarray] = {}
+        self._dim: Optional[int] = None
+        self._offset = 0  # số byte đã đọc từ file
+
+    def key_for(self, text: str) -> bytes:
+        """Key 32 byte cho text (đã gồm tên model)."""
+        digest = hashlib.blake2b(
+            f"{self.model_name}\x00{normalize_text(text)}".encode("utf-8"),
+            digest_size=_KEY_BYTES // 2,
+        )
+        return digest.hexdigest().encode("ascii")
+
+    def _path(self, dim: int) -> Path:
+        return self.cache_dir / f"{self._slug}.d{dim}.f32"
+
+    def _record_dtype(self, dim: int) -> np.dtype:
+        return np.dtype([("key", f"S{_KEY_BYTES}"), ("vec", "<f4", (dim,))])
+
+    def _discover_dim(self) -> Optional[int]:
+        for path in sorted(self.cache_dir.glob(f"{self._slug}.d*.f32")):
+            match = re.search(r"\.d(\d+)\.f32$", path.name)
+            if match:
+                return int(match.group(1))
+        return None
+
+    def _refresh_locked(self) -> None:
+        """Đọc các record mới được append (bởi process này hoặc process khác)."""
+        if self._dim is None:
+            self._dim = self._discover_dim()
+            if self._dim is None:
+                return
+        path = self._path(self._dim)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        dtype = self._record_dtype(self._dim)
+        # Bỏ qua record ghi dở (nếu process khác đang append)
+        usable = size - (size - self._offset) % dtype.itemsize
+        if usable <= self._offset:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            records = np.frombuffer(f.read(usable - self._offset), dtype=dtype)
+        for record in records:
+            self._vectors[bytes(record["key"])] = record["vec"]
+        self._offset = usable
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Tra cứu vector cho từng text (None nếu chưa có)."""
+        keys = [self.key_for(t) for t in texts]
+        with self._lock:
+            if any(k not in self._vectors for k in keys):
+                self._refresh_locked()
+            return [self._vectors.get(k) for k in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Lưu vector cho các text (một lần append duy nhất)."""
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+            return
+        dim = int(matrix.shape[1])
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = self._discover_dim() or dim
+            if dim != self._dim:
+                return  # Model trả về số chiều khác: không trộn vào file hiện tại
+
+            records = np.zeros(len(texts), dtype=self._record_dtype(dim))
+            records["key"] = [self.key_for(t) for t in texts]
+            records["vec"] = matrix
+
+            fd = os.open(self._path(dim), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, records.tobytes())
+            finally:
+                os.close(fd)
+            for record in records:
+                self._vectors[bytes(record["key"])] = record["vec"]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_locked()
+            return len(self._vectors)
+
+
+def embed_with_cache(texts: Sequence[str], embedding_model, cache: Optional[EmbeddingCache]) -> np.ndarray:
+    """
+    Embed danh sách text, chỉ gọi API cho các text (đã chuẩn hóa) chưa có trong cache.
+
+    Các text chưa có được gom lại thành một lần `embed_documents`
+    (chia lô EMBED_BATCH_LIMIT nếu quá giới hạn API), nên số request
+    tăng tuyến tính theo số text duy nhất thay vì theo số lần so sánh.
+
+    Returns
+    -------
+    np.ndarray
+        Ma trận float32 shape (len(texts), dim), cùng thứ tự với `texts`.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+
+    # Gom các text chưa có, khử trùng lặp theo text đã chuẩn hóa
+    missing: Dict[str, str] = {}
+    for text, vec in zip(texts, cached):
+        if vec is None:
+            missing.setdefault(normalize_text(text), text)
+
+    fresh: Dict[str, np.ndarray] = {}
+    if missing:
+        norm_keys = list(missing.keys())
+        originals = [missing[k] for k in norm_keys]
+        vectors: List[Sequence[float]] = []
+        for start in range(0, len(originals), EMBED_BATCH_LIMIT):
+            vectors.extend(embedding_model.embed_documents(originals[start:start + EMBED_BATCH_LIMIT]))
+        if cache is not None:
+            cache.put_many(originals, vectors)
+        fresh = {k: np.asarray(v, dtype=np.float32) for k, v in zip(norm_keys, vectors)}
+
+    rows = [
+        vec if vec is not None else fresh[normalize_text(text)]
+        for text, vec in zip(texts, cached)
+    ]
+    return np.vstack(rows).astype(np.float32, copy=False)
+
+
+__all__ = [
+    "EmbeddingCache",
+    "embed_with_cache",
+    "normalize_text",
+]
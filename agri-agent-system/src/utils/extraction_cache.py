@@ -0,0 +1,176 @@
+"""
+Extraction cache: lưu kết quả trích xuất claims của LLM theo nội dung chunk.
+
+Khóa = hash(text chunk đã chuẩn hóa + system prompt + model + temperature), nên:
+- Bài wiki/trang web không đổi khi validate/scrape lại không tốn API call nào.
+- Đổi prompt/model/temperature thì kết quả cũ tự động không còn khớp.
+
+Giá trị là danh sách AgriClaim (JSON) đã parse. Dung lượng bị giới hạn bởi
+`max_bytes`; vượt thì xóa entry ít được truy cập nhất (LRU).
+
+Cấu hình qua biến môi trường:
+- AGRI_EXTRACTION_CACHE_MAX_MB: dung lượng tối đa (mặc định 64 MB, 0 = tắt cache)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from src.models import AgriClaim
+from src.utils.embedding_cache import normalize_text
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+EXTRACTION_CACHE_PATH = DATA_DIR / "extraction_cache" / "extractions.sqlite3"
+
+
+def extraction_cache_key(text: str, system_prompt: str, model: str, temperature: float) -> str:
+    """Khóa cache cho một lần trích xuất."""
+    key_str = "\x00".join([normalize_text(text), system_prompt, model, repr(float(temperature))])
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache(SQLiteStore):
+    """
+    Cache kết quả trích xuất (chunk -> List[AgriClaim]) on-disk, thread/process-safe.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS extractions (
+            cache_key TEXT PRIMARY KEY,
+            claims TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_extractions_last_access ON extractions(last_access)",
+    )
+
+    def __init__(self, path: Path = EXTRACTION_CACHE_PATH, max_bytes: int = 64 * 1024 * 1024) -> None:
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get(self, cache_key: str) -> Optional[List[AgriClaim]]:
+        """Danh sách claims đã lưu (None nếu chưa có). Mỗi lần gọi trả về object mới."""
+        row = self.conn.execute(
+            "SELECT claims FROM extractions WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            claims = [AgriClaim(**item) for item in json.loads(row[0])]
+        except Exception:
+            self._count("misses")
+            return None
+        with self.conn:
+            self.conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key)
+            )
+        self._count("hits")
+        return claims
+
+    def contains(self, cache_key: str) -> bool:
+        """Khóa đã có trong cache chưa (không đếm hit/miss, không cập nhật LRU)."""
+        row = self.conn.execute(
+            "SELECT 1 FROM extractions WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row is not None
+
+    def put(self, cache_key: str, claims: Sequence[AgriClaim]) -> None:
+        """Lưu kết quả trích xuất rồi evict nếu vượt dung lượng."""
+        payload = json.dumps(
+            [c.model_dump(exclude={"source_url"}) for c in claims], ensure_ascii=False
+        )
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extractions (cache_key, claims, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, payload, len(payload.encode("utf-8")), now, now),
+            )
+        self._count("stores")
+        self._evict_if_needed()
+
+    def _evict_if_needed(self) -> None:
+        """Xóa entry ít được truy cập nhất cho đến khi tổng dung lượng <= max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        with self.conn:
+            rows = self.conn.execute(
+                "SELECT cache_key, size FROM extractions ORDER BY last_access ASC"
+            ).fetchall()
+            for cache_key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM extractions WHERE cache_key = ?", (cache_key,))
+                total -= size
+                evicted += 1
+        self._count("evictions", evicted)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Thống kê cache: hits/misses/stores/evictions của process hiện tại,
+        cộng số entry và tổng dung lượng trên đĩa.
+        """
+        with self._stats_lock:
+            data: Dict[str, float] = dict(self._stats)
+        row = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        data["entries"] = row[0]
+        data["total_bytes"] = row[1]
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = data["hits"] / lookups if lookups else 0.0
+        return data
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache."""
+        with self.conn:
+            self.conn.execute("DELETE FROM extractions")
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float, fallback về default nếu không hợp lệ."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_extraction_cache: Optional[ExtractionCache] = None
+_global_extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Lấy extraction cache dùng chung cho toàn process (None nếu bị tắt)."""
+    global _global_extraction_cache
+    max_mb = _env_float("AGRI_EXTRACTION_CACHE_MAX_MB", 64)
+    if max_mb <= 0:
+        return None
+    if _global_extraction_cache is None:
+        with _global_extraction_cache_lock:
+            if _global_extraction_cache is None:
+                _global_extraction_cache = ExtractionCache(max_bytes=int(max_mb * 1024 * 1024))
+    return _global_extraction_cache
+
+
+__all__ = [
+    "ExtractionCache",
+    "extraction_cache_key",
+    "get_extraction_cache",
+]
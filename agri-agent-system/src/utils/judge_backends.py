@@ -0,0 +1,303 @@
+"""
+Judge backend: lớp embedding/NLI có thể thay thế của NLI Judge.
+
+NLI Judge cần hai khả năng: embed text để so sánh semantic (ma trận cosine,
+clustering) và phán quyết các cặp claims còn mơ hồ. Backend gom hai khả năng
+đó sau một interface chung để judge chạy được cả khi không có API key:
+- `GeminiJudgeBackend`: embedding Gemini (qua client registry + embedding cache
+  on-disk); phán quyết NLI do LLM (NLI Judge theo lô) đảm nhận.
+- `LocalNgramBackend`: chạy hoàn toàn offline trên CPU. Embedding là vector
+  char n-gram (2-4 ký tự) băm vào `n_features` chiều, TF sublinear, chuẩn hóa L2,
+  nên ma trận similarity chỉ là một phép nhân NumPy (hàng nghìn cặp/giây, thay
+  cho `difflib.SequenceMatcher` O(n·m) mỗi cặp). NLI dùng luật: so sánh số liệu
+  cùng đại lượng (đã quy đổi đơn vị) và cặp từ khóa mâu thuẫn.
+
+Cấu hình qua biến môi trường:
+- AGRI_JUDGE_BACKEND: auto (mặc định: Gemini nếu có API key, ngược lại local) | gemini | local
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.models import AgriClaim
+from src.utils.embedding_cache import EmbeddingCache, embed_with_cache, normalize_text
+
+
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+
+# Ngưỡng similarity để kết luận SUPPORTED không cần NLI (embedding Gemini / char n-gram)
+EMBEDDING_SUPPORT_THRESHOLD = 0.95
+TEXT_SUPPORT_THRESHOLD = 0.9
+
+# Cặp từ khóa mâu thuẫn (dùng bởi NLI local và fallback khi không parse được output LLM)
+CONTRADICTION_KEYWORDS: Tuple[Tuple[str, str], ...] = (
+    ("giải nhất", "giải khuyến khích"),
+    ("giải nhất", "giải nhì"),
+    ("giải nhất", "giải ba"),
+    ("có", "không có"),
+    ("đúng", "sai"),
+)
+
+# Chênh lệch tương đối tối đa để hai số liệu được coi là xấp xỉ (VD: 8.5 vs 8.6 tấn/ha)
+NUMERIC_TOLERANCE = 0.05
+
+# Số đứng riêng (không dính chữ/số phía trước, nên "ST25" không phải số liệu)
+_NUMBER_RE = re.compile(r"(?<!\w)\d+(?:[.,]\d+)?")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa L2 từng hàng (dot product = cosine)."""
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _new_verdict(relation: str, confidence: float, reasoning: str, backend: str) -> Dict:
+    """Kết quả judge (cùng format với NLI Judge) do backend tự quyết."""
+    return {
+        "relation": relation,
+        "confidence": confidence,
+        "reasoning": reasoning,
+        "from_cache": False,
+        "backend": backend,
+    }
+
+
+class JudgeBackend:
+    """
+    Interface của judge backend.
+
+    Attributes
+    ----------
+    name: str
+        Tên backend (ghi vào debug/kết quả).
+    support_threshold: float
+        Cosine tối thiểu (theo không gian vector của backend) để kết luận SUPPORTED.
+    similarity_label: str
+        Nhãn dùng trong reasoning khi kết luận SUPPORTED theo similarity.
+    """
+
+    name = "base"
+    support_threshold = EMBEDDING_SUPPORT_THRESHOLD
+    similarity_label = "Giá trị tương đồng cao"
+
+    def available(self) -> bool:
+        """Backend dùng được trong môi trường hiện tại (VD: có API key)."""
+        return True
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Ma trận float32 shape (len(texts), dim) đã chuẩn hóa L2; raise nếu lỗi."""
+        raise NotImplementedError
+
+    def claim_text(self, claim: AgriClaim) -> str:
+        """Text đại diện cho claim khi clustering."""
+        return f"{claim.subject} - {claim.predicate}: {claim.object or ''}"
+
+    def judge_pairs(self, pairs: Sequence[Tuple[AgriClaim, AgriClaim]]) -> Optional[List[Dict]]:
+        """
+        Phán quyết các cặp claims mơ hồ (cùng subject/predicate, object khác nhau).
+        None = backend không có NLI riêng, judge gửi các cặp tới LLM.
+        """
+        return None
+
+
+class GeminiJudgeBackend(JudgeBackend):
+    """Embedding Gemini (client registry + embedding cache on-disk), NLI do LLM đảm nhận."""
+
+    name = "gemini"
+    support_threshold = EMBEDDING_SUPPORT_THRESHOLD
+    similarity_label = "Giá trị tương đồng cao"
+
+    def __init__(self, model: str = GEMINI_EMBEDDING_MODEL) -> None:
+        self.model = model
+        self._cache: Optional[EmbeddingCache] = None
+        self._cache_lock = threading.Lock()
+
+    def available(self) -> bool:
+        from src.utils.llm_router import get_llm_router
+
+        return len(get_llm_router()) > 0
+
+    def embedding_model(self):
+        """Embedding client dùng chung (client registry), None nếu chưa có API key."""
+        from src.utils.llm_clients import get_client_registry
+        from src.utils.llm_router import get_llm_router
+
+        try:
+            api_key = get_llm_router().primary.api_key
+            return get_client_registry().embeddings(self.model, api_key)
+        except Exception:
+            return None
+
+    def cache(self) -> Optional[EmbeddingCache]:
+        """Embedding cache on-disk của model (None nếu không mở được)."""
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    try:
+                        self._cache = EmbeddingCache(self.model)
+                    except Exception:
+                        return None
+        return self._cache
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed qua cache; các text chưa có được embed trong một lần
+        `embed_documents`. Raise nếu chưa có API key hoặc API lỗi.
+        """
+        embedding_model = self.embedding_model()
+        if embedding_model is None:
+            raise RuntimeError("Chưa có API key cho embedding Gemini")
+        return _normalize_rows(embed_with_cache(list(texts), embedding_model, self.cache()))
+
+
+class LocalNgramBackend(JudgeBackend):
+    """
+    Backend offline: vector char n-gram băm (hashing trick) + NLI theo luật.
+
+    Parameters
+    ----------
+    n_features: int
+        Số chiều vector (số bucket băm n-gram).
+    ngram_range: Tuple[int, int]
+        Độ dài n-gram ký tự (min, max).
+    """
+
+    name = "local"
+    support_threshold = TEXT_SUPPORT_THRESHOLD
+    similarity_label = "Giá trị tương đồng"
+
+    def __init__(self, n_features: int = 4096, ngram_range: Tuple[int, int] = (2, 4)) -> None:
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+
+    def _hash_ids(self, text: str) -> np.ndarray:
+        """Bucket của mọi char n-gram trong text (đã chuẩn hóa, đệm khoảng trắng hai đầu)."""
+        padded = f" {normalize_text(text)} "
+        low, high = self.ngram_range
+        ids = [
+            zlib.crc32(padded[i:i + n].encode("utf-8"))
+            for n in range(low, high + 1)
+            for i in range(len(padded) - n + 1)
+        ]
+        return np.asarray(ids, dtype=np.int64) % self.n_features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Vector TF sublinear (1 + log tf) của char n-gram, chuẩn hóa L2."""
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            ids = self._hash_ids(text)
+            if ids.size == 0:
+                continue
+            buckets, counts = np.unique(ids, return_counts=True)
+            matrix[row, buckets] = 1.0 + np.log(counts)
+        return _normalize_rows(matrix)
+
+    def claim_text(self, claim: AgriClaim) -> str:
+        """Chỉ object: subject/predicate chung của nhóm làm cosine n-gram cao giả tạo."""
+        return claim.object or ""
+
+    def similarity(self, text1: str, text2: str) -> float:
+        """Cosine char n-gram giữa hai text."""
+        vectors = self.embed([text1, text2])
+        return float(vectors[0] @ vectors[1])
+
+    def _judge_numbers(self, claim1: AgriClaim, claim2: AgriClaim) -> Optional[Dict]:
+        """
+        So sánh số liệu (đã quy về đơn vị chuẩn): cùng đại lượng mà xấp xỉ hoặc
+        khoảng giao nhau là SUPPORTED, lệch là CONTRADICTED.
+        """
+        value1 = claim1.numeric_value()
+        value2 = claim2.numeric_value()
+        if value1 is None or value2 is None or value1.unit_key != value2.unit_key:
+            return None  # Không có số hoặc khác đại lượng/đơn vị: không so sánh được
+        if value1.dimension is None:
+            # Đơn vị lạ: chỉ so sánh khi phần chữ quanh số gần như giống nhau
+            rest1 = _NUMBER_RE.sub(" ", claim1.object or "")
+            rest2 = _NUMBER_RE.sub(" ", claim2.object or "")
+            if normalize_text(rest1) != normalize_text(rest2) and self.similarity(rest1, rest2) < 0.8:
+                return None
+        scale = max(abs(value1.value), abs(value2.value), 1e-9)
+        overlap = value1.low <= value2.high and value2.low <= value1.high
+        if overlap or abs(value1.value - value2.value) / scale <= NUMERIC_TOLERANCE:
+            return _new_verdict("SUPPORTED", 0.8, "Số liệu xấp xỉ (backend local)", self.name)
+        return _new_verdict("CONTRADICTED", 0.6, "Cùng đơn vị nhưng số liệu khác nhau (backend local)", self.name)
+
+    def judge_pairs(self, pairs: Sequence[Tuple[AgriClaim, AgriClaim]]) -> List[Dict]:
+        """NLI theo luật: số liệu cùng đơn vị, rồi cặp từ khóa mâu thuẫn, còn lại NEUTRAL."""
+        results: List[Dict] = []
+        for claim1, claim2 in pairs:
+            obj1 = (claim1.object or "").strip()
+            obj2 = (claim2.object or "").strip()
+            verdict = self._judge_numbers(claim1, claim2) if obj1 and obj2 else None
+            if verdict is None:
+                lower1, lower2 = obj1.lower(), obj2.lower()
+                for kw1, kw2 in CONTRADICTION_KEYWORDS:
+                    if (kw1 in lower1 and kw2 in lower2) or (kw2 in lower1 and kw1 in lower2):
+                        verdict = _new_verdict(
+                            "CONTRADICTED", 0.7, f"Phát hiện từ khóa mâu thuẫn: {kw1} vs {kw2}", self.name
+                        )
+                        break
+            if verdict is None:
+                verdict = _new_verdict("NEUTRAL", 0.5, "Không đủ căn cứ kết luận (backend local)", self.name)
+            results.append(verdict)
+        return results
+
+
+_backends: Dict[str, JudgeBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def _get_backend(name: str) -> JudgeBackend:
+    if name not in _backends:
+        with _backends_lock:
+            if name not in _backends:
+                _backends[name] = GeminiJudgeBackend() if name == "gemini" else LocalNgramBackend()
+    return _backends[name]
+
+
+def get_gemini_backend() -> GeminiJudgeBackend:
+    """Backend Gemini dùng chung (một embedding cache cho toàn process)."""
+    return _get_backend("gemini")  # type: ignore[return-value]
+
+
+def get_local_backend() -> LocalNgramBackend:
+    """Backend local dùng chung (fallback khi backend chính lỗi)."""
+    return _get_backend("local")  # type: ignore[return-value]
+
+
+def get_judge_backend() -> JudgeBackend:
+    """
+    Lấy judge backend theo AGRI_JUDGE_BACKEND. Chế độ auto chọn Gemini khi có
+    API key, ngược lại chạy offline bằng backend local.
+    """
+    mode = os.getenv("AGRI_JUDGE_BACKEND", "auto").strip().lower()
+    if mode == "local":
+        return get_local_backend()
+    gemini = get_gemini_backend()
+    if mode == "gemini" or gemini.available():
+        return gemini
+    return get_local_backend()
+
+
+__all__ = [
+    "CONTRADICTION_KEYWORDS",
+    "EMBEDDING_SUPPORT_THRESHOLD",
+    "GEMINI_EMBEDDING_MODEL",
+    "GeminiJudgeBackend",
+    "JudgeBackend",
+    "LocalNgramBackend",
+    "TEXT_SUPPORT_THRESHOLD",
+    "get_gemini_backend",
+    "get_judge_backend",
+    "get_local_backend",
+]
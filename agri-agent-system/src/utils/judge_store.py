@@ -0,0 +1,175 @@
+"""
+Judgement store: lưu kết quả NLI Judge trong một file SQLite duy nhất.
+
+Thay cho cách cũ (mỗi cặp claim một file `.pkl` trong `data/judge_cache/`):
+- Một bảng có khóa chính (pair_key, version) -> tra cứu bằng index, không stat/open file.
+- Đọc/ghi theo lô (`get_many` / `put_many`) trong một transaction.
+- Cột `version` (hash của prompt + model) để vô hiệu hóa verdict cũ khi prompt đổi.
+- WAL mode: FastAPI wiki và Streamlit có thể dùng chung file cùng lúc.
+"""
+
+from __future__ import annotations
+
+import pickle
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from src.utils.sqlite_store import SQLiteStore
+
+
+# SQLite giới hạn số tham số trong một câu lệnh (mặc định 999 ở bản cũ)
+_MAX_SQL_PARAMS = 900
+
+# Version của verdict nhập từ file `.pkl` cũ: không biết prompt/model đã tạo ra
+# chúng nên không bao giờ khớp version hiện tại (giữ lại để tra cứu thủ công).
+LEGACY_VERSION = "legacy"
+
+
+class JudgeStore(SQLiteStore):
+    """
+    Store kết quả judge theo cặp claim.
+
+    Parameters
+    ----------
+    path: str | Path
+        File SQLite.
+    version: str
+        Phiên bản verdict hiện tại (VD: hash prompt + model). Chỉ các bản ghi
+        cùng version mới được trả về.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS judgements (
+            pair_key TEXT NOT NULL,
+            version TEXT NOT NULL,
+            relation TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            reasoning TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (pair_key, version)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_judgements_version ON judgements(version)",
+        """
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+    )
+
+    def __init__(self, path: Union[str, Path], version: str) -> None:
+        super().__init__(path)
+        self.version = version
+
+    @staticmethod
+    def _row_to_result(row: Tuple) -> Dict:
+        return {
+            "relation": row[0],
+            "confidence": row[1],
+            "reasoning": row[2] or "",
+            "from_cache": False,
+        }
+
+    def get(self, pair_key: str) -> Optional[Dict]:
+        """Lấy verdict của một cặp (None nếu chưa có hoặc khác version)."""
+        row = self.conn.execute(
+            "SELECT relation, confidence, reasoning FROM judgements WHERE pair_key = ? AND version = ?",
+            (pair_key, self.version),
+        ).fetchone()
+        return self._row_to_result(row) if row else None
+
+    def get_many(self, pair_keys: Iterable[str]) -> Dict[str, Dict]:
+        """Lấy verdict của nhiều cặp bằng ít câu truy vấn nhất có thể."""
+        keys = list(dict.fromkeys(pair_keys))
+        found: Dict[str, Dict] = {}
+        for start in range(0, len(keys), _MAX_SQL_PARAMS):
+            batch = keys[start:start + _MAX_SQL_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT pair_key, relation, confidence, reasoning FROM judgements "
+                f"WHERE version = ? AND pair_key IN ({placeholders})",
+                (self.version, *batch),
+            ).fetchall()
+            for row in rows:
+                found[row[0]] = self._row_to_result(row[1:])
+        return found
+
+    def put(self, pair_key: str, result: Dict) -> None:
+        """Lưu verdict của một cặp."""
+        self.put_many([(pair_key, result)])
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]], version: Optional[str] = None) -> None:
+        """Lưu nhiều verdict trong một transaction (mặc định dưới version hiện tại)."""
+        now = time.time()
+        version = self.version if version is None else version
+        rows: List[Tuple] = [
+            (
+                pair_key,
+                version,
+                result.get("relation", "NEUTRAL"),
+                float(result.get("confidence", 0.5)),
+                result.get("reasoning", ""),
+                now,
+            )
+            for pair_key, result in items
+        ]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO judgements "
+                "(pair_key, version, relation, confidence, reasoning, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def invalidate_stale(self) -> int:
+        """Xóa các verdict thuộc version cũ. Trả về số bản ghi đã xóa."""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM judgements WHERE version != ?", (self.version,))
+        return cursor.rowcount
+
+    def count(self) -> int:
+        """Số verdict của version hiện tại."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM judgements WHERE version = ?", (self.version,)
+        ).fetchone()[0]
+
+    def import_legacy_pickles(self, cache_dir: Union[str, Path]) -> int:
+        """
+        Nhập các file `<pair_key>.pkl` cũ vào store (chỉ chạy một lần).
+
+        Verdict cũ được lưu dưới `LEGACY_VERSION` (không phải version hiện tại)
+        vì không rõ prompt/model đã tạo ra chúng, nên `get`/`get_many` không bao
+        giờ trả về chúng. Các file pickle được giữ nguyên trên đĩa; lần gọi sau
+        sẽ bỏ qua nhờ cờ `legacy_pickles_imported` trong bảng store_meta.
+        """
+        marker = self.conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'legacy_pickles_imported'"
+        ).fetchone()
+        if marker:
+            return 0
+
+        items: List[Tuple[str, Dict]] = []
+        for pkl_file in Path(cache_dir).glob("*.pkl"):
+            try:
+                with open(pkl_file, "rb") as f:
+                    result = pickle.load(f)
+            except Exception:
+                continue
+            if isinstance(result, dict) and "relation" in result:
+                items.append((pkl_file.stem, result))
+
+        self.put_many(items, version=LEGACY_VERSION)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('legacy_pickles_imported', ?)",
+                (str(time.time()),),
+            )
+        return len(items)
+
+
+__all__ = ["LEGACY_VERSION", "JudgeStore"]
@@ -0,0 +1,145 @@
+"""
+Client registry: Gemini client (chat, embedding) được tạo một lần và dùng lại.
+
+Tạo `ChatGoogleGenerativeAI` / `GoogleGenerativeAIEmbeddings` tốn ~50-150 ms
+(validate cấu hình, tạo `genai.Client`, HTTP session, auth), nên không tạo mới
+cho mỗi chunk / mỗi lần judge / mỗi lần clustering nữa:
+- Lazy: client chỉ được tạo ở lần dùng đầu tiên (chunk đã cache không tạo client nào).
+- Dùng chung giữa các lần gọi và các thread.
+- Connection pooling: mỗi (model, key) có một `genai.Client` với HTTP pool
+  keep-alive (httpx); các biến thể temperature là bản copy nông dùng chung
+  client đó, nên hàng nghìn lần judge chỉ dùng một tập connection đã "ấm".
+- `close()` đóng toàn bộ connection (VD: khi tắt app hoặc đổi API key).
+
+Cấu hình qua biến môi trường:
+- AGRI_LLM_MAX_CONNECTIONS: số connection tối đa của mỗi HTTP pool (mặc định 10)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+class ClientRegistry:
+    """
+    Registry thread-safe cho các Gemini client, khóa theo (model, API key[, temperature]).
+
+    Parameters
+    ----------
+    max_connections: int
+        Số connection tối đa của HTTP pool mỗi client (keep-alive bằng một nửa).
+    """
+
+    def __init__(self, max_connections: int = 10) -> None:
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._chat: Dict[Tuple[str, str, float], Any] = {}
+        self._chat_base: Dict[Tuple[str, str], Any] = {}
+        self._embeddings: Dict[Tuple[str, str], Any] = {}
+
+    def _client_args(self) -> Optional[Dict[str, Any]]:
+        """Tham số HTTP client (httpx) cho connection pool dùng chung."""
+        try:
+            import httpx
+        except ImportError:
+            return None
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=max(self.max_connections // 2, 1),
+            )
+        }
+
+    def chat(self, model: str, api_key: str, temperature: float):
+        """Chat client cho (model, key, temperature); tạo lần đầu, sau đó dùng lại."""
+        key = (model, api_key, float(temperature))
+        with self._lock:
+            client = self._chat.get(key)
+            if client is not None:
+                return client
+            base = self._chat_base.get((model, api_key))
+            if base is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                client = ChatGoogleGenerativeAI(
+                    model=model,
+                    api_key=api_key,
+                    temperature=temperature,
+                    client_args=self._client_args(),
+                )
+                self._chat_base[(model, api_key)] = client
+            else:
+                # Dùng chung genai.Client (và HTTP pool) với client gốc, chỉ khác temperature
+                client = base.model_copy(update={"temperature": temperature})
+            self._chat[key] = client
+            return client
+
+    def embeddings(self, model: str, api_key: str):
+        """Embedding client cho (model, key); tạo lần đầu, sau đó dùng lại."""
+        key = (model, api_key)
+        with self._lock:
+            client = self._embeddings.get(key)
+            if client is None:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+                client = GoogleGenerativeAIEmbeddings(
+                    model=model,
+                    google_api_key=api_key,
+                    client_args=self._client_args(),
+                )
+                self._embeddings[key] = client
+            return client
+
+    def stats(self) -> Dict[str, int]:
+        """Số client đang được giữ (theo loại)."""
+        with self._lock:
+            return {
+                "chat": len(self._chat),
+                "chat_connection_pools": len(self._chat_base),
+                "embeddings": len(self._embeddings),
+            }
+
+    def close(self) -> None:
+        """Đóng mọi HTTP connection và xóa các client (lần gọi sau sẽ tạo lại)."""
+        with self._lock:
+            owners = list(self._chat_base.values()) + list(self._embeddings.values())
+            self._chat.clear()
+            self._chat_base.clear()
+            self._embeddings.clear()
+        for owner in owners:
+            try:
+                owner.client.close()
+            except Exception:
+                pass
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_client_registry: Optional[ClientRegistry] = None
+_global_client_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """Lấy client registry dùng chung cho toàn process."""
+    global _global_client_registry
+    if _global_client_registry is None:
+        with _global_client_registry_lock:
+            if _global_client_registry is None:
+                _global_client_registry = ClientRegistry(
+                    max_connections=_env_int("AGRI_LLM_MAX_CONNECTIONS", 10)
+                )
+    return _global_client_registry
+
+
+__all__ = [
+    "ClientRegistry",
+    "get_client_registry",
+]
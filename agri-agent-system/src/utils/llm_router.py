@@ -0,0 +1,299 @@
+"""
+LLM router: phân phối request LLM trên nhiều endpoint (model, API key).
+
+Thay cho việc hard-code một model và đổi tay giữa flash / flash-lite / flash-latest
+mỗi khi hết quota:
+- Mỗi endpoint (model, key) có ngân sách RPM/RPD riêng. Endpoint đầu tiên dùng
+  ngân sách LLM toàn cục (`get_llm_budget`) nên cấu hình một key/một model
+  hoạt động y như trước.
+- Mỗi request chọn endpoint khỏe (không trong thời gian cooldown) đang ít tải
+  nhất (ít request đang chạy nhất, còn nhiều quota nhất).
+- Endpoint gặp lỗi 429 bị cooldown (theo retryDelay của API, mặc định 60s) và
+  request được chuyển ngay sang endpoint khác thay vì sleep 60-120s.
+- Client của mỗi endpoint được tạo lazy và dùng lại giữa các lần gọi (client registry).
+
+Cấu hình qua biến môi trường:
+- AGRI_LLM_MODELS: danh sách model, phân tách bằng dấu phẩy, theo thứ tự ưu tiên
+  (mặc định: gemini-2.5-flash)
+- GOOGLE_API_KEYS: danh sách API key, phân tách bằng dấu phẩy (mặc định: GOOGLE_API_KEY)
+- AGRI_LLM_RPM / AGRI_LLM_RPD: ngân sách của MỖI endpoint
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+from src.utils.llm_clients import get_client_registry
+from src.utils.rate_limiter import RequestBudget, SharedRequestBudget, get_llm_budget, new_llm_budget
+from src.utils.usage_ledger import record_llm_usage
+
+
+DEFAULT_LLM_MODEL = "gemini-2.5-flash"
+
+# Cooldown mặc định của endpoint vừa gặp lỗi 429 (giây)
+DEFAULT_COOLDOWN = 60.0
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """Lỗi 429 / RESOURCE_EXHAUSTED / quota của API."""
+    error_str = str(error)
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower()
+
+
+def retry_delay_hint(error: BaseException) -> Optional[float]:
+    """Số giây API yêu cầu chờ ("retry in Xs" / retryDelay) nếu có trong thông báo lỗi."""
+    error_str = str(error)
+    match = re.search(r"retry in ([\d.]+)s", error_str, re.IGNORECASE) or re.search(
+        r"'retryDelay':\s*'(\d+)s'", error_str
+    )
+    if not match:
+        return None
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return None
+
+
+@dataclass
+class LLMEndpoint:
+    """Một endpoint LLM: (model, API key) + ngân sách và trạng thái sức khỏe riêng."""
+
+    name: str
+    model: str
+    api_key: str = field(repr=False)
+    budget: Union[RequestBudget, SharedRequestBudget] = field(repr=False)
+    cooldown_until: float = 0.0
+    in_flight: int = 0
+    failures: int = 0
+
+    def healthy(self, now: Optional[float] = None) -> bool:
+        return self.cooldown_until <= (time.time() if now is None else now)
+
+    def client(self, temperature: float):
+        """Chat client của endpoint cho `temperature` (lấy từ client registry, dùng lại giữa các lần gọi)."""
+        return get_client_registry().chat(self.model, self.api_key, temperature)
+
+
+class LLMRouter:
+    """
+    Chọn endpoint cho từng request LLM và failover khi endpoint hết quota.
+
+    Dùng:
+        with router.lease() as endpoint:
+            response = endpoint.client(0.2).invoke(messages)
+    hoặc gọn hơn `router.invoke(messages, temperature=0.2)` (tự failover khi 429).
+    """
+
+    def __init__(self, endpoints: Sequence[LLMEndpoint], cooldown: float = DEFAULT_COOLDOWN) -> None:
+        self.endpoints: List[LLMEndpoint] = list(endpoints)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def primary(self) -> LLMEndpoint:
+        """Endpoint ưu tiên nhất (model/key đầu tiên trong cấu hình)."""
+        self._ensure_configured()
+        return self.endpoints[0]
+
+    @property
+    def models(self) -> List[str]:
+        """Các model trong pool theo thứ tự ưu tiên (không trùng lặp)."""
+        return list(dict.fromkeys(endpoint.model for endpoint in self.endpoints))
+
+    def _ensure_configured(self) -> None:
+        if not self.endpoints:
+            raise RuntimeError(
+                "GOOGLE_API_KEY chưa được thiết lập trong môi trường. "
+                "Hãy cấu hình API key (GOOGLE_API_KEY hoặc GOOGLE_API_KEYS) trước khi gọi LLM."
+            )
+
+    def _pool(self, model: Optional[str]) -> List[LLMEndpoint]:
+        """Endpoint được phép dùng: mọi endpoint, hoặc chỉ các endpoint của `model`."""
+        if model is None:
+            return self.endpoints
+        return [endpoint for endpoint in self.endpoints if endpoint.model == model]
+
+    def has_available_endpoint(self, model: Optional[str] = None) -> bool:
+        """Còn endpoint (của `model` nếu có) không bị cooldown."""
+        now = time.time()
+        with self._lock:
+            return any(endpoint.healthy(now) for endpoint in self._pool(model))
+
+    def remaining_today(self) -> Optional[int]:
+        """Tổng quota ngày còn lại của mọi endpoint (None = không giới hạn hoặc chưa cấu hình)."""
+        if not self.endpoints:
+            return None
+        total = 0
+        for endpoint in self.endpoints:
+            remaining = endpoint.budget.remaining_today()
+            if remaining is None:
+                return None
+            total += remaining
+        return total
+
+    def acquire(self, timeout: Optional[float] = None, model: Optional[str] = None) -> Optional[LLMEndpoint]:
+        """
+        Chọn endpoint khỏe, ít tải nhất và lấy 1 token từ ngân sách của nó.
+
+        Chờ (tối đa `timeout`) nếu mọi endpoint đều tạm hết token RPM hoặc đang
+        cooldown. Trả về None nếu mọi endpoint đã hết quota ngày hoặc hết `timeout`.
+        `model` giới hạn việc chọn trong các endpoint (key) của model đó, dùng khi
+        kết quả được cache theo model.
+        """
+        self._ensure_configured()
+        pool = self._pool(model)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait_time: Optional[float] = None
+            with self._lock:
+                now = time.time()
+                candidates = sorted(
+                    (e for e in pool if e.healthy(now)),
+                    key=lambda e: (e.in_flight, -(e.budget.remaining_today() or 0)),
+                )
+                for endpoint in candidates:
+                    granted, wait = endpoint.budget.try_acquire()
+                    if granted:
+                        endpoint.in_flight += 1
+                        return endpoint
+                    if wait is not None:
+                        wait_time = wait if wait_time is None else min(wait_time, wait)
+                # Endpoint đang cooldown nhưng còn quota ngày: chờ đến khi hết cooldown
+                for endpoint in pool:
+                    if not endpoint.healthy(now) and endpoint.budget.remaining_today() != 0:
+                        cooldown_left = endpoint.cooldown_until - now
+                        wait_time = cooldown_left if wait_time is None else min(wait_time, cooldown_left)
+
+            if wait_time is None:
+                return None  # Mọi endpoint đều hết quota ngày
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait_time = min(wait_time, remaining)
+            time.sleep(max(wait_time, 0.0))
+
+    def release(self, endpoint: LLMEndpoint, error: Optional[BaseException] = None) -> None:
+        """
+        Trả endpoint sau khi gọi xong. Lỗi quota (429) đưa endpoint vào cooldown
+        (theo retryDelay của API nếu có) để các request sau chuyển sang endpoint khác.
+        """
+        with self._lock:
+            endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+            if error is None:
+                endpoint.failures = 0
+                return
+            if is_quota_error(error):
+                endpoint.failures += 1
+                cooldown = retry_delay_hint(error) or self.cooldown
+                endpoint.cooldown_until = max(endpoint.cooldown_until, time.time() + cooldown)
+                print(f"⚠️ {endpoint.name}: lỗi 429, tạm ngưng {cooldown:.0f}s và chuyển sang endpoint khác")
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None, model: Optional[str] = None) -> Iterator[LLMEndpoint]:
+        """Context manager: acquire endpoint, tự release (kèm lỗi nếu có) khi thoát."""
+        endpoint = self.acquire(timeout=timeout, model=model)
+        if endpoint is None:
+            raise RuntimeError("Đã hết quota LLM trong ngày trên mọi endpoint (AGRI_LLM_RPD)")
+        try:
+            yield endpoint
+        except BaseException as e:
+            self.release(endpoint, error=e)
+            raise
+        else:
+            self.release(endpoint)
+
+    def invoke(
+        self,
+        messages: list,
+        temperature: float,
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+    ):
+        """
+        Gọi `invoke` trên endpoint tốt nhất (chỉ trong các key của `model` nếu có);
+        gặp 429 thì thử ngay endpoint khác (mỗi endpoint tối đa một lần).
+        Usage được ghi vào ledger theo model thực tế.
+        """
+        last_error: Optional[BaseException] = None
+        for _attempt in range(max(len(self._pool(model)), 1)):
+            try:
+                with self.lease(timeout=timeout, model=model) as endpoint:
+                    response = endpoint.client(temperature).invoke(messages)
+                    record_llm_usage(endpoint.model, response)
+                    return response
+            except Exception as e:
+                if not is_quota_error(e) or not self.has_available_endpoint(model):
+                    raise
+                last_error = e
+        raise last_error  # type: ignore[misc]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Trạng thái từng endpoint (không chứa API key) cho debug/UI."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "name": e.name,
+                    "model": e.model,
+                    "healthy": e.healthy(now),
+                    "cooldown_left": round(max(e.cooldown_until - now, 0.0), 1),
+                    "in_flight": e.in_flight,
+                    "remaining_today": e.budget.remaining_today(),
+                }
+                for e in self.endpoints
+            ]
+
+
+def _env_list(name: str) -> List[str]:
+    """Đọc biến môi trường dạng danh sách phân tách bằng dấu phẩy."""
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def build_endpoints(models: Sequence[str], api_keys: Sequence[str]) -> List[LLMEndpoint]:
+    """Tạo endpoint cho mọi cặp (model, key); endpoint đầu tiên dùng ngân sách LLM toàn cục."""
+    endpoints: List[LLMEndpoint] = []
+    for model in dict.fromkeys(models):
+        for api_key in dict.fromkeys(api_keys):
+            fingerprint = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+            name = f"{model}#{fingerprint}"
+            budget = get_llm_budget() if not endpoints else new_llm_budget(f"llm:{name}")
+            endpoints.append(LLMEndpoint(name=name, model=model, api_key=api_key, budget=budget))
+    return endpoints
+
+
+_global_llm_router: Optional[LLMRouter] = None
+_global_llm_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    """Lấy LLM router dùng chung cho toàn process (cấu hình từ biến môi trường)."""
+    global _global_llm_router
+    if _global_llm_router is None or not _global_llm_router.endpoints:
+        with _global_llm_router_lock:
+            if _global_llm_router is None or not _global_llm_router.endpoints:
+                models = _env_list("AGRI_LLM_MODELS") or [DEFAULT_LLM_MODEL]
+                api_keys = _env_list("GOOGLE_API_KEYS") or _env_list("GOOGLE_API_KEY")
+                _global_llm_router = LLMRouter(build_endpoints(models, api_keys))
+    return _global_llm_router
+
+
+__all__ = [
+    "DEFAULT_LLM_MODEL",
+    "LLMEndpoint",
+    "LLMRouter",
+    "build_endpoints",
+    "get_llm_router",
+    "is_quota_error",
+    "retry_delay_hint",
+]
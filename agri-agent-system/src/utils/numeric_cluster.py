@@ -0,0 +1,134 @@
+"""
+Clustering 1-D cho giá trị số của claims (resolver).
+
+Thay cho sort-and-sweep với tâm cụm tính lại `sum(...) / len(...)` sau mỗi lần
+thêm (O(k²) theo kích thước cụm) và để chuỗi giá trị "trôi" dần
+(100, 104, 108, ...) bị nuốt vào một cụm:
+- Sắp xếp một lần bằng NumPy (`np.sort`); mỗi cụm bắt đầu tại giá trị nhỏ nhất còn lại `a`
+  và nhận mọi giá trị <= a·(1+tol)/(1-tol) (tìm bằng `searchsorted`), nên mọi
+  phần tử nằm trong ±tol quanh trung điểm cụm và cụm không thể trôi.
+- Tổng/số phần tử của từng cụm tính bằng `np.add.reduceat` (không tính lại trung bình).
+- Sai số cho phép cấu hình được theo predicate và theo đại lượng/đơn vị.
+- Sai số tuyệt đối tối thiểu để các giá trị quanh 0 (0, 0.01, -0.02) không bị
+  tách thành từng cụm riêng như khi chỉ dùng sai số tương đối.
+
+Cấu hình qua biến môi trường:
+- AGRI_NUMERIC_TOLERANCES: sai số tương đối theo predicate hoặc đại lượng
+  (unit_key của `NumericValue`), VD: "yield=0.05,duration=0.1,thời gian sinh trưởng=0.08"
+- AGRI_NUMERIC_ABS_TOLERANCES: sai số tuyệt đối (đơn vị chuẩn của đại lượng)
+  theo predicate hoặc đại lượng, VD: "duration=1,percent=0.5"
+"""
+
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+# Sai số tương đối mặc định giữa các giá trị cùng cụm (VD: 8.0 và 8.3 tấn/ha)
+DEFAULT_NUMERIC_TOLERANCE = 0.05
+# Sai số tuyệt đối mặc định (quanh 0 sai số tương đối không còn ý nghĩa)
+DEFAULT_NUMERIC_ABS_TOLERANCE = 0.05
+
+
+def cluster_numeric_values(
+    values: Union[Sequence[float], np.ndarray],
+    tolerance: float = DEFAULT_NUMERIC_TOLERANCE,
+    abs_tolerance: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gom cụm các giá trị 1-D theo sai số tương đối `tolerance` quanh tâm cụm.
+
+    Parameters
+    ----------
+    values: Sequence[float] | np.ndarray
+        Giá trị (cùng đơn vị) cần gom cụm.
+    tolerance: float
+        Sai số tương đối tối đa của mỗi phần tử so với trung điểm cụm.
+    abs_tolerance: float
+        Độ rộng tuyệt đối tối thiểu của cụm (cho các giá trị quanh 0).
+
+    Returns
+    -------
+    (labels, centroids)
+        labels[i] = cụm của values[i] (cụm đánh số theo giá trị tăng dần),
+        centroids[c] = trung bình các giá trị của cụm c.
+    """
+    arr = np.asarray(values, dtype=np.float64).ravel()
+    n = arr.size
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+    sorted_values = np.sort(arr)
+    ratio = (1.0 + tolerance) / (1.0 - tolerance) if tolerance < 1.0 else np.inf
+
+    starts = []
+    i = 0
+    while i < n:
+        anchor = sorted_values[i]
+        # Cận trên của cụm: |anchor|·ratio về phía dương (anchor âm thì chia để tiến về 0)
+        limit = anchor * ratio if anchor >= 0 else anchor / ratio
+        limit = max(limit, anchor + abs_tolerance)
+        starts.append(i)
+        i = max(int(np.searchsorted(sorted_values, limit, side="right")), i + 1)
+
+    start_idx = np.asarray(starts, dtype=np.int64)
+    counts = np.diff(np.append(start_idx, n))
+    centroids = np.add.reduceat(sorted_values, start_idx) / counts
+
+    # Cụm là các đoạn giá trị liên tiếp: nhãn = đoạn chứa giá trị (không cần argsort)
+    labels = np.searchsorted(sorted_values[start_idx], arr, side="right") - 1
+    return labels.astype(np.int64, copy=False), centroids
+
+
+@lru_cache(maxsize=8)
+def _parse_tolerances(raw: str, upper: float = 1.0) -> Dict[str, float]:
+    """Parse "khóa=giá trị,..." (khóa chữ thường); bỏ qua mục không hợp lệ hoặc ngoài [0, upper)."""
+    tolerances: Dict[str, float] = {}
+    for item in raw.split(","):
+        key, sep, value = item.partition("=")
+        if not sep or not key.strip():
+            continue
+        try:
+            tolerance = float(value)
+        except ValueError:
+            continue
+        if 0.0 <= tolerance < upper:
+            tolerances[key.strip().lower()] = tolerance
+    return tolerances
+
+
+def numeric_tolerance(predicate: Optional[str] = None, unit_key: Optional[str] = None) -> float:
+    """
+    Sai số tương đối cho một nhóm claims: theo predicate, rồi theo đại lượng/đơn vị
+    (AGRI_NUMERIC_TOLERANCES), cuối cùng là DEFAULT_NUMERIC_TOLERANCE.
+    """
+    tolerances = _parse_tolerances(os.getenv("AGRI_NUMERIC_TOLERANCES", ""))
+    for key in (predicate, unit_key):
+        if key and key.strip().lower() in tolerances:
+            return tolerances[key.strip().lower()]
+    return DEFAULT_NUMERIC_TOLERANCE
+
+
+def numeric_abs_tolerance(predicate: Optional[str] = None, unit_key: Optional[str] = None) -> float:
+    """
+    Sai số tuyệt đối cho một nhóm claims: theo predicate, rồi theo đại lượng/đơn vị
+    (AGRI_NUMERIC_ABS_TOLERANCES), cuối cùng là DEFAULT_NUMERIC_ABS_TOLERANCE.
+    """
+    tolerances = _parse_tolerances(os.getenv("AGRI_NUMERIC_ABS_TOLERANCES", ""), float("inf"))
+    for key in (predicate, unit_key):
+        if key and key.strip().lower() in tolerances:
+            return tolerances[key.strip().lower()]
+    return DEFAULT_NUMERIC_ABS_TOLERANCE
+
+
+__all__ = [
+    "DEFAULT_NUMERIC_ABS_TOLERANCE",
+    "DEFAULT_NUMERIC_TOLERANCE",
+    "cluster_numeric_values",
+    "numeric_abs_tolerance",
+    "numeric_tolerance",
+]
@@ -0,0 +1,200 @@
+"""
+Numeric value parser: tách (giá trị, khoảng, đơn vị) từ object của claim.
+
+Thay cho việc `re.findall` mọi số trong chuỗi rồi lấy trung bình (nên
+"8.5 tấn/ha vụ 2019" thành 1013.75):
+- Regex được compile một lần; kết quả parse được cache theo chuỗi (LRU) và
+  lưu trên chính claim (`AgriClaim.numeric_value()`), nên mỗi claim chỉ parse một lần.
+- Ưu tiên số/khoảng đi kèm đơn vị đã biết; số dạng năm (1900-2100) không kèm
+  đơn vị đã biết chỉ được dùng khi không còn số nào khác.
+- Đơn vị đã biết được quy về đơn vị chuẩn của cùng đại lượng (tấn/ha ↔ tạ/ha ↔
+  kg/ha, ngày ↔ tuần ↔ tháng ↔ năm, ...) để clustering so sánh cùng đơn vị.
+- Dấu phân cách: một dấu `.`/`,` theo sau đúng 3 chữ số ("1.000", "12.500",
+  "1,000") là phân cách hàng nghìn; còn lại là dấu thập phân ("8,5", "0.125").
+- Số thuộc ngày tháng ("tháng 3 năm 2020", "ngày 15 tháng 6") không bị đọc
+  thành thời gian ("3 năm"); năm sau chữ "năm" chỉ dùng như số dạng năm.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+
+# Đơn vị đã biết: tên (chữ thường, NFC) -> (đại lượng, hệ số quy về đơn vị chuẩn)
+UNITS: Dict[str, Tuple[str, float]] = {
+    # Năng suất (chuẩn: tấn/ha)
+    "tấn/ha": ("yield", 1.0),
+    "tấn/hecta": ("yield", 1.0),
+    "t/ha": ("yield", 1.0),
+    "tạ/ha": ("yield", 0.1),
+    "yến/ha": ("yield", 0.01),
+    "kg/ha": ("yield", 0.001),
+    # Khối lượng (chuẩn: kg)
+    "tấn": ("mass", 1000.0),
+    "tạ": ("mass", 100.0),
+    "yến": ("mass", 10.0),
+    "kg": ("mass", 1.0),
+    "gam": ("mass", 0.001),
+    "g": ("mass", 0.001),
+    # Thời gian (chuẩn: ngày)
+    "ngày": ("duration", 1.0),
+    "tuần": ("duration", 7.0),
+    "tháng": ("duration", 30.0),
+    "năm": ("duration", 365.0),
+    # Chiều dài (chuẩn: cm)
+    "mm": ("length", 0.1),
+    "cm": ("length", 1.0),
+    "m": ("length", 100.0),
+    # Tỷ lệ
+    "%": ("percent", 1.0),
+}
+
+# Đơn vị chuẩn của từng đại lượng
+CANONICAL_UNITS: Dict[str, str] = {
+    "yield": "tấn/ha",
+    "mass": "kg",
+    "duration": "ngày",
+    "length": "cm",
+    "percent": "%",
+}
+
+_NUMBER = r"\d+(?:[.,]\d+)*"
+_KNOWN_UNIT = "|".join(re.escape(u) for u in sorted(UNITS, key=len, reverse=True))
+_QUANTITY_RE = re.compile(
+    rf"(?<![\w.,])(?P<low>{_NUMBER})"
+    rf"(?:\s*(?:-|–|—|~|đến|tới)\s*(?P<high>{_NUMBER}))?"
+    rf"\s*(?:(?P<unit>(?:{_KNOWN_UNIT})(?!\w))|(?P<raw>%|[^\W\d_]+(?:/[^\W\d_]+)?))?",
+    re.IGNORECASE,
+)
+_SLASH_RE = re.compile(r"\s*/\s*")
+# Một dấu phân cách theo sau đúng 3 chữ số (phần nguyên không bắt đầu bằng 0): hàng nghìn
+_THOUSANDS_GROUP_RE = re.compile(r"[1-9]\d{0,2}[.,]\d{3}")
+# Từ chỉ ngày tháng: "tháng 3", "năm 2020" là mốc thời gian, không phải "3 tháng"
+_DATE_WORDS = ("ngày", "tháng", "năm")
+_DATE_PREFIX_RE = re.compile(r"(?<!\w)(ngày|tháng|năm)\s*$")
+_LEADING_NUMBER_RE = re.compile(r"\s*\d")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class NumericValue:
+    """
+    Giá trị số đã parse của một claim.
+
+    value/low/high theo `unit` (đơn vị chuẩn nếu đơn vị đã biết, ngược lại
+    giữ nguyên đơn vị gốc); value là trung điểm nếu là khoảng.
+    """
+
+    value: float
+    low: float
+    high: float
+    unit: Optional[str] = None
+    dimension: Optional[str] = None
+
+    @property
+    def is_range(self) -> bool:
+        return self.high > self.low
+
+    @property
+    def unit_key(self) -> str:
+        """Khóa so sánh: chỉ các giá trị cùng khóa mới so sánh/cluster với nhau."""
+        if self.dimension is not None:
+            return self.dimension
+        return f"raw:{self.unit or ''}"
+
+    def convert(self, unit: str) -> Optional[float]:
+        """Giá trị theo `unit` (cùng đại lượng), None nếu không quy đổi được."""
+        return convert_value(self.value, self.unit or "", unit)
+
+
+def _to_float(number: str) -> Optional[float]:
+    """'8,5' -> 8.5; '1.000' / '1,000' / '1.000.000' / '1.250,5' -> phân cách hàng nghìn."""
+    if _THOUSANDS_GROUP_RE.fullmatch(number):
+        number = number.replace(".", "").replace(",", "")
+    elif "." in number and "," in number:
+        decimal = "." if number.rfind(".") > number.rfind(",") else ","
+        thousands = "," if decimal == "." else "."
+        number = number.replace(thousands, "").replace(decimal, ".")
+    elif number.count(".") > 1 or number.count(",") > 1:
+        number = number.replace(".", "").replace(",", "")
+    else:
+        number = number.replace(",", ".")
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def _is_year(value: float) -> bool:
+    return value.is_integer() and 1900 <= value <= 2100
+
+
+def convert_value(value: float, from_unit: str, to_unit: str) -> Optional[float]:
+    """Quy đổi giá trị giữa hai đơn vị cùng đại lượng (VD: tạ/ha -> tấn/ha)."""
+    source = UNITS.get(from_unit.lower())
+    target = UNITS.get(to_unit.lower())
+    if source is None or target is None or source[0] != target[0]:
+        return None
+    return value * source[1] / target[1]
+
+
+@lru_cache(maxsize=8192)
+def parse_numeric_value(text: Optional[str]) -> Optional[NumericValue]:
+    """
+    Parse giá trị số đại diện của chuỗi (VD: '8.5 tấn/ha', '95-100 ngày', '3-4 tháng').
+
+    Chọn số/khoảng đầu tiên có đơn vị đã biết, nếu không có thì số đầu tiên
+    không phải năm, cuối cùng mới đến năm. Trả về None nếu chuỗi không có số.
+    """
+    if not text:
+        return None
+    normalized = unicodedata.normalize("NFC", text).lower()
+    normalized = _WHITESPACE_RE.sub(" ", _SLASH_RE.sub("/", normalized))
+
+    fallback: Optional[NumericValue] = None
+    year_fallback: Optional[NumericValue] = None
+    for match in _QUANTITY_RE.finditer(normalized):
+        low = _to_float(match.group("low"))
+        high = _to_float(match.group("high")) if match.group("high") else low
+        if low is None or high is None:
+            continue
+        low, high = min(low, high), max(low, high)
+        unit = match.group("unit")
+
+        # Số trong ngày tháng: sau "ngày/tháng/năm" ("tháng 3"), hoặc trước
+        # "ngày/tháng/năm" + số ("3 năm 2020") -> không phải thời gian
+        prefix = _DATE_PREFIX_RE.search(normalized, max(0, match.start() - 8), match.start())
+        date_unit = unit in _DATE_WORDS and _LEADING_NUMBER_RE.match(normalized, match.end())
+        if prefix or date_unit:
+            if prefix and prefix.group(1) == "năm" and _is_year(low) and low == high:
+                year_fallback = year_fallback or NumericValue(value=low, low=low, high=high)
+            continue
+
+        if unit:
+            dimension, factor = UNITS[unit]
+            return NumericValue(
+                value=(low + high) / 2 * factor,
+                low=low * factor,
+                high=high * factor,
+                unit=CANONICAL_UNITS[dimension],
+                dimension=dimension,
+            )
+        candidate = NumericValue(value=(low + high) / 2, low=low, high=high, unit=match.group("raw"))
+        if _is_year(low) and low == high:
+            year_fallback = year_fallback or candidate
+        else:
+            fallback = fallback or candidate
+    return fallback or year_fallback
+
+
+__all__ = [
+    "CANONICAL_UNITS",
+    "NumericValue",
+    "UNITS",
+    "convert_value",
+    "parse_numeric_value",
+]
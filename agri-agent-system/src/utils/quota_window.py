@@ -0,0 +1,72 @@
+"""
+Cửa sổ quota ngày của Gemini: reset lúc 0h giờ Pacific (America/Los_Angeles).
+
+Dùng chung cho mọi bộ đếm theo ngày (UsageLedger, RequestBudget,
+SharedRequestBudget) để các con số mà AdmissionController so sánh luôn cùng
+một cửa sổ:
+- Tính bằng `zoneinfo` nên tự theo giờ mùa hè (PDT, UTC-7) / mùa đông (PST, UTC-8);
+  ngày chuyển giờ dài 23h hoặc 25h thay vì cố định 86400s.
+- Cửa sổ là ngày lịch (0h -> 0h hôm sau) chứ không phải 24h trượt kể từ
+  request đầu tiên.
+
+Cấu hình qua biến môi trường:
+- AGRI_QUOTA_RESET_TZ: múi giờ IANA của thời điểm reset quota (mặc định America/Los_Angeles)
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+QUOTA_RESET_TIMEZONE = "America/Los_Angeles"
+
+# Dùng khi không có dữ liệu múi giờ (Windows thiếu gói tzdata): giờ chuẩn Pacific
+_FALLBACK_TIMEZONE = timezone(timedelta(hours=-8), "UTC-08:00")
+
+
+@lru_cache(maxsize=8)
+def _load_timezone(name: str) -> tzinfo:
+    """ZoneInfo theo tên; fallback về UTC-8 cố định nếu không tìm thấy."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        pass
+    print(f"⚠️ Không tìm thấy múi giờ {name!r} (cài gói tzdata), dùng UTC-8 cố định cho quota ngày")
+    return _FALLBACK_TIMEZONE
+
+
+def quota_timezone() -> tzinfo:
+    """Múi giờ reset quota (AGRI_QUOTA_RESET_TZ, mặc định America/Los_Angeles)."""
+    return _load_timezone(os.getenv("AGRI_QUOTA_RESET_TZ", "").strip() or QUOTA_RESET_TIMEZONE)
+
+
+def quota_window(now: Optional[float] = None, tz: Optional[tzinfo] = None) -> Tuple[float, float]:
+    """
+    (bắt đầu, kết thúc) - epoch - của cửa sổ quota ngày chứa `now`.
+
+    Parameters
+    ----------
+    now: float
+        Thời điểm (epoch, mặc định `time.time()`).
+    tz: tzinfo
+        Múi giờ reset (mặc định `quota_timezone()`).
+    """
+    now = time.time() if now is None else now
+    tz = quota_timezone() if tz is None else tz
+    day = datetime.fromtimestamp(now, tz).date()
+    start = datetime(day.year, day.month, day.day, tzinfo=tz).timestamp()
+    next_day = day + timedelta(days=1)
+    end = datetime(next_day.year, next_day.month, next_day.day, tzinfo=tz).timestamp()
+    return start, end
+
+
+__all__ = [
+    "QUOTA_RESET_TIMEZONE",
+    "quota_timezone",
+    "quota_window",
+]
@@ -4,15 +4,29 @@ Rate Limiter và Circuit Breaker để tránh vượt rate limit API.
 Tính năng:
 - Rate Limiter: Giới hạn số requests mỗi giây
 - Circuit Breaker: Tự động dừng khi có quá nhiều lỗi 429
+- Request Budget: Token bucket theo RPM/RPD cho LLM (thay cho sleep cố định)
+- Shared backend (SQLite): mọi process trên máy (FastAPI wiki, crawler, Streamlit)
+  dùng chung một ngân sách RPM/RPD và cùng thấy circuit breaker đang mở.
+
+Tất cả các lớp đều thread-safe.
 """
 
 from __future__ import annotations
 
+import os
+import threading
 import time
 from collections import deque
 from dataclasses import dataclass
+from datetime import tzinfo
 from enum import Enum
-from typing import Optional
+from typing import Optional, Tuple, Union
+
+from src.utils.quota_window import quota_window
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+RATE_LIMIT_STORE_PATH = DATA_DIR / "rate_limits.sqlite3"
 
 
 class CircuitState(Enum):
@@ -33,32 +47,37 @@ class RateLimiter:
     max_requests: int = 10
     time_window: float = 1.0  # giây
     _requests: deque = None
+    _lock: threading.Lock = None
     
     def __post_init__(self):
         if self._requests is None:
             self._requests = deque()
+        if self._lock is None:
+            self._lock = threading.Lock()
     
     def wait_if_needed(self) -> None:
         """
         Chờ nếu cần thiết để tuân thủ rate limit.
-        """
-        now = time.time()
-        
-        # Xóa các requests cũ hơn time_window
-        while self._requests and self._requests[0] < now - self.time_window:
-            self._requests.popleft()
         
-        # Nếu đã đạt max, chờ
-        if len(self._requests) >= self.max_requests:
-            sleep_time = self.time_window - (now - self._requests[0])
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-                # Xóa lại sau khi chờ
-                now = time.time()
-                while self._requests and self._requests[0] < now - self.time_window:
-                    self._requests.popleft()
+        Slot được giữ chỗ trong lock (thời điểm request dự kiến), việc chờ
+        diễn ra ngoài lock nên các thread khác không bị chặn thêm.
+        """
+        with self._lock:
+            now = time.time()
+            
+            # Xóa các requests cũ hơn time_window
+            while self._requests and self._requests[0] <= now - self.time_window:
+                self._requests.popleft()
+            
+            # Nếu đã đạt max, request này được xếp sau request thứ max_requests gần nhất
+            scheduled = now
+            if len(self._requests) >= self.max_requests:
+                scheduled = max(now, self._requests[-self.max_requests] + self.time_window)
+            self._requests.append(scheduled)
         
-        self._requests.append(time.time())
+        sleep_time = scheduled - time.time()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
 
 
 @dataclass
@@ -81,6 +100,26 @@ class CircuitBreaker:
     _last_failure_time: Optional[float] = None
     _half_open_requests: int = 0
     _half_open_success_count: int = 0
+    _lock: threading.RLock = None
+    # Backend dùng chung giữa các process (None = chỉ trong process)
+    shared_store: Optional["RateLimitStore"] = None
+    name: str = "llm"
+    
+    def __post_init__(self):
+        if self._lock is None:
+            self._lock = threading.RLock()
+    
+    def _sync_shared(self, now: float) -> None:
+        """Process khác đã mở circuit: mở theo (cùng thời điểm hết hạn)."""
+        if self.shared_store is None:
+            return
+        try:
+            open_until = self.shared_store.circuit_open_until(self.name)
+        except Exception:
+            return  # Backend lỗi: dùng trạng thái trong process
+        if open_until > now and self._state != CircuitState.OPEN:
+            self._state = CircuitState.OPEN
+            self._last_failure_time = open_until - self.timeout
     
     def can_make_request(self) -> bool:
         """
@@ -89,8 +128,12 @@ class CircuitBreaker:
         Returns:
             True nếu có thể, False nếu bị chặn
         """
-        now = time.time()
-        
+        with self._lock:
+            now = time.time()
+            self._sync_shared(now)
+            return self._can_make_request_locked(now)
+    
+    def _can_make_request_locked(self, now: float) -> bool:
         # Nếu đang OPEN, kiểm tra xem đã hết timeout chưa
         if self._state == CircuitState.OPEN:
             if self._last_failure_time and (now - self._last_failure_time) >= self.timeout:
@@ -112,6 +155,10 @@ class CircuitBreaker:
     
     def record_success(self) -> None:
         """Ghi nhận request thành công."""
+        with self._lock:
+            self._record_success_locked()
+    
+    def _record_success_locked(self) -> None:
         if self._state == CircuitState.HALF_OPEN:
             self._half_open_success_count += 1
             # Nếu tất cả requests trong HALF_OPEN thành công, đóng circuit
@@ -131,6 +178,17 @@ class CircuitBreaker:
         Args:
             is_429: True nếu là lỗi 429 (rate limit)
         """
+        with self._lock:
+            was_open = self._state == CircuitState.OPEN
+            self._record_failure_locked(is_429)
+            if self._state == CircuitState.OPEN and not was_open and self.shared_store is not None:
+                # Báo cho các process khác: dừng gọi API đến hết timeout
+                try:
+                    self.shared_store.open_circuit(self.name, self._last_failure_time + self.timeout)
+                except Exception:
+                    pass
+    
+    def _record_failure_locked(self, is_429: bool) -> None:
         if is_429:
             self._failure_count += 1
             self._last_failure_time = time.time()
@@ -147,25 +205,364 @@ class CircuitBreaker:
     
     def record_request(self) -> None:
         """Ghi nhận đã thực hiện một request (cho HALF_OPEN)."""
-        if self._state == CircuitState.HALF_OPEN:
-            self._half_open_requests += 1
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._half_open_requests += 1
     
     def get_state(self) -> CircuitState:
         """Lấy trạng thái hiện tại."""
-        return self._state
+        with self._lock:
+            return self._state
     
     def reset(self) -> None:
         """Reset circuit breaker về trạng thái ban đầu."""
-        self._state = CircuitState.CLOSED
-        self._failure_count = 0
-        self._last_failure_time = None
-        self._half_open_requests = 0
-        self._half_open_success_count = 0
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._failure_count = 0
+            self._last_failure_time = None
+            self._half_open_requests = 0
+            self._half_open_success_count = 0
+            if self.shared_store is not None:
+                try:
+                    self.shared_store.open_circuit(self.name, 0.0)
+                except Exception:
+                    pass
+
+
+@dataclass
+class RequestBudget:
+    """
+    Request Budget: Token bucket giới hạn số LLM requests theo phút và theo ngày.
+
+    - Mỗi phút được nạp lại `requests_per_minute` token (nạp dần, cho phép burst
+      tối đa bằng `requests_per_minute`).
+    - Mỗi ngày quota tối đa `requests_per_day` requests (0 = không giới hạn).
+      Ngày quota reset lúc 0h giờ Pacific như quota của Gemini và UsageLedger
+      (`quota_window`, theo `reset_timezone`), không phải 24h trượt.
+
+    Thread-safe: nhiều worker có thể gọi `acquire()` đồng thời, mỗi worker chỉ
+    chờ đúng khoảng thời gian cần thiết thay vì sleep cố định.
+    """
+
+    requests_per_minute: int = 5
+    requests_per_day: int = 20
+    reset_timezone: Optional[tzinfo] = None  # None = quota_timezone() (AGRI_QUOTA_RESET_TZ)
+
+    _lock: threading.Lock = None
+    _tokens: float = 0.0
+    _last_refill: float = 0.0
+    _day_end: float = 0.0  # epoch của lần reset quota ngày kế tiếp
+    _day_count: int = 0
+
+    def __post_init__(self):
+        if self._lock is None:
+            self._lock = threading.Lock()
+        now = time.monotonic()
+        self._tokens = float(max(self.requests_per_minute, 1))
+        self._last_refill = now
+        self._day_end = quota_window(tz=self.reset_timezone)[1]
+
+    def _refill(self, now: float) -> None:
+        """Nạp token theo thời gian đã trôi qua và reset bộ đếm ngày khi sang ngày quota mới."""
+        capacity = float(max(self.requests_per_minute, 1))
+        rate = capacity / 60.0
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+        self._last_refill = now
+        wall_now = time.time()
+        if wall_now >= self._day_end:
+            self._day_end = quota_window(wall_now, self.reset_timezone)[1]
+            self._day_count = 0
+
+    def remaining_today(self) -> Optional[int]:
+        """Số requests còn lại trong cửa sổ ngày hiện tại (None nếu không giới hạn)."""
+        if self.requests_per_day <= 0:
+            return None
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(self.requests_per_day - self._day_count, 0)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Lấy 1 token để thực hiện request, chờ nếu cần.
+
+        Args:
+            timeout: Thời gian chờ tối đa (giây), None = chờ đến khi có token
+
+        Returns:
+            True nếu được phép gọi API, False nếu đã hết quota ngày
+            hoặc hết thời gian chờ.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            granted, wait_time = self.try_acquire()
+            if granted:
+                return True
+            if wait_time is None:
+                # Hết quota ngày: không chờ hàng giờ, để caller quyết định
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            time.sleep(wait_time)
+
+    def try_acquire(self) -> Tuple[bool, Optional[float]]:
+        """
+        Thử lấy 1 token, không chờ.
+
+        Returns:
+            (True, None) nếu được phép gọi API; (False, None) nếu hết quota ngày;
+            (False, wait) với wait = số giây đến token kế tiếp.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.requests_per_day > 0 and self._day_count >= self.requests_per_day:
+                return False, None
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self._day_count += 1
+                return True, None
+            rate = float(max(self.requests_per_minute, 1)) / 60.0
+            return False, (1.0 - self._tokens) / rate
+
+
+class RateLimitStore(SQLiteStore):
+    """
+    Trạng thái rate limit dùng chung giữa các process (SQLite, WAL).
+
+    - token_buckets: token bucket RPM + bộ đếm RPD theo tên (VD: "llm").
+      Mỗi lần lấy token là một transaction `BEGIN IMMEDIATE` nên atomic giữa các process.
+    - circuit_breakers: thời điểm hết hạn của circuit đang mở.
+
+    Dùng wall-clock (`time.time()`) vì các process không chung monotonic clock.
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS token_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            last_refill REAL NOT NULL,
+            day_start REAL NOT NULL,
+            day_count INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS circuit_breakers (
+            name TEXT PRIMARY KEY,
+            open_until REAL NOT NULL
+        )
+        """,
+    )
+
+    @staticmethod
+    def _refill(
+        row: Optional[Tuple[float, float, float, int]],
+        now: float,
+        capacity: float,
+        window_start: float,
+    ) -> Tuple[float, float, int]:
+        """
+        Trạng thái (tokens, day_start, day_count) sau khi nạp token tới `now`;
+        bộ đếm ngày reset khi `day_start` thuộc ngày quota trước `window_start`.
+        """
+        if row is None:
+            return capacity, window_start, 0
+        tokens, last_refill, day_start, day_count = row
+        tokens = min(capacity, tokens + max(now - last_refill, 0.0) * capacity / 60.0)
+        if day_start < window_start:
+            day_start, day_count = window_start, 0
+        return tokens, day_start, day_count
+
+    def take_token(
+        self,
+        name: str,
+        requests_per_minute: int,
+        requests_per_day: int,
+        reset_timezone: Optional[tzinfo] = None,
+    ) -> Tuple[bool, Optional[float]]:
+        """
+        Thử lấy 1 token (atomic giữa các process). Bộ đếm ngày theo ngày quota
+        (`quota_window` với `reset_timezone`).
+
+        Returns
+        -------
+        (granted, wait)
+            granted=True: được phép gọi API.
+            granted=False, wait=None: hết quota ngày.
+            granted=False, wait>0: số giây cần chờ trước khi thử lại.
+        """
+        capacity = float(max(requests_per_minute, 1))
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            window_start, _window_end = quota_window(now, reset_timezone)
+            row = conn.execute(
+                "SELECT tokens, last_refill, day_start, day_count FROM token_buckets WHERE name = ?",
+                (name,),
+            ).fetchone()
+            tokens, day_start, day_count = self._refill(row, now, capacity, window_start)
+
+            granted, wait = False, None
+            if requests_per_day <= 0 or day_count < requests_per_day:
+                if tokens >= 1.0:
+                    tokens -= 1.0
+                    day_count += 1
+                    granted = True
+                else:
+                    wait = (1.0 - tokens) / (capacity / 60.0)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tokens, last_refill, day_start, day_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, tokens, now, day_start, day_count),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return granted, wait
+
+    def usage(
+        self,
+        name: str,
+        requests_per_minute: int,
+        reset_timezone: Optional[tzinfo] = None,
+    ) -> Tuple[int, float]:
+        """(số requests đã dùng trong ngày quota hiện tại, thời điểm reset kế tiếp)."""
+        row = self.conn.execute(
+            "SELECT tokens, last_refill, day_start, day_count FROM token_buckets WHERE name = ?",
+            (name,),
+        ).fetchone()
+        now = time.time()
+        window_start, window_end = quota_window(now, reset_timezone)
+        _tokens, _day_start, day_count = self._refill(
+            row, now, float(max(requests_per_minute, 1)), window_start
+        )
+        return day_count, window_end
+
+    def circuit_open_until(self, name: str) -> float:
+        """Thời điểm (epoch) circuit hết mở, 0 nếu không mở."""
+        row = self.conn.execute(
+            "SELECT open_until FROM circuit_breakers WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0.0
+
+    def open_circuit(self, name: str, open_until: float) -> None:
+        """Ghi thời điểm hết mở của circuit (0 = đóng)."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO circuit_breakers (name, open_until) VALUES (?, ?)",
+                (name, open_until),
+            )
+
+
+class SharedRequestBudget:
+    """
+    Request Budget dùng chung cho mọi process trên máy (cùng API với RequestBudget).
+
+    - Mỗi lần `acquire()` là một transaction atomic trên RateLimitStore.
+    - Fast path trong process: các thread lần lượt hỏi store (lock), và khi đã
+      biết hết quota ngày thì trả False ngay không cần truy vấn.
+    - Khi phải chờ, chỉ sleep đúng thời gian đến token kế tiếp rồi thử lại.
+    """
+
+    def __init__(
+        self,
+        store: "RateLimitStore",
+        name: str = "llm",
+        requests_per_minute: int = 5,
+        requests_per_day: int = 20,
+        reset_timezone: Optional[tzinfo] = None,
+    ) -> None:
+        self.store = store
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.reset_timezone = reset_timezone
+        self._lock = threading.Lock()
+        self._exhausted_until = 0.0
+
+    def remaining_today(self) -> Optional[int]:
+        """Số requests còn lại trong cửa sổ ngày hiện tại (None nếu không giới hạn)."""
+        if self.requests_per_day <= 0:
+            return None
+        used, _resets_at = self.store.usage(self.name, self.requests_per_minute, self.reset_timezone)
+        return max(self.requests_per_day - used, 0)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Lấy 1 token để thực hiện request, chờ nếu cần.
+
+        Args:
+            timeout: Thời gian chờ tối đa (giây), None = chờ đến khi có token
+
+        Returns:
+            True nếu được phép gọi API, False nếu đã hết quota ngày
+            hoặc hết thời gian chờ.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            granted, wait_time = self.try_acquire()
+            if granted:
+                return True
+            if wait_time is None:
+                # Hết quota ngày: không chờ hàng giờ, để caller quyết định
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            time.sleep(wait_time)
+
+    def try_acquire(self) -> Tuple[bool, Optional[float]]:
+        """Thử lấy 1 token, không chờ (cùng quy ước với RequestBudget.try_acquire)."""
+        with self._lock:
+            if time.time() < self._exhausted_until:
+                return False, None
+            granted, wait_time = self.store.take_token(
+                self.name, self.requests_per_minute, self.requests_per_day, self.reset_timezone
+            )
+            if not granted and wait_time is None:
+                _used, resets_at = self.store.usage(self.name, self.requests_per_minute, self.reset_timezone)
+                self._exhausted_until = resets_at
+            return granted, wait_time
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
 
 
 # Global instances
 _global_rate_limiter = RateLimiter(max_requests=8, time_window=1.0)  # 8 requests/giây
-_global_circuit_breaker = CircuitBreaker(failure_threshold=3, timeout=120.0)  # 3 lỗi 429 → mở circuit, chờ 2 phút
+_global_circuit_breaker: Optional[CircuitBreaker] = None
+_global_llm_budget: Optional[Union[RequestBudget, SharedRequestBudget]] = None
+_global_rate_limit_store: Optional[RateLimitStore] = None
+_llm_budget_lock = threading.Lock()
+
+
+def get_rate_limit_store() -> Optional[RateLimitStore]:
+    """
+    Lấy backend rate limit dùng chung giữa các process.
+
+    AGRI_RATE_LIMIT_BACKEND=memory để chỉ giới hạn trong process (mặc định: shared).
+    """
+    global _global_rate_limit_store
+    if os.getenv("AGRI_RATE_LIMIT_BACKEND", "shared").strip().lower() == "memory":
+        return None
+    if _global_rate_limit_store is None:
+        with _llm_budget_lock:
+            if _global_rate_limit_store is None:
+                _global_rate_limit_store = RateLimitStore(RATE_LIMIT_STORE_PATH)
+    return _global_rate_limit_store
 
 
 def get_rate_limiter() -> RateLimiter:
@@ -174,14 +571,58 @@ def get_rate_limiter() -> RateLimiter:
 
 
 def get_circuit_breaker() -> CircuitBreaker:
-    """Lấy global circuit breaker."""
+    """Lấy global circuit breaker (trạng thái OPEN được chia sẻ giữa các process)."""
+    global _global_circuit_breaker
+    if _global_circuit_breaker is None:
+        store = get_rate_limit_store()
+        with _llm_budget_lock:
+            if _global_circuit_breaker is None:
+                # 3 lỗi 429 → mở circuit, chờ 2 phút
+                _global_circuit_breaker = CircuitBreaker(failure_threshold=3, timeout=120.0, shared_store=store)
     return _global_circuit_breaker
 
 
+def get_llm_budget() -> Union[RequestBudget, SharedRequestBudget]:
+    """
+    Lấy global request budget cho LLM.
+
+    Cấu hình qua biến môi trường (mặc định theo Free Tier của Gemini):
+    - AGRI_LLM_RPM: số requests/phút (mặc định 5)
+    - AGRI_LLM_RPD: số requests/ngày, 0 = không giới hạn (mặc định 20)
+    - AGRI_RATE_LIMIT_BACKEND: shared (mặc định, chung mọi process) | memory
+    """
+    global _global_llm_budget
+    if _global_llm_budget is None:
+        budget = new_llm_budget("llm")
+        with _llm_budget_lock:
+            if _global_llm_budget is None:
+                _global_llm_budget = budget
+    return _global_llm_budget
+
+
+def new_llm_budget(name: str) -> Union[RequestBudget, SharedRequestBudget]:
+    """
+    Tạo request budget mới cho LLM (AGRI_LLM_RPM / AGRI_LLM_RPD), dùng chung giữa
+    các process theo `name` nếu backend là shared. Dùng cho từng endpoint của LLM router.
+    """
+    store = get_rate_limit_store()
+    rpm = _env_int("AGRI_LLM_RPM", 5)
+    rpd = _env_int("AGRI_LLM_RPD", 20)
+    if store is not None:
+        return SharedRequestBudget(store, name=name, requests_per_minute=rpm, requests_per_day=rpd)
+    return RequestBudget(requests_per_minute=rpm, requests_per_day=rpd)
+
+
 __all__ = [
     "RateLimiter",
     "CircuitBreaker",
     "CircuitState",
+    "RequestBudget",
+    "RateLimitStore",
+    "SharedRequestBudget",
+    "get_rate_limit_store",
     "get_rate_limiter",
     "get_circuit_breaker",
+    "get_llm_budget",
+    "new_llm_budget",
 ]
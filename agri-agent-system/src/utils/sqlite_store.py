@@ -0,0 +1,86 @@
+"""
+Tiện ích SQLite dùng chung cho các cache/store on-disk của Agri-Agent.
+
+- Mỗi thread có connection riêng (sqlite3 connection không nên dùng chung giữa thread).
+- Bật WAL + busy_timeout để nhiều process (FastAPI wiki, Streamlit, crawler)
+  có thể đọc/ghi cùng một file an toàn.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+
+# Project data directory (agri-agent-system/data)
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+
+
+def open_sqlite(path: Union[str, Path], timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    Mở connection SQLite với cấu hình phù hợp cho truy cập đồng thời.
+
+    Parameters
+    ----------
+    path: str | Path
+        Đường dẫn file database (thư mục cha sẽ được tạo nếu chưa có).
+    timeout: float
+        Thời gian chờ tối đa khi database đang bị khóa (giây).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class SQLiteStore:
+    """
+    Base class cho các store dựa trên SQLite.
+
+    Lớp con khai báo `SCHEMA` (danh sách câu lệnh CREATE ...) và dùng
+    `self.conn` để lấy connection của thread hiện tại.
+    """
+
+    SCHEMA: Iterable[str] = ()
+
+    def __init__(self, path: Union[str, Path], timeout: float = 30.0) -> None:
+        self.path = Path(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection SQLite của thread hiện tại (tạo lazy, schema tạo một lần)."""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_sqlite(self.path, timeout=self.timeout)
+            self._local.conn = conn
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        with conn:
+                            for statement in self.SCHEMA:
+                                conn.execute(statement)
+                        self._schema_ready = True
+        return conn
+
+    def close(self) -> None:
+        """Đóng connection của thread hiện tại."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+__all__ = [
+    "DATA_DIR",
+    "open_sqlite",
+    "SQLiteStore",
+]
@@ -0,0 +1,417 @@
+"""
+Usage ledger: sổ theo dõi lượng LLM đã dùng theo model và theo cửa sổ quota ngày.
+
+- Mỗi model có một dòng / cửa sổ ngày: số request, input tokens, output tokens.
+  Lưu trong SQLite (WAL) nên bền qua các lần khởi động lại và dùng chung giữa
+  các process (FastAPI wiki, Streamlit, crawler).
+- Cửa sổ ngày căn theo giờ reset quota của Gemini (0h giờ Pacific, có tính giờ
+  mùa hè), dùng chung với RequestBudget qua `src/utils/quota_window.py`.
+
+AdmissionController dùng ledger + RequestBudget để quyết định TRƯỚC khi chạy:
+một lần validate/workflow có ước lượng chi phí vượt phần quota còn lại thì bị
+từ chối (hoặc hoãn đến lúc reset) thay vì chạy đến khi gặp lỗi 429.
+
+Cấu hình qua biến môi trường:
+- AGRI_LLM_RPD: số requests/ngày của mỗi endpoint LLM (dùng chung với RequestBudget, 0 = không giới hạn)
+- AGRI_LLM_TPD: số tokens (input + output)/ngày của mỗi endpoint, 0 = không giới hạn (mặc định)
+- AGRI_QUOTA_RESET_TZ: múi giờ IANA của thời điểm reset quota (mặc định America/Los_Angeles)
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import tzinfo
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from src.utils.quota_window import quota_window
+from src.utils.sqlite_store import DATA_DIR, SQLiteStore
+
+
+USAGE_LEDGER_PATH = DATA_DIR / "usage_ledger.sqlite3"
+
+# Số ký tự trung bình cho một token (tiếng Việt có dấu tốn token hơn tiếng Anh)
+CHARS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của một đoạn text (không gọi API)."""
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def usage_tokens(message: Any) -> Tuple[int, int]:
+    """(input_tokens, output_tokens) từ `usage_metadata` của AIMessage/AIMessageChunk (0 nếu không có)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    try:
+        return int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0)
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0
+
+
+@dataclass
+class CostEstimate:
+    """Chi phí LLM (ước lượng) của một công việc."""
+
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def __add__(self, other: "CostEstimate") -> "CostEstimate":
+        return CostEstimate(
+            requests=self.requests + other.requests,
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+        )
+
+    def to_dict(self) -> Dict[str, int]:
+        data = asdict(self)
+        data["total_tokens"] = self.total_tokens
+        return data
+
+
+@dataclass
+class UsageSnapshot:
+    """Lượng đã dùng của một model trong cửa sổ quota hiện tại."""
+
+    model: str
+    window_start: float
+    resets_at: float
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["total_tokens"] = self.total_tokens
+        return data
+
+
+class UsageLedger(SQLiteStore):
+    """
+    Sổ usage LLM theo (model, cửa sổ ngày), thread/process-safe.
+
+    Parameters
+    ----------
+    path: str | Path
+        File SQLite.
+    reset_timezone: tzinfo
+        Múi giờ của thời điểm reset quota hằng ngày (0h theo giờ địa phương đó);
+        mặc định `quota_timezone()` (AGRI_QUOTA_RESET_TZ).
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            model TEXT NOT NULL,
+            window_start REAL NOT NULL,
+            requests INTEGER NOT NULL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (model, window_start)
+        ) WITHOUT ROWID
+        """,
+    )
+
+    def __init__(self, path: Union[str, Path] = USAGE_LEDGER_PATH, reset_timezone: Optional[tzinfo] = None) -> None:
+        super().__init__(path)
+        self.reset_timezone = reset_timezone
+
+    def window(self, now: Optional[float] = None) -> Tuple[float, float]:
+        """(bắt đầu, lần reset kế tiếp) - epoch - của cửa sổ quota chứa `now`."""
+        return quota_window(now, self.reset_timezone)
+
+    def window_start(self, now: Optional[float] = None) -> float:
+        """Thời điểm (epoch) bắt đầu cửa sổ quota chứa `now`."""
+        return self.window(now)[0]
+
+    def record(self, model: str, requests: int = 1, input_tokens: int = 0, output_tokens: int = 0) -> None:
+        """Cộng usage vào cửa sổ hiện tại của model (atomic)."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO llm_usage (model, window_start, requests, input_tokens, output_tokens, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(model, window_start) DO UPDATE SET "
+                "requests = requests + excluded.requests, "
+                "input_tokens = input_tokens + excluded.input_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens, "
+                "updated_at = excluded.updated_at",
+                (model, self.window_start(now), requests, input_tokens, output_tokens, now),
+            )
+
+    def usage(self, model: str, now: Optional[float] = None) -> UsageSnapshot:
+        """Usage của model trong cửa sổ hiện tại."""
+        start, end = self.window(now)
+        row = self.conn.execute(
+            "SELECT requests, input_tokens, output_tokens FROM llm_usage WHERE model = ? AND window_start = ?",
+            (model, start),
+        ).fetchone()
+        snapshot = UsageSnapshot(model=model, window_start=start, resets_at=end)
+        if row:
+            snapshot.requests, snapshot.input_tokens, snapshot.output_tokens = row
+        return snapshot
+
+    def usage_all(self, now: Optional[float] = None) -> List[UsageSnapshot]:
+        """Usage của mọi model trong cửa sổ hiện tại."""
+        start, end = self.window(now)
+        rows = self.conn.execute(
+            "SELECT model, requests, input_tokens, output_tokens FROM llm_usage "
+            "WHERE window_start = ? ORDER BY model",
+            (start,),
+        ).fetchall()
+        return [
+            UsageSnapshot(model, start, end, requests, input_tokens, output_tokens)
+            for model, requests, input_tokens, output_tokens in rows
+        ]
+
+    def usage_total(self, now: Optional[float] = None) -> UsageSnapshot:
+        """Tổng usage của mọi model trong cửa sổ hiện tại (model = "*")."""
+        start, end = self.window(now)
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0) "
+            "FROM llm_usage WHERE window_start = ?",
+            (start,),
+        ).fetchone()
+        return UsageSnapshot("*", start, end, row[0], row[1], row[2])
+
+    def history(self, model: str, days: int = 7) -> List[UsageSnapshot]:
+        """Usage của model trong `days` cửa sổ gần nhất (mới nhất trước)."""
+        rows = self.conn.execute(
+            "SELECT window_start, requests, input_tokens, output_tokens FROM llm_usage "
+            "WHERE model = ? ORDER BY window_start DESC LIMIT ?",
+            (model, days),
+        ).fetchall()
+        return [
+            UsageSnapshot(model, start, self.window(start)[1], requests, input_tokens, output_tokens)
+            for start, requests, input_tokens, output_tokens in rows
+        ]
+
+
+class AdmissionDeniedError(RuntimeError):
+    """Công việc bị từ chối trước khi chạy vì ước lượng chi phí vượt quota còn lại."""
+
+    def __init__(self, decision: "AdmissionDecision") -> None:
+        super().__init__(decision.reason)
+        self.decision = decision
+
+
+@dataclass
+class AdmissionDecision:
+    """Kết quả kiểm tra admission cho một công việc."""
+
+    admitted: bool
+    estimate: CostEstimate
+    remaining_requests: Optional[int]  # None = không giới hạn
+    remaining_tokens: Optional[int]  # None = không giới hạn
+    retry_after: float = 0.0  # số giây đến lần reset quota (khi bị từ chối)
+    reason: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "estimate": self.estimate.to_dict(),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "retry_after": round(self.retry_after, 1),
+            "reason": self.reason,
+        }
+
+
+class AdmissionController:
+    """
+    Quyết định một công việc có được chạy hay không dựa trên quota còn lại.
+
+    Quota còn lại = min(RPD - requests đã ghi trong ledger, số token còn lại của
+    RequestBudget), và TPD - tokens đã ghi (nếu có giới hạn TPD). Với `model=None`
+    usage được cộng trên mọi model.
+
+    Parameters
+    ----------
+    ledger: UsageLedger
+    budget:
+        Đối tượng có `remaining_today()` (RequestBudget, SharedRequestBudget,
+        LLMRouter) - bộ đếm RPD đang được enforce (tùy chọn).
+    requests_per_day, tokens_per_day: int
+        Giới hạn theo ngày (0 = không giới hạn).
+    """
+
+    def __init__(
+        self,
+        ledger: UsageLedger,
+        budget: Any = None,
+        requests_per_day: int = 20,
+        tokens_per_day: int = 0,
+    ) -> None:
+        self.ledger = ledger
+        self.budget = budget
+        self.requests_per_day = requests_per_day
+        self.tokens_per_day = tokens_per_day
+
+    def remaining(self, model: Optional[str] = None) -> Tuple[Optional[int], Optional[int], UsageSnapshot]:
+        """(requests còn lại, tokens còn lại, usage hiện tại) của model; None = không giới hạn."""
+        snapshot = self.ledger.usage(model) if model else self.ledger.usage_total()
+        remaining_requests: Optional[int] = None
+        if self.requests_per_day > 0:
+            remaining_requests = max(self.requests_per_day - snapshot.requests, 0)
+        if self.budget is not None:
+            budget_left = self.budget.remaining_today()
+            if budget_left is not None:
+                remaining_requests = (
+                    budget_left if remaining_requests is None else min(remaining_requests, budget_left)
+                )
+        remaining_tokens: Optional[int] = None
+        if self.tokens_per_day > 0:
+            remaining_tokens = max(self.tokens_per_day - snapshot.total_tokens, 0)
+        return remaining_requests, remaining_tokens, snapshot
+
+    def check(self, estimate: CostEstimate, model: Optional[str] = None) -> AdmissionDecision:
+        """Cho phép chạy nếu ước lượng chi phí nằm trong quota còn lại của model."""
+        remaining_requests, remaining_tokens, snapshot = self.remaining(model)
+        decision = AdmissionDecision(
+            admitted=True,
+            estimate=estimate,
+            remaining_requests=remaining_requests,
+            remaining_tokens=remaining_tokens,
+        )
+        if estimate.requests <= 0:
+            return decision
+
+        if remaining_requests is not None and estimate.requests > remaining_requests:
+            decision.reason = (
+                f"Vượt quota LLM trong ngày: cần ~{estimate.requests} requests, "
+                f"còn {remaining_requests} (AGRI_LLM_RPD)"
+            )
+        elif remaining_tokens is not None and estimate.total_tokens > remaining_tokens:
+            decision.reason = (
+                f"Vượt quota token trong ngày: cần ~{estimate.total_tokens} tokens, "
+                f"còn {remaining_tokens} (AGRI_LLM_TPD)"
+            )
+        else:
+            return decision
+
+        decision.admitted = False
+        decision.retry_after = max(snapshot.resets_at - time.time(), 0.0)
+        return decision
+
+    def plan(self, estimates: Sequence[CostEstimate], model: Optional[str] = None) -> Tuple[List[int], List[int]]:
+        """
+        Chia một loạt công việc (theo thứ tự) thành (được chạy ngay, hoãn đến lần reset quota):
+        công việc làm tổng ước lượng vượt quota còn lại bị hoãn, các công việc
+        sau (rẻ hơn) vẫn được xét tiếp.
+        """
+        remaining_requests, remaining_tokens, _snapshot = self.remaining(model)
+        admitted: List[int] = []
+        deferred: List[int] = []
+        used = CostEstimate()
+        for idx, estimate in enumerate(estimates):
+            total = used + estimate
+            fits = (remaining_requests is None or total.requests <= remaining_requests) and (
+                remaining_tokens is None or total.total_tokens <= remaining_tokens
+            )
+            if fits:
+                admitted.append(idx)
+                used = total
+            else:
+                deferred.append(idx)
+        return admitted, deferred
+
+    def admit(self, estimate: CostEstimate, model: Optional[str] = None) -> AdmissionDecision:
+        """Như `check`, nhưng raise AdmissionDeniedError nếu bị từ chối."""
+        decision = self.check(estimate, model)
+        if not decision.admitted:
+            raise AdmissionDeniedError(decision)
+        return decision
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_global_usage_ledger: Optional[UsageLedger] = None
+_global_admission_controller: Optional[AdmissionController] = None
+_global_usage_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Lấy usage ledger dùng chung cho toàn process."""
+    global _global_usage_ledger
+    if _global_usage_ledger is None:
+        with _global_usage_lock:
+            if _global_usage_ledger is None:
+                _global_usage_ledger = UsageLedger()
+    return _global_usage_ledger
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Lấy admission controller dùng chung: ledger + ngân sách của LLM router
+    (quota ngày = RPD/TPD x số endpoint).
+    """
+    global _global_admission_controller
+    from src.utils.llm_router import get_llm_router
+
+    router = get_llm_router()
+    if _global_admission_controller is None or _global_admission_controller.budget is not router:
+        ledger = get_usage_ledger()
+        num_endpoints = max(len(router), 1)
+        with _global_usage_lock:
+            if _global_admission_controller is None or _global_admission_controller.budget is not router:
+                _global_admission_controller = AdmissionController(
+                    ledger,
+                    budget=router,
+                    requests_per_day=_env_int("AGRI_LLM_RPD", 20) * num_endpoints,
+                    tokens_per_day=_env_int("AGRI_LLM_TPD", 0) * num_endpoints,
+                )
+    return _global_admission_controller
+
+
+def record_llm_usage(
+    model: str,
+    message: Any = None,
+    requests: int = 1,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+) -> None:
+    """
+    Ghi một lần gọi LLM vào ledger: token lấy từ `usage_metadata` của response
+    (nếu truyền `message`) cộng với `input_tokens`/`output_tokens` (VD: tổng của các chunk stream).
+    """
+    message_in, message_out = usage_tokens(message)
+    input_tokens += message_in
+    output_tokens += message_out
+    try:
+        get_usage_ledger().record(model, requests=requests, input_tokens=input_tokens, output_tokens=output_tokens)
+    except Exception:
+        pass  # Ledger lỗi không được làm hỏng request LLM
+
+
+__all__ = [
+    "CostEstimate",
+    "UsageSnapshot",
+    "UsageLedger",
+    "AdmissionDecision",
+    "AdmissionDeniedError",
+    "AdmissionController",
+    "estimate_tokens",
+    "usage_tokens",
+    "record_llm_usage",
+    "get_usage_ledger",
+    "get_admission_controller",
+]
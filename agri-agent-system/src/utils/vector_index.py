@@ -0,0 +1,148 @@
+"""
+Vector index in-process (NumPy) cho clustering claims theo cosine similarity.
+
+Thay cho cách so sánh mỗi claim với head của MỌI cluster (O(N·C)):
+- Random-hyperplane LSH: mỗi vector được băm thành `num_tables` chữ ký
+  `num_bits` bit; chỉ các cluster head cùng bucket mới là ứng viên.
+- Ứng viên được kiểm tra lại bằng cosine chính xác (dot product, vector đã chuẩn hóa L2).
+- Khi số head còn ít (< `brute_force_limit`) thì so sánh toàn bộ bằng một phép
+  nhân ma trận NumPy - nhanh hơn và không mất recall.
+
+Index hỗ trợ thêm dần (`add`): claims mới được gán vào cluster hiện có
+hoặc mở cluster mới mà không cần cluster lại từ đầu.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class ClusterIndex:
+    """
+    Gán vector vào cluster theo ngưỡng cosine, hỗ trợ thêm dần.
+
+    Parameters
+    ----------
+    dim: int
+        Số chiều vector.
+    threshold: float
+        Cosine tối thiểu để gán vào cluster có sẵn.
+    num_tables, num_bits: int
+        Số bảng LSH và số bit mỗi chữ ký (nhiều bảng -> recall cao hơn).
+    brute_force_limit: int
+        Dưới số head này thì so sánh toàn bộ thay vì dùng LSH.
+    seed: int
+        Seed cho các hyperplane (cố định để kết quả tái lập được).
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        threshold: float = 0.85,
+        num_tables: int = 10,
+        num_bits: int = 6,
+        brute_force_limit: int = 256,
+        seed: int = 0,
+    ) -> None:
+        self.dim = dim
+        self.threshold = threshold
+        self.brute_force_limit = brute_force_limit
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((num_tables, num_bits, dim)).astype(np.float32)
+        self._bit_weights = (1 << np.arange(num_bits)).astype(np.int64)
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(num_tables)]
+        self._heads = np.zeros((0, dim), dtype=np.float32)
+        self._head_count = 0
+        self._exact: Dict[Hashable, int] = {}
+        self.members: List[List[int]] = []  # cluster id -> danh sách item id
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def num_clusters(self) -> int:
+        return len(self.members)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    def _signatures(self, vector: np.ndarray) -> np.ndarray:
+        """Chữ ký LSH của vector cho từng bảng."""
+        bits = (self._planes @ vector) > 0  # (num_tables, num_bits)
+        return bits.astype(np.int64) @ self._bit_weights
+
+    def _candidates(self, signatures: np.ndarray) -> List[int]:
+        found = set()
+        for table, signature in zip(self._buckets, signatures.tolist()):
+            found.update(table.get(signature, ()))
+        return sorted(found)
+
+    def _add_head(self, vector: np.ndarray, signatures: np.ndarray) -> int:
+        cluster_id = len(self.members)
+        if self._head_count == len(self._heads):
+            grown = np.zeros((max(16, 2 * len(self._heads)), self.dim), dtype=np.float32)
+            grown[:self._head_count] = self._heads[:self._head_count]
+            self._heads = grown
+        self._heads[self._head_count] = vector
+        self._head_count += 1
+        for table, signature in zip(self._buckets, signatures.tolist()):
+            table.setdefault(signature, []).append(cluster_id)
+        self.members.append([])
+        return cluster_id
+
+    def nearest(self, vector: np.ndarray) -> Tuple[Optional[int], float]:
+        """Cluster head gần nhất có cosine >= threshold (None nếu không có)."""
+        vector = self._normalize(vector)
+        if self._head_count == 0:
+            return None, 0.0
+        if self._head_count < self.brute_force_limit:
+            candidates = np.arange(self._head_count)
+        else:
+            candidates = np.asarray(self._candidates(self._signatures(vector)), dtype=np.int64)
+            if candidates.size == 0:
+                return None, 0.0
+        scores = self._heads[candidates] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return int(candidates[best]), float(scores[best])
+        return None, float(scores[best])
+
+    def add(self, vector: np.ndarray, exact_key: Optional[Hashable] = None) -> int:
+        """
+        Thêm một item, trả về cluster id.
+
+        `exact_key` (VD: text đã chuẩn hóa) cho phép gán ngay các item trùng
+        nguyên văn mà không cần tính cosine.
+        """
+        item_id = self._size
+        self._size += 1
+
+        cluster_id = self._exact.get(exact_key) if exact_key is not None else None
+        if cluster_id is None:
+            vector = self._normalize(vector)
+            cluster_id, _score = self.nearest(vector)
+            if cluster_id is None:
+                cluster_id = self._add_head(vector, self._signatures(vector))
+        if exact_key is not None:
+            self._exact.setdefault(exact_key, cluster_id)
+        self.members[cluster_id].append(item_id)
+        return cluster_id
+
+    def add_many(
+        self,
+        vectors: np.ndarray,
+        exact_keys: Optional[Sequence[Hashable]] = None,
+    ) -> List[int]:
+        """Thêm nhiều item theo thứ tự, trả về cluster id của từng item."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        keys = list(exact_keys) if exact_keys is not None else [None] * len(vectors)
+        return [self.add(vector, key) for vector, key in zip(vectors, keys)]
+
+
+__all__ = ["ClusterIndex"]
@@ -4,68 +4,114 @@ from __future__ import annotations
 Workflow LangGraph chính cho Agri-Agent.
 
 Luồng cơ bản (v1, tối giản để demo end‑to‑end):
-- Search (DuckDuckGo)  -> lấy danh sách URL liên quan tới cây trồng/ngữ cảnh.
-- Extract (Extractor Agent) -> trích xuất AgriClaim từ từng URL.
-- Resolve (Resolver Agent)  -> hợp nhất claim bằng Weighted Voting.
+- Lookup (Claim store)  -> truy vấn đã trả lời gần đây thì đi thẳng tới Writer.
+- Search (DuckDuckGo, Tavily) -> các biến thể truy vấn chạy song song; URL frontier chọn URL
+                                theo trust score, chất lượng nội dung đã biết và đa dạng domain.
+- Extract (Extractor Agent) -> trích xuất AgriClaim từ URL mới (URL đã biết lấy từ store).
+- Resolve (Resolver Agent)  -> lưu claim mới vào store, chỉ resolve lại nhóm có thay đổi.
 - Writer (Summary)          -> tạo tóm tắt thân thiện cho người dùng.
 
+Cách chạy (graph chỉ compile một lần cho cả process):
+- `run_agri_workflow` / `stream_agri_workflow`: đồng bộ (Streamlit, script).
+- `arun_agri_workflow` / `astream_agri_workflow`: async, các node chạy trên event
+  loop của caller (FastAPI); bản stream trả về cập nhật sau mỗi node.
+
 Ghi chú:
 - Giai đoạn NLI Judge trong PROMPTS.md chưa được hiện thực riêng,
   nên tạm thời được gộp logic vào Resolver/Writer.
 """
 
-from typing import Any, Dict, List, Optional, TypedDict
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Annotated, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+import asyncio
+import inspect
 import os
+import threading
 
-try:
-    from ddgs import DDGS  # Package mới (ddgs)
-except ImportError:
-    # Fallback cho package cũ (duckduckgo-search)
-    from duckduckgo_search import DDGS
-
-from src.agents.extractor import extract_claims_from_url
-from src.agents.resolver import ResolvedClaim, group_and_resolve_claims
+from src.agents.extractor import ExtractionStatus, estimate_extraction_cost, extract_claims_from_page
+from src.agents.judge import JUDGE_BATCH_SIZE, estimate_judge_cost
+from src.agents.resolver import ResolvedClaim, group_and_resolve_claims, resolve_claims_for_group
 from src.models import AgriClaim
 from src.tools.filter import calculate_trust_score
+from src.tools.frontier import FrontierResult, rank_frontier
+from src.tools.scraper import ScrapeResult, iter_scrape_many, scrape_many
+from src.tools.search import SearchOutcome, afan_out_search, build_search_variants, fan_out_search
+from src.utils.claim_store import get_claim_store
+from src.utils.usage_ledger import CostEstimate, get_admission_controller
 
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph
 
-# Thử import Tavily nếu có
-try:
-    from tavily import TavilyClient
-    TAVILY_AVAILABLE = True
-except ImportError:
-    TAVILY_AVAILABLE = False
+
+def _append_claims(left: Optional[List[AgriClaim]], right: Optional[List[AgriClaim]]) -> List[AgriClaim]:
+    """
+    Reducer của `claims`: buffer chỉ nối thêm. Node chỉ trả về claim mới, được
+    nối vào list hiện có; trả về list mới, không sửa list của state trước đó
+    (LangGraph có thể còn giữ nó, VD: checkpoint, stream "values").
+    """
+    return list(left or []) + list(right or [])
+
+
+def _merge_debug(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Reducer của `debug_info`: node chỉ trả về các key mới/thay đổi, được gộp vào
+    dict mới; "errors" được nối thêm thay vì ghi đè. Không sửa input.
+    """
+    left = left or {}
+    right = right or {}
+    merged = {**left, **right}
+    if "errors" in left and "errors" in right:
+        merged["errors"] = list(left["errors"] or []) + list(right["errors"] or [])
+    return merged
 
 
 class WorkflowState(TypedDict, total=False):
     """
     Trạng thái luồng LangGraph cho một lần truy vấn.
 
+    Node chỉ trả về phần state thay đổi (partial update): `claims` và
+    `debug_info` đi qua reducer nối/gộp (không sửa giá trị cũ), các trường khác
+    là giá trị mới nhất; node không copy cả state (`{**state}`) ở mỗi bước.
+
     Các trường:
     - crop: Tên cây trồng/đối tượng phân tích do người dùng nhập.
     - query: Câu truy vấn mở rộng để search web.
     - search_results: Danh sách URL thu được từ search.
-    - claims: Danh sách claim thô (AgriClaim) từ nhiều nguồn.
+    - claims: Danh sách claim thô (AgriClaim) từ nhiều nguồn (chỉ nối thêm).
+    - new_source_urls: Các URL vừa được trích xuất ở lần chạy này (chưa có trong store).
     - resolved_claims: Danh sách claim đã được hợp nhất (ResolvedClaim).
     - summary: Chuỗi tóm tắt kết quả cuối cùng cho người dùng.
-    - debug_info: Thông tin phụ (số URL/claim, lỗi nếu có, ...).
+    - debug_info: Thông tin phụ (số URL/claim, lỗi nếu có, ...); node trả về key mới.
     """
 
     crop: str
     query: str
     search_results: List[str]
-    claims: List[AgriClaim]
+    claims: Annotated[List[AgriClaim], _append_claims]
+    new_source_urls: List[str]
     resolved_claims: List[ResolvedClaim]
     summary: str
-    debug_info: Dict[str, Any]
+    debug_info: Annotated[Dict[str, Any], _merge_debug]
 
 
-# Một số domain cần loại bỏ hoàn toàn (forum, spam, không liên quan nông nghiệp)
-DISALLOWED_HOSTS = {
-    "vfo.vn",
-}
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int, fallback về default nếu không hợp lệ."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Số URL tối đa được xử lý ở bước Extract (Free Tier: 3 URLs, tier trả phí có thể tăng)
+MAX_URLS_TO_PROCESS = _env_int("AGRI_MAX_URLS", 3)
+# Số worker song song cho bước Extract (scrape + LLM). Các LLM call vẫn đi qua
+# RequestBudget (AGRI_LLM_RPM / AGRI_LLM_RPD) nên không vượt quota dù chạy song song.
+EXTRACT_MAX_WORKERS = _env_int("AGRI_EXTRACT_WORKERS", 4)
+# Số URL đầu frontier được ghi vào debug_info
+MAX_FRONTIER_DEBUG = 10
+# Độ dài giả định (ký tự) của một trang web khi ước lượng chi phí trước lúc scrape
+ESTIMATED_PAGE_CHARS = 6000
 
 
 def _build_search_query(crop: str) -> str:
@@ -80,165 +126,85 @@ def _build_search_query(crop: str) -> str:
     return f"{crop} năng suất giống lúa"
 
 
-def search_node(state: WorkflowState) -> WorkflowState:
+def lookup_node(state: WorkflowState) -> WorkflowState:
     """
-    Node Search: dùng DuckDuckGo để tìm các URL phù hợp.
+    Node Lookup: trả lời trực tiếp từ claim store nếu truy vấn này đã được
+    trả lời gần đây (trong AGRI_CLAIM_STORE_TTL), bỏ qua search/extract/resolve.
     """
     crop = state.get("crop", "").strip()
-    query = state.get("query") or _build_search_query(crop)
-
-    urls: List[str] = []
-    debug: Dict[str, Any] = dict(state.get("debug_info") or {})
+    debug: Dict[str, Any] = {}
 
-    def _run_ddg(q: str, *, region: Optional[str] = None) -> List[str]:
-        """Chạy DuckDuckGo search và trả về danh sách URL."""
-        out: List[str] = []
+    answer = None
+    if crop:
         try:
-            with DDGS() as ddgs:
-                # Với query tiếng Việt, region "vn-vi" thường cho kết quả tốt hơn
-                # Nếu không có region, thường trả về 0 kết quả cho tiếng Việt
-                if region:
-                    results = ddgs.text(
-                        q,
-                        region=region,
-                        safesearch="moderate",
-                        max_results=15,  # Tăng lên để có nhiều lựa chọn hơn
-                    )
-                else:
-                    results = ddgs.text(
-                        q,
-                        safesearch="moderate",
-                        max_results=15,
-                    )
-                # Chuyển iterator sang list để có thể đếm và debug
-                results_list = list(results)
-                debug.setdefault("ddg_raw_results_count", []).append({
-                    "query": q,
-                    "region": region or "default",
-                    "count": len(results_list),
-                    "sample_urls": [r.get("href") or r.get("url") or "N/A" for r in results_list[:3]]
-                })
-                for r in results_list:
-                    href = r.get("href") or r.get("url")
-                    if href:
-                        # Lọc ngay một số domain không phù hợp
-                        host = urlparse(href).netloc.lower()
-                        if any(bad in host for bad in ["vfo.vn", "zhihu.com", "yahoo", "seek.com", "forum"]):
-                            continue
-                        out.append(href)
-        except Exception as exc:
-            # Log lỗi nhưng không raise, để có thể thử fallback queries
-            error_msg = f"DuckDuckGo search error for query '{q}' (region={region}): {exc}"
-            debug.setdefault("errors", []).append(error_msg)
-        return out
-
-    def _run_tavily(q: str) -> List[str]:
-        """Chạy Tavily search nếu có API key."""
-        if not TAVILY_AVAILABLE:
-            return []
-        api_key = os.getenv("TAVILY_API_KEY")
-        if not api_key:
-            return []
-        try:
-            client = TavilyClient(api_key=api_key)
-            response = client.search(q, max_results=10, search_depth="basic")
-            urls = [result.get("url") for result in response.get("results", []) if result.get("url")]
-            return urls
-        except Exception as exc:
-            debug.setdefault("errors", []).append(f"Tavily search error for query '{q}': {exc}")
-            return []
+            answer = get_claim_store().answer_for_query(crop)
+        except Exception as exc:  # Store lỗi thì chạy workflow bình thường
+            debug.setdefault("errors", []).append(f"Claim store error: {exc}")
 
-    try:
-        # Với query tiếng Việt, region "vn-vi" thường cho kết quả tốt hơn
-        # Strategy: Ưu tiên region "vn-vi" cho query tiếng Việt
-        
-        # 1) Query chính với region vn-vi (quan trọng cho tiếng Việt)
-        urls = _run_ddg(query, region="vn-vi")
-        debug["ddg_results_initial_vn_vi"] = len(urls)
-
-        # 2) Nếu không có kết quả, thử query đơn giản hơn với region vn-vi
-        if not urls and crop:
-            simple_query = f"{crop} năng suất"
-            debug["fallback_query_simple"] = simple_query
-            urls = _run_ddg(simple_query, region="vn-vi")
-            debug["ddg_results_simple_fallback"] = len(urls)
-
-        # 3) Thử chỉ tên cây trồng với region vn-vi
-        if not urls and crop:
-            crop_only = crop
-            debug["fallback_query_crop_only"] = crop_only
-            urls = _run_ddg(crop_only, region="vn-vi")
-            debug["ddg_results_crop_only"] = len(urls)
-
-        # 4) Thử query tiếng Anh không có region (toàn cầu)
-        if not urls and crop:
-            global_query = f"{crop} rice yield Vietnam"
-            debug["fallback_query_en"] = global_query
-            urls = _run_ddg(global_query, region=None)
-            debug["ddg_results_en_fallback"] = len(urls)
-
-        # 5) Thử query tiếng Anh đơn giản hơn
-        if not urls and crop:
-            simple_en = "ST25 rice variety Vietnam"
-            debug["fallback_query_simple_en"] = simple_en
-            urls = _run_ddg(simple_en, region=None)
-            debug["ddg_results_simple_en"] = len(urls)
-
-        # 6) Fallback cuối cùng: Tavily (nếu có API key)
-        if not urls and crop:
-            tavily_query = f"{crop} năng suất giống lúa"
-            debug["tavily_query"] = tavily_query
-            urls = _run_tavily(tavily_query)
-            debug["tavily_results"] = len(urls)
+    debug["served_from_store"] = answer is not None
+    if answer is None:
+        return {"debug_info": debug}
 
-    except Exception as exc:  # pragma: no cover - phụ thuộc network
-        debug.setdefault("errors", []).append(f"Search error: {exc}")
+    resolved, claims = answer
+    debug["num_claims"] = len(claims)
+    debug["num_resolved_claims"] = len(resolved)
+    return {
+        "claims": claims,
+        "resolved_claims": resolved,
+        "debug_info": debug,
+    }
 
-    # Loại bỏ trùng lặp và bỏ các domain nằm trong blacklist
-    # Cũng loại bỏ các URL không hợp lệ (relative URLs, không có scheme)
-    dedup_urls: List[str] = []
-    for u in urls:
-        if not u or not u.strip():
-            continue
-        try:
-            parsed = urlparse(u)
-            # Bỏ qua URL không có scheme (http/https) hoặc không có netloc (relative URLs)
-            if not parsed.scheme or not parsed.netloc:
-                continue
-            # Chỉ chấp nhận http và https
-            if parsed.scheme not in ["http", "https"]:
-                continue
-            host = parsed.netloc.split(":", 1)[0].lower()
-            if host in DISALLOWED_HOSTS:
-                continue
-            if u not in dedup_urls:
-                dedup_urls.append(u)
-        except Exception:
-            # Bỏ qua URL không hợp lệ
-            continue
-
-    debug["num_urls_after_dedup"] = len(dedup_urls)
-
-    # Lọc theo trust_score để tránh domain rác / forum / spam
-    # Với DuckDuckGo, kết quả thường có trust_score thấp, nên giảm ngưỡng xuống 0.3
-    # Sau đó sẽ dùng scraper để kiểm tra nội dung thực tế
-    filtered_urls: List[str] = []
-    trust_scores_detail: List[Dict[str, Any]] = []
-    for u in dedup_urls:
-        score = calculate_trust_score(u)
-        trust_scores_detail.append({"url": u, "trust_score": score})
-        # Giảm ngưỡng xuống 0.3 để lấy nhiều kết quả hơn
-        # Sẽ filter lại sau khi scrape và extract claims
-        if score >= 0.3:
-            filtered_urls.append(u)
-
-    debug["num_urls_after_trust_filter"] = len(filtered_urls)
-    debug["trust_scores_detail"] = trust_scores_detail[:20]  # Giới hạn log
-
-    # Nếu sau khi lọc không còn gì, dùng lại danh sách gốc (đã dedup) như fallback
-    # Giới hạn 3 URLs cho FREE TIER (5 RPM, 20 RPD limits)
-    final_urls = filtered_urls if filtered_urls else dedup_urls
-    final_urls = final_urls[:3]  # Chỉ 3 URLs để tuân thủ Free Tier limits (5 RPM, 20 RPD)
+
+async def alookup_node(state: WorkflowState) -> WorkflowState:
+    """Phiên bản async của `lookup_node` (truy vấn SQLite chạy trong thread)."""
+    return await asyncio.to_thread(lookup_node, state)
+
+
+def _route_after_lookup(state: WorkflowState) -> str:
+    """Đã có câu trả lời từ store thì sang Writer, ngược lại đi Search."""
+    return "writer" if (state.get("debug_info") or {}).get("served_from_store") else "search"
+
+
+def _search_inputs(state: WorkflowState) -> Tuple[str, str, Dict[str, Any]]:
+    """(crop, query, debug) cho bước Search; `debug` chỉ chứa các key mới của node."""
+    crop = state.get("crop", "").strip()
+    query = state.get("query") or _build_search_query(crop)
+    return crop, query, {}
+
+
+def _finish_search(
+    query: str,
+    outcome: SearchOutcome,
+    debug: Dict[str, Any],
+) -> WorkflowState:
+    """Phần chung của search_node/asearch_node sau fan-out: frontier + debug (blocking)."""
+    debug["search_variants"] = outcome.variants
+    debug["search_cancelled_variants"] = outcome.cancelled
+    debug["search_elapsed"] = outcome.elapsed
+    if outcome.errors:
+        debug.setdefault("errors", []).extend(outcome.errors)
+
+    # URL đã được lọc (http/https, domain bị chặn), khử trùng lặp và xếp hạng
+    # theo trust score (hòa điểm: biến thể ưu tiên hơn, thứ hạng gốc)
+    debug["num_urls_after_dedup"] = len(outcome.hits)
+
+    # Frontier: xếp hạng theo trust score + chất lượng nội dung đã biết (claim store,
+    # page cache, HEAD prefetch) + đa dạng domain, rồi mới cắt MAX_URLS_TO_PROCESS
+    # (Free Tier: 3 URLs vì giới hạn 5 RPM, 20 RPD)
+    frontier = FrontierResult()
+    try:
+        frontier = rank_frontier(outcome.hits, MAX_URLS_TO_PROCESS)
+    except Exception as exc:
+        debug.setdefault("errors", []).append(f"Frontier error: {exc}")
+        frontier.urls = outcome.urls[:MAX_URLS_TO_PROCESS]
+    final_urls = frontier.urls
+
+    debug["num_urls_after_trust_filter"] = len(frontier.candidates)
+    # Chỉ log đầu frontier (trust score, tín hiệu chất lượng), không giữ toàn bộ danh sách URL
+    debug["frontier"] = [c.debug() for c in frontier.candidates[:MAX_FRONTIER_DEBUG]]
+    debug["frontier_rejected"] = frontier.rejected
+    debug["frontier_prefetched"] = frontier.prefetched
+    debug["frontier_prefetch_elapsed"] = frontier.prefetch_elapsed
 
     debug["search_query"] = query
     debug["num_search_results"] = len(final_urls)
@@ -247,75 +213,266 @@ def search_node(state: WorkflowState) -> WorkflowState:
     ]
 
     return {
-        **state,
         "query": query,
         "search_results": final_urls,
         "debug_info": debug,
     }
 
 
-def extract_node(state: WorkflowState) -> WorkflowState:
+def search_node(state: WorkflowState) -> WorkflowState:
     """
-    Node Extract: chạy Extractor Agent để trích xuất claim từ từng URL.
+    Node Search: chạy song song các biến thể truy vấn (DuckDuckGo nhiều region/
+    ngôn ngữ, Tavily nếu có key), gộp và xếp hạng URL theo trust score, rồi
+    URL frontier chọn tối đa MAX_URLS_TO_PROCESS URL để trích xuất.
     """
-    import time
-    
-    urls = state.get("search_results") or []
-    all_claims: List[AgriClaim] = []
-    debug: Dict[str, Any] = dict(state.get("debug_info") or {})
-    errors: List[str] = list(debug.get("errors") or [])
+    crop, query, debug = _search_inputs(state)
+
+    outcome = SearchOutcome()
+    try:
+        variants = build_search_variants(crop, query)
+        outcome = fan_out_search(variants, enough=MAX_URLS_TO_PROCESS)
+    except Exception as exc:  # pragma: no cover - phụ thuộc network
+        debug.setdefault("errors", []).append(f"Search error: {exc}")
 
-    # Tối ưu hóa cho FREE TIER: Giới hạn nghiêm ngặt để tuân thủ 5 RPM và 20 RPD
-    # Free Tier limits: 5 requests/phút, 20 requests/ngày
-    MAX_URLS_TO_PROCESS = 3  # Giảm xuống 3 URLs để đảm bảo < 5 requests/phút
-    DELAY_BETWEEN_REQUESTS = 15.0  # Delay 15 giây để đảm bảo < 5 requests/phút (3 calls trong 45s)
-    
-    urls = urls[:MAX_URLS_TO_PROCESS]  # Chỉ xử lý 3 URLs đầu tiên
+    return _finish_search(query, outcome, debug)
 
-    for idx, url in enumerate(urls):
+
+async def asearch_node(state: WorkflowState) -> WorkflowState:
+    """Phiên bản async của `search_node`: fan-out search chạy ngay trên event loop hiện tại."""
+    crop, query, debug = _search_inputs(state)
+
+    outcome = SearchOutcome()
+    try:
+        variants = build_search_variants(crop, query)
+        outcome = await afan_out_search(variants, enough=MAX_URLS_TO_PROCESS)
+    except Exception as exc:  # pragma: no cover - phụ thuộc network
+        debug.setdefault("errors", []).append(f"Search error: {exc}")
+
+    return await asyncio.to_thread(_finish_search, query, outcome, debug)
+
+
+def _claims_from_store(urls: List[str], errors: List[str]) -> Tuple[Dict[str, List[AgriClaim]], set]:
+    """Claim đã lưu của các URL đã trích xuất trước đó (còn trong TTL của claim store)."""
+    claims_by_url: Dict[str, List[AgriClaim]] = {}
+    known_urls: set = set()
+    if urls:
         try:
-            # Delay trước mỗi request (trừ request đầu tiên) để tránh burst requests
-            if idx > 0:
-                time.sleep(DELAY_BETWEEN_REQUESTS)
-            
-            claims = extract_claims_from_url(url)
-            all_claims.extend(claims)
-        except Exception as exc:  # pragma: no cover - phụ thuộc LLM/network
-            errors.append(f"Extract error for {url}: {exc}")
-            # Delay thêm nếu có lỗi để tránh retry ngay lập tức
-            time.sleep(2.0)
-
-    debug["errors"] = errors
-    debug["num_claims"] = len(all_claims)
+            store = get_claim_store()
+            known_urls = store.known_sources(urls)
+            claims_by_url.update(store.claims_for_sources(sorted(known_urls)))
+        except Exception as exc:
+            errors.append(f"Claim store error: {exc}")
+            known_urls = set()
+    return claims_by_url, known_urls
+
+
+def _extract_page(page: ScrapeResult) -> Tuple[List[AgriClaim], ExtractionStatus]:
+    """Trích xuất claims của một trang, kèm trạng thái (đầy đủ hay có chunk lỗi/bị bỏ qua)."""
+    status = ExtractionStatus()
+    claims = extract_claims_from_page(page, status=status)
+    return claims, status
+
+
+def _record_extraction(
+    url: str,
+    claims: List[AgriClaim],
+    status: ExtractionStatus,
+    claims_by_url: Dict[str, List[AgriClaim]],
+    new_source_urls: List[str],
+    incomplete_urls: List[str],
+    errors: List[str],
+) -> None:
+    """
+    Ghi kết quả trích xuất một URL. Claim luôn được dùng cho lần chạy hiện tại,
+    nhưng chỉ URL trích xuất đầy đủ mới được lưu như nguồn đã xử lý (claim store
+    bỏ qua URL đó trong TTL); URL có chunk lỗi/hết quota sẽ được trích xuất lại.
+    """
+    claims_by_url[url] = claims
+    if status.complete:
+        new_source_urls.append(url)
+        return
+    incomplete_urls.append(url)
+    detail = "; ".join(dict.fromkeys(status.errors)) or "chunk chưa hoàn tất"
+    errors.append(
+        f"Extract incomplete for {url} "
+        f"({status.completed_chunks}/{status.chunks} chunk): {detail}"
+    )
+
+
+def _finish_extract(
+    state: WorkflowState,
+    urls: List[str],
+    claims_by_url: Dict[str, List[AgriClaim]],
+    known_urls: set,
+    new_source_urls: List[str],
+    incomplete_urls: List[str],
+    errors: List[str],
+    extract_failed: bool,
+) -> WorkflowState:
+    """
+    Phần chung của extract_node/aextract_node: claim mới theo thứ tự URL (được
+    reducer nối vào buffer `claims`) + debug.
+    """
+    # Giữ thứ tự claim theo thứ tự URL (ổn định giữa các lần chạy)
+    new_claims: List[AgriClaim] = []
+    for url in urls:
+        new_claims.extend(claims_by_url.get(url, []))
+
+    debug: Dict[str, Any] = {
+        "errors": errors,
+        "num_claims": len(state.get("claims") or []) + len(new_claims),
+        "num_urls_from_store": len(known_urls),
+        "incomplete_source_urls": [u for u in urls if u in incomplete_urls],
+        # False: có trang lỗi/trích xuất dở -> không lưu câu trả lời cho truy vấn
+        "extraction_complete": not (extract_failed or incomplete_urls),
+    }
 
     return {
-        **state,
-        "claims": all_claims,
+        "claims": new_claims,
+        "new_source_urls": [u for u in urls if u in new_source_urls],
         "debug_info": debug,
     }
 
 
+def extract_node(state: WorkflowState) -> WorkflowState:
+    """
+    Node Extract: chạy Extractor Agent để trích xuất claim từ các URL.
+
+    - URL đã trích xuất trước đó (còn trong TTL của claim store): lấy claim
+      từ store, không scrape/gọi LLM lại.
+    - Scraping: các URL mới được tải song song bằng `scrape_many`
+      (connection pool dùng chung, giới hạn theo host).
+    - Extract: mỗi trang scrape xong được đưa ngay vào thread pool giới hạn
+      (EXTRACT_MAX_WORKERS); các LLM call được điều phối qua RequestBudget
+      (RPM/RPD) thay vì sleep cố định giữa các URL.
+
+    Claim của mỗi trang được gom đủ (`extract_claims_from_page`) rồi mới trả về:
+    node Resolve chỉ chạy sau khi node này xong, và cần toàn bộ claim của một
+    nhóm (subject, predicate) mới resolve được, nên workflow không dùng chế độ
+    streaming của extractor (`iter_claims_from_page`).
+    """
+    urls = (state.get("search_results") or [])[:max(MAX_URLS_TO_PROCESS, 0)]
+    errors: List[str] = []
+
+    claims_by_url, known_urls = _claims_from_store(urls, errors)
+    new_urls = [u for u in urls if u not in known_urls]
+
+    new_source_urls: List[str] = []
+    incomplete_urls: List[str] = []
+    extract_failed = False
+    if new_urls:
+        max_workers = max(1, min(EXTRACT_MAX_WORKERS, len(new_urls)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agri-extract") as pool:
+            futures = {}
+            for page in iter_scrape_many(new_urls):
+                if page.error:
+                    # Trang không tải được cũng là trích xuất dở: không lưu câu trả lời
+                    incomplete_urls.append(page.url)
+                    errors.append(f"Scrape error for {page.url}: {page.error}")
+                    continue
+                futures[pool.submit(_extract_page, page)] = page.url
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    claims, status = future.result()
+                except Exception as exc:  # pragma: no cover - phụ thuộc LLM/network
+                    extract_failed = True
+                    errors.append(f"Extract error for {url}: {exc}")
+                    continue
+                _record_extraction(url, claims, status, claims_by_url, new_source_urls, incomplete_urls, errors)
+
+    return _finish_extract(
+        state, urls, claims_by_url, known_urls, new_source_urls, incomplete_urls, errors, extract_failed
+    )
+
+
+async def aextract_node(state: WorkflowState) -> WorkflowState:
+    """
+    Phiên bản async của `extract_node`: scrape bằng `scrape_many` trên event loop
+    hiện tại, mỗi trang xong được trích xuất trong thread (tối đa EXTRACT_MAX_WORKERS
+    trang cùng lúc).
+    """
+    urls = (state.get("search_results") or [])[:max(MAX_URLS_TO_PROCESS, 0)]
+    errors: List[str] = []
+
+    claims_by_url, known_urls = await asyncio.to_thread(_claims_from_store, urls, errors)
+    new_urls = [u for u in urls if u not in known_urls]
+
+    new_source_urls: List[str] = []
+    incomplete_urls: List[str] = []
+    failed: List[str] = []
+    if new_urls:
+        slots = asyncio.Semaphore(max(1, EXTRACT_MAX_WORKERS))
+
+        async def _extract(page: ScrapeResult) -> None:
+            async with slots:
+                try:
+                    claims, status = await asyncio.to_thread(_extract_page, page)
+                except Exception as exc:  # pragma: no cover - phụ thuộc LLM/network
+                    failed.append(page.url)
+                    errors.append(f"Extract error for {page.url}: {exc}")
+                    return
+                _record_extraction(page.url, claims, status, claims_by_url, new_source_urls, incomplete_urls, errors)
+
+        tasks = []
+        async for page in scrape_many(new_urls):
+            if page.error:
+                incomplete_urls.append(page.url)
+                errors.append(f"Scrape error for {page.url}: {page.error}")
+                continue
+            tasks.append(asyncio.create_task(_extract(page)))
+        await asyncio.gather(*tasks)
+
+    return _finish_extract(
+        state, urls, claims_by_url, known_urls, new_source_urls, incomplete_urls, errors, bool(failed)
+    )
+
+
 def resolve_node(state: WorkflowState) -> WorkflowState:
     """
     Node Resolve: hợp nhất các claim bằng thuật toán Weighted Voting
     (đã cài đặt trong Resolver Agent).
+
+    Claim của các URL mới được upsert vào claim store; mỗi nhóm
+    (subject, predicate) được resolve trên toàn bộ claim đã biết, và chỉ các
+    nhóm có claim mới mới phải resolve lại. Nếu bước Extract có trang lỗi hoặc
+    trích xuất dở (VD: hết quota), câu trả lời không được lưu cho truy vấn để
+    lần chạy sau trích xuất lại thay vì trả lời từ kết quả thiếu.
     """
     claims = state.get("claims") or []
-    debug: Dict[str, Any] = dict(state.get("debug_info") or {})
+    crop = state.get("crop", "").strip()
+    debug: Dict[str, Any] = {}
 
     resolved: List[ResolvedClaim] = []
     if claims:
-        resolved = group_and_resolve_claims(claims)
+        try:
+            store = get_claim_store()
+            group_keys, resolved, num_fresh = store.upsert_and_resolve(
+                claims,
+                state.get("new_source_urls") or [],
+                resolve_claims_for_group,
+            )
+            extraction_complete = (state.get("debug_info") or {}).get("extraction_complete", True)
+            if crop and group_keys and extraction_complete:
+                store.record_query(crop, group_keys)
+            debug["num_groups_resolved_fresh"] = num_fresh
+        except Exception as exc:
+            debug.setdefault("errors", []).append(f"Claim store error: {exc}")
+            resolved = group_and_resolve_claims(claims)
 
     debug["num_resolved_claims"] = len(resolved)
 
     return {
-        **state,
         "resolved_claims": resolved,
         "debug_info": debug,
     }
 
 
+async def aresolve_node(state: WorkflowState) -> WorkflowState:
+    """Phiên bản async của `resolve_node` (claim store + judge chạy trong thread)."""
+    return await asyncio.to_thread(resolve_node, state)
+
+
 def _format_resolved_claim(rc: ResolvedClaim) -> str:
     """
     Format 1 ResolvedClaim thành một câu/text ngắn.
@@ -367,23 +524,35 @@ def writer_node(state: WorkflowState) -> WorkflowState:
 
         summary = "\n".join(lines)
 
-    return {
-        **state,
-        "summary": summary,
-    }
+    return {"summary": summary}
+
+
+async def awriter_node(state: WorkflowState) -> WorkflowState:
+    """Phiên bản async của `writer_node` (rule-based, không I/O)."""
+    return writer_node(state)
+
+
+def _node(name: str, func, afunc) -> RunnableLambda:
+    """Node có cả bản đồng bộ (invoke/stream) và bản async (ainvoke/astream)."""
+    return RunnableLambda(func, afunc=afunc, name=name)
 
 
 def build_workflow_graph() -> StateGraph:
     """
     Khởi tạo và trả về StateGraph (chưa compile) cho workflow Agri-Agent.
+
+    Mỗi node có hai bản: `invoke`/`stream` chạy bản đồng bộ, `ainvoke`/`astream`
+    chạy bản async (search/scrape trên event loop của caller).
     """
     graph = StateGraph(WorkflowState)
-    graph.add_node("search", search_node)
-    graph.add_node("extract", extract_node)
-    graph.add_node("resolve", resolve_node)
-    graph.add_node("writer", writer_node)
-
-    graph.set_entry_point("search")
+    graph.add_node("lookup", _node("lookup", lookup_node, alookup_node))
+    graph.add_node("search", _node("search", search_node, asearch_node))
+    graph.add_node("extract", _node("extract", extract_node, aextract_node))
+    graph.add_node("resolve", _node("resolve", resolve_node, aresolve_node))
+    graph.add_node("writer", _node("writer", writer_node, awriter_node))
+
+    graph.set_entry_point("lookup")
+    graph.add_conditional_edges("lookup", _route_after_lookup, {"search": "search", "writer": "writer"})
     graph.add_edge("search", "extract")
     graph.add_edge("extract", "resolve")
     graph.add_edge("resolve", "writer")
@@ -392,18 +561,102 @@ def build_workflow_graph() -> StateGraph:
     return graph
 
 
+_compiled_app = None
+_compiled_app_lock = threading.Lock()
+
+
 def get_compiled_app():
     """
-    Trả về đối tượng app LangGraph đã compile, dùng để gọi từ bên ngoài.
+    Trả về app LangGraph đã compile, dùng chung cho toàn process.
+
+    Graph chỉ được build/compile một lần; app đã compile không giữ state giữa
+    các lần chạy nên dùng đồng thời được từ nhiều thread/coroutine.
     """
-    graph = build_workflow_graph()
-    return graph.compile()
+    global _compiled_app
+    if _compiled_app is None:
+        with _compiled_app_lock:
+            if _compiled_app is None:
+                _compiled_app = build_workflow_graph().compile()
+    return _compiled_app
+
+
+def estimate_workflow_cost(crop: str) -> CostEstimate:
+    """
+    Ước lượng chi phí LLM của một lần chạy workflow (trước khi search/scrape).
+
+    Truy vấn đã được trả lời trong claim store thì chi phí = 0; ngược lại giả sử
+    MAX_URLS_TO_PROCESS trang mới (mỗi trang ESTIMATED_PAGE_CHARS ký tự) cộng
+    một lô judge mâu thuẫn ở bước Resolve.
+    """
+    crop = crop.strip()
+    if crop:
+        try:
+            if get_claim_store().answer_for_query(crop) is not None:
+                return CostEstimate()
+        except Exception:
+            pass
+
+    page_cost = estimate_extraction_cost(num_chars=ESTIMATED_PAGE_CHARS)
+    estimate = CostEstimate()
+    for _ in range(MAX_URLS_TO_PROCESS):
+        estimate += page_cost
+    return estimate + estimate_judge_cost(JUDGE_BATCH_SIZE)
+
+
+@dataclass
+class WorkflowUpdate:
+    """
+    Cập nhật sau mỗi node khi stream workflow.
+
+    `state` là snapshot sau node: reducer của `claims`/`debug_info` tạo
+    list/dict mới nên các node sau không sửa nó (claim bên trong vẫn dùng chung).
+    """
+
+    node: str  # "lookup" | "search" | "extract" | "resolve" | "writer"
+    update: Dict[str, Any]  # Phần state node vừa trả về (partial update)
+    state: WorkflowState  # Trạng thái đầy đủ sau node
+
+
+class _UpdateTracker:
+    """Ghép chunk "updates" (node nào vừa chạy) với chunk "values" (state sau node đó)."""
+
+    def __init__(self, state: WorkflowState) -> None:
+        self.state = state
+        self._pending: Dict[str, Any] = {}
+
+    def feed(self, mode: str, chunk: Dict[str, Any]) -> List[WorkflowUpdate]:
+        if mode == "updates":
+            self._pending = chunk or {}
+            return []
+        self.state = chunk
+        pending, self._pending = self._pending, {}
+        return [WorkflowUpdate(node, update or {}, chunk) for node, update in pending.items()]
+
+
+def _initial_state(crop: str, initial_query: Optional[str], check_quota: bool) -> WorkflowState:
+    """State ban đầu; kiểm tra quota LLM trước nếu `check_quota` (có thể raise AdmissionDeniedError)."""
+    debug: Dict[str, Any] = {}
+    if check_quota:
+        decision = get_admission_controller().admit(estimate_workflow_cost(crop))
+        debug["admission"] = decision.to_dict()
+
+    return {
+        "crop": crop,
+        "query": initial_query or _build_search_query(crop),
+        "search_results": [],
+        "claims": [],
+        "new_source_urls": [],
+        "resolved_claims": [],
+        "summary": "",
+        "debug_info": debug,
+    }
 
 
 def run_agri_workflow(
     crop: str,
     *,
     initial_query: Optional[str] = None,
+    check_quota: bool = True,
 ) -> WorkflowState:
     """
     Hàm tiện ích cấp cao: chạy toàn bộ workflow cho một cây trồng/câu hỏi.
@@ -414,30 +667,104 @@ def run_agri_workflow(
         Tên cây trồng/đối tượng chính (VD: 'Lúa ST25').
     initial_query:
         Nếu muốn tự cung cấp câu query cho search (tuỳ chọn).
+    check_quota:
+        Ước lượng chi phí LLM và từ chối chạy nếu vượt quota còn lại trong ngày.
 
     Returns
     -------
     WorkflowState
         Trạng thái cuối cùng sau khi workflow chạy xong
         (bao gồm summary, resolved_claims, debug_info, ...).
+
+    Raises
+    ------
+    AdmissionDeniedError
+        Nếu `check_quota` và ước lượng chi phí vượt quota LLM còn lại.
     """
-    app = get_compiled_app()
-    init_state: WorkflowState = {
-        "crop": crop,
-        "query": initial_query or _build_search_query(crop),
-        "search_results": [],
-        "claims": [],
-        "resolved_claims": [],
-        "summary": "",
-        "debug_info": {},
-    }
-    result: WorkflowState = app.invoke(init_state)
+    init_state = _initial_state(crop, initial_query, check_quota)
+    result: WorkflowState = get_compiled_app().invoke(init_state)
     return result
 
 
+def stream_agri_workflow(
+    crop: str,
+    *,
+    initial_query: Optional[str] = None,
+    check_quota: bool = True,
+) -> Iterator[WorkflowUpdate]:
+    """
+    Như `run_agri_workflow` nhưng yield một `WorkflowUpdate` ngay sau mỗi node
+    (Streamlit hiển thị tiến độ/kết quả dần). `update.state` của phần tử cuối
+    là trạng thái cuối cùng.
+    """
+    init_state = _initial_state(crop, initial_query, check_quota)
+    tracker = _UpdateTracker(init_state)
+    for mode, chunk in get_compiled_app().stream(init_state, stream_mode=["updates", "values"]):
+        yield from tracker.feed(mode, chunk)
+
+
+async def astream_agri_workflow(
+    crop: str,
+    *,
+    initial_query: Optional[str] = None,
+    check_quota: bool = True,
+) -> AsyncIterator[WorkflowUpdate]:
+    """
+    Phiên bản async của `stream_agri_workflow`: chạy các node async trên event
+    loop của caller, nên một event loop (VD: FastAPI) phục vụ được nhiều lượt
+    phân tích đồng thời.
+    """
+    init_state = await asyncio.to_thread(_initial_state, crop, initial_query, check_quota)
+    tracker = _UpdateTracker(init_state)
+    async for mode, chunk in get_compiled_app().astream(init_state, stream_mode=["updates", "values"]):
+        for item in tracker.feed(mode, chunk):
+            yield item
+
+
+async def arun_agri_workflow(
+    crop: str,
+    *,
+    initial_query: Optional[str] = None,
+    check_quota: bool = True,
+    on_update: Optional[Callable[[WorkflowUpdate], Any]] = None,
+) -> WorkflowState:
+    """
+    Phiên bản async của `run_agri_workflow`.
+
+    Parameters
+    ----------
+    on_update:
+        Callback (hàm thường hoặc coroutine function) được gọi sau mỗi node
+        với `WorkflowUpdate`, VD: đẩy tiến độ qua WebSocket/SSE.
+
+    Returns
+    -------
+    WorkflowState
+        Trạng thái cuối cùng sau khi workflow chạy xong.
+
+    Raises
+    ------
+    AdmissionDeniedError
+        Nếu `check_quota` và ước lượng chi phí vượt quota LLM còn lại.
+    """
+    state: Optional[WorkflowState] = None
+    async for item in astream_agri_workflow(crop, initial_query=initial_query, check_quota=check_quota):
+        state = item.state
+        if on_update is not None:
+            result = on_update(item)
+            if inspect.isawaitable(result):
+                await result
+    return state or {}
+
+
 __all__ = [
     "WorkflowState",
+    "WorkflowUpdate",
     "run_agri_workflow",
+    "arun_agri_workflow",
+    "stream_agri_workflow",
+    "astream_agri_workflow",
+    "estimate_workflow_cost",
     "get_compiled_app",
     "build_workflow_graph",
 ]
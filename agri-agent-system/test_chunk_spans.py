@@ -0,0 +1,74 @@
+"""
+Test chia chunk theo offset câu (_chunk_spans) và loại claim trùng do vùng chồng lấp.
+
+Sử dụng: python -m pytest test_chunk_spans.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.agents.extractor import _chunk_spans, _OverlapDeduplicator
+from src.models import AgriClaim
+
+TEXT = " ".join(f"Câu số {i} nói về năng suất lúa ST25 đạt {i % 9 + 1} tấn/ha." for i in range(300))
+
+
+def test_short_text_is_one_span():
+    assert _chunk_spans("Lúa ST25.", chunk_size=2000) == [(0, 9)]
+
+
+@pytest.mark.parametrize("chunk_size,overlap", [(500, 100), (2000, 200), (3000, 200)])
+def test_spans_cover_text_on_sentence_boundaries(chunk_size, overlap):
+    spans = _chunk_spans(TEXT, chunk_size=chunk_size, overlap=overlap)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(TEXT)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        assert end - start <= chunk_size
+        # Đoạn sau lùi lại đúng `overlap` ký tự và luôn tiến lên
+        assert next_start == end - overlap
+        assert next_end > end
+    for _start, end in spans[:-1]:
+        assert TEXT[end - 2:end] == ". "
+
+
+def test_sentence_longer_than_chunk_stands_alone():
+    long_sentence = "x" * 800 + ". "
+    text = "Câu ngắn. " + long_sentence + "Câu cuối."
+    spans = _chunk_spans(text, chunk_size=300, overlap=50)
+
+    assert spans[-1][1] == len(text)
+    assert any(text[start:end].endswith(long_sentence) for start, end in spans)
+    assert all(b > a for (_, a), (_, b) in zip(spans, spans[1:]))
+
+
+def _claim(obj, subject="Lúa ST25", predicate="Năng suất"):
+    return AgriClaim(subject=subject, predicate=predicate, object=obj, confidence=0.8)
+
+
+def test_overlap_duplicates_are_dropped():
+    text = "Mở đầu. Lúa ST25 đạt 8 tấn/ha ở Sóc Trăng. Kết thúc phần hai."
+    pos = text.index("Lúa")
+    spans = [(0, pos + 40), (pos, len(text))]
+    dedup = _OverlapDeduplicator(text, spans)
+
+    assert dedup.accept(_claim("8 tấn/ha"), 0)
+    # Cùng sự kiện trong vùng chồng lấp, model diễn đạt object khác một chút
+    assert not dedup.accept(_claim("8 tấn/ha ở Sóc Trăng"), 1)
+    # Trùng hoàn toàn cũng bị loại; khác predicate thì giữ
+    assert not dedup.accept(_claim("8 tấn/ha"), 1)
+    assert dedup.accept(_claim("8 tấn/ha", predicate="Năng suất thực tế"), 1)
+
+
+def test_same_value_outside_overlap_is_kept():
+    text = "Lúa ST25 đạt 8 tấn/ha vụ một. Phần giữa rất dài. Lúa ST25 đạt 8 tấn/ha vụ hai."
+    spans = [(0, 30), (28, len(text))]
+    dedup = _OverlapDeduplicator(text, spans)
+
+    assert dedup.accept(_claim("8 tấn/ha vụ một"), 0)
+    assert dedup.accept(_claim("8 tấn/ha vụ hai"), 1)
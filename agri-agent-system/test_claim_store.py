@@ -0,0 +1,113 @@
+"""
+Test claim store: upsert nguồn mới và chỉ resolve lại nhóm có thay đổi.
+
+Sử dụng: python -m pytest test_claim_store.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.agents.resolver import ResolvedClaim
+from src.models import AgriClaim
+from src.utils.claim_store import ClaimStore
+
+
+def _claim(obj: str, url: str = None, predicate: str = "Năng suất") -> AgriClaim:
+    return AgriClaim(subject="Lúa ST25", predicate=predicate, object=obj, confidence=0.8, source_url=url)
+
+
+class _CountingResolver:
+    """Resolver giả: lấy claim đầu tiên làm gold, đếm số lần được gọi."""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def __call__(self, claims):
+        self.calls.append(list(claims))
+        return ResolvedClaim(
+            gold_claim=claims[0],
+            support_urls=[c.source_url for c in claims if c.source_url],
+            total_score=float(len(claims)),
+            cluster_values=[c.object for c in claims],
+        )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ClaimStore(path=tmp_path / "claims.sqlite3")
+    yield store
+    store.close()
+
+
+def test_new_source_is_recorded_and_resolved(store):
+    resolver = _CountingResolver()
+    claims = [_claim("8.5 tấn/ha", "https://a.gov.vn/x"), _claim("95 ngày", "https://a.gov.vn/x", "Thời gian")]
+
+    group_keys, resolved, num_fresh = store.upsert_and_resolve(claims, ["https://a.gov.vn/x"], resolver)
+
+    assert len(group_keys) == 2
+    assert num_fresh == 2
+    assert len(resolved) == 2
+    assert store.known_sources(["https://a.gov.vn/x", "https://b.vn/y"]) == {"https://a.gov.vn/x"}
+    assert len(store.claims_for_sources(["https://a.gov.vn/x"])["https://a.gov.vn/x"]) == 2
+
+
+def test_unchanged_group_reuses_stored_result(store):
+    resolver = _CountingResolver()
+    claims = [_claim("8.5 tấn/ha", "https://a.gov.vn/x")]
+    store.upsert_and_resolve(claims, ["https://a.gov.vn/x"], resolver)
+
+    # Lần chạy sau: claim lấy lại từ store, không có nguồn mới
+    _, resolved, num_fresh = store.upsert_and_resolve(claims, [], resolver)
+
+    assert num_fresh == 0
+    assert len(resolver.calls) == 1
+    assert resolved[0].gold_claim.object == "8.5 tấn/ha"
+
+
+def test_new_claim_only_resolves_its_group(store):
+    resolver = _CountingResolver()
+    first = [_claim("8.5 tấn/ha", "https://a.gov.vn/x"), _claim("95 ngày", "https://a.gov.vn/x", "Thời gian")]
+    store.upsert_and_resolve(first, ["https://a.gov.vn/x"], resolver)
+
+    second = first + [_claim("8.7 tấn/ha", "https://b.edu.vn/y")]
+    _, _, num_fresh = store.upsert_and_resolve(second, ["https://b.edu.vn/y"], resolver)
+
+    assert num_fresh == 1
+    # Nhóm "Năng suất" được resolve lại trên toàn bộ claim đã biết của nhóm
+    assert {c.object for c in resolver.calls[-1]} == {"8.5 tấn/ha", "8.7 tấn/ha"}
+
+
+def test_unrecorded_source_is_resolved_but_not_persisted(store):
+    resolver = _CountingResolver()
+    # URL trích xuất dở (không nằm trong new_sources): dùng cho lần chạy này, không lưu
+    claims = [_claim("8.5 tấn/ha", "https://a.gov.vn/x"), _claim("7 tấn/ha", "https://partial.vn/p")]
+
+    _, resolved, _ = store.upsert_and_resolve(claims, ["https://a.gov.vn/x"], resolver)
+
+    assert {c.object for c in resolver.calls[-1]} == {"8.5 tấn/ha", "7 tấn/ha"}
+    assert store.known_sources(["https://partial.vn/p"]) == set()
+    assert store.claims_for_sources(["https://partial.vn/p"])["https://partial.vn/p"] == []
+    assert resolved[0].total_score == 2.0
+
+
+def test_query_answer_roundtrip_and_ttl(tmp_path, store):
+    resolver = _CountingResolver()
+    claims = [_claim("8.5 tấn/ha", "https://a.gov.vn/x")]
+    group_keys, _, _ = store.upsert_and_resolve(claims, ["https://a.gov.vn/x"], resolver)
+    store.record_query("Lúa  ST25", group_keys)
+
+    answer = store.answer_for_query("lúa st25")
+    assert answer is not None
+    resolved, answer_claims = answer
+    assert resolved[0].gold_claim.object == "8.5 tấn/ha"
+    assert [c.object for c in answer_claims] == ["8.5 tấn/ha"]
+
+    no_ttl = ClaimStore(path=tmp_path / "claims.sqlite3", ttl=0)
+    assert no_ttl.answer_for_query("lúa st25") is None
+    no_ttl.close()
@@ -0,0 +1,87 @@
+"""
+Test node Extract: URL scrape lỗi làm lần trích xuất không đầy đủ, nên node
+Resolve không lưu câu trả lời cho truy vấn (bản đồng bộ và async).
+
+Sử dụng: python -m pytest test_extract_node.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.agents.extractor import ExtractionStatus
+from src.models import AgriClaim
+from src.tools.scraper import ScrapeResult
+from src.workflows import main
+
+URLS = ["https://a.vn/lua-st25", "https://b.vn/lua-st25"]
+
+
+class _FakeClaimStore:
+    def __init__(self):
+        self.recorded = []
+
+    def known_sources(self, urls):
+        return set()
+
+    def claims_for_sources(self, urls):
+        return {}
+
+    def upsert_and_resolve(self, claims, new_source_urls, resolve_group):
+        return [("Lúa ST25", "Năng suất")], [], 1
+
+    def record_query(self, crop, group_keys):
+        self.recorded.append((crop, group_keys))
+
+
+def _pages(urls):
+    for url in urls:
+        if url == URLS[1]:
+            yield ScrapeResult(url=url, encoding="utf-8", raw_html="", text="", error="timed out")
+        else:
+            yield ScrapeResult(url=url, encoding="utf-8", raw_html="<p>x</p>", text="Lúa ST25 đạt 7 tấn/ha.")
+
+
+async def _apages(urls):
+    for page in _pages(urls):
+        yield page
+
+
+def _extract_page(page):
+    status = ExtractionStatus(chunks=1, completed_chunks=1)
+    claim = AgriClaim(subject="Lúa ST25", predicate="Năng suất", object="7 tấn/ha", source_url=page.url, confidence=0.8)
+    return [claim], status
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = _FakeClaimStore()
+    monkeypatch.setattr(main, "get_claim_store", lambda: store)
+    monkeypatch.setattr(main, "iter_scrape_many", _pages)
+    monkeypatch.setattr(main, "scrape_many", _apages)
+    monkeypatch.setattr(main, "_extract_page", _extract_page)
+    return store
+
+
+def _resolve_after(update, store):
+    assert update["debug_info"]["extraction_complete"] is False
+    assert update["debug_info"]["incomplete_source_urls"] == [URLS[1]]
+    assert update["new_source_urls"] == [URLS[0]]
+
+    main.resolve_node({"crop": "Lúa ST25", **update})
+    assert store.recorded == []
+
+
+def test_scrape_error_blocks_record_query(store):
+    update = main.extract_node({"crop": "Lúa ST25", "search_results": URLS})
+    _resolve_after(update, store)
+
+
+def test_scrape_error_blocks_record_query_async(store):
+    update = asyncio.run(main.aextract_node({"crop": "Lúa ST25", "search_results": URLS}))
+    _resolve_after(update, store)
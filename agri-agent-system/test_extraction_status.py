@@ -0,0 +1,115 @@
+"""
+Test trạng thái trích xuất: trang có chunk lỗi/bị bỏ qua không được coi là xong.
+
+Sử dụng: python -m pytest test_extraction_status.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.agents import extractor
+from src.agents.extractor import ExtractionStatus, iter_claims_from_text
+from src.models import AgriClaim
+
+# Văn bản đủ dài để bị chia chunk (> 3000 ký tự)
+LONG_TEXT = " ".join(f"Câu số {i} nói về năng suất lúa ST25 đạt {i} tấn/ha." for i in range(200))
+
+
+@pytest.fixture(autouse=True)
+def no_extraction_cache(monkeypatch):
+    monkeypatch.setattr(extractor, "get_extraction_cache", lambda: None)
+
+
+def _fake_stream(endpoint, messages, raise_errors, on_complete=None, status=None):
+    claim = AgriClaim(subject="Lúa ST25", predicate="Năng suất", object=messages[-1].content[:20], confidence=0.8)
+    yield claim
+    if on_complete is not None:
+        on_complete([claim], "gemini-2.5-flash")
+
+
+def test_all_chunks_completed(monkeypatch):
+    monkeypatch.setattr(extractor, "_admit_llm_call", lambda raise_on_block: object())
+    monkeypatch.setattr(extractor, "_stream_claims_from_llm", _fake_stream)
+    status = ExtractionStatus()
+
+    claims = list(iter_claims_from_text(LONG_TEXT, status=status))
+
+    assert claims
+    assert status.chunks > 1
+    assert status.completed_chunks == status.chunks
+    assert status.complete
+
+
+def test_skipped_chunks_mark_page_incomplete(monkeypatch):
+    # Circuit breaker mở / hết ngân sách: chunk bị bỏ qua, không raise
+    monkeypatch.setattr(extractor, "_admit_llm_call", lambda raise_on_block: None)
+    status = ExtractionStatus()
+
+    claims = list(iter_claims_from_text(LONG_TEXT, status=status))
+
+    assert claims == []
+    assert status.chunks > 1
+    assert status.completed_chunks == 0
+    assert not status.complete
+    assert status.errors
+
+
+def test_partial_chunk_failure_marks_page_incomplete(monkeypatch):
+    calls = []
+
+    def admit(raise_on_block):
+        calls.append(1)
+        return object() if len(calls) % 2 else None
+
+    monkeypatch.setattr(extractor, "_admit_llm_call", admit)
+    monkeypatch.setattr(extractor, "_stream_claims_from_llm", _fake_stream)
+    monkeypatch.setattr(extractor, "CHUNK_MAX_WORKERS", 1)
+    status = ExtractionStatus()
+
+    claims = list(iter_claims_from_text(LONG_TEXT, status=status))
+
+    assert claims
+    assert 0 < status.completed_chunks < status.chunks
+    assert not status.complete
+
+
+class _DictCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def put(self, key, claims):
+        self.data[key] = list(claims)
+
+
+def test_cache_keyed_on_answering_model(monkeypatch):
+    # Router failover sang model thứ hai: kết quả được cache theo model đã trả lời
+    cache = _DictCache()
+    router = type("Router", (), {"models": ["gemini-2.5-flash", "gemini-2.5-flash-lite"]})()
+    monkeypatch.setattr(extractor, "get_extraction_cache", lambda: cache)
+    monkeypatch.setattr(extractor, "get_llm_router", lambda: router)
+    monkeypatch.setattr(extractor, "_admit_llm_call", lambda raise_on_block: object())
+
+    def failover_stream(endpoint, messages, raise_errors, on_complete=None, status=None):
+        claim = AgriClaim(subject="Lúa ST25", predicate="Năng suất", object="8 tấn/ha", confidence=0.8)
+        yield claim
+        on_complete([claim], "gemini-2.5-flash-lite")
+
+    monkeypatch.setattr(extractor, "_stream_claims_from_llm", failover_stream)
+    text = "Lúa ST25 đạt năng suất 8 tấn/ha."
+
+    assert len(list(iter_claims_from_text(text, use_chunking=False))) == 1
+    assert list(cache.data) == [extractor._cache_key(text, "gemini-2.5-flash-lite")]
+
+    # Lần sau lấy từ cache dù model ưu tiên chưa có kết quả
+    monkeypatch.setattr(extractor, "_admit_llm_call", lambda raise_on_block: pytest.fail("không được gọi LLM"))
+    status = ExtractionStatus()
+    assert len(list(iter_claims_from_text(text, use_chunking=False, status=status))) == 1
+    assert status.complete
@@ -0,0 +1,65 @@
+"""
+Test IncrementalClaimParser: parse dần output JSON dạng stream thành AgriClaim.
+
+Sử dụng: python -m pytest test_incremental_parser.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.agents.extractor import IncrementalClaimParser
+
+CLAIMS = [
+    {"subject": "Lúa ST25", "predicate": "Năng suất", "object": "8 tấn/ha", "confidence": 0.9},
+    {"subject": "Lúa ST25", "predicate": "Giải thưởng", "object": "Giải nhất {2019} \"ngon nhất\"", "confidence": 0.8},
+    {"subject": "Lúa ST24", "predicate": "Thời gian sinh trưởng", "object": "95-100 ngày", "context": "vụ Đông Xuân", "confidence": 0.7},
+]
+RESPONSE = "```json\n" + json.dumps(CLAIMS, ensure_ascii=False, indent=2) + "\n```"
+
+
+def _feed_all(pieces):
+    parser = IncrementalClaimParser()
+    claims = []
+    for piece in pieces:
+        claims.extend(parser.feed(piece))
+    return claims, parser
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, len(RESPONSE)])
+def test_any_split_yields_same_claims(size):
+    claims, _ = _feed_all(RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size))
+    assert [c.object for c in claims] == [c["object"] for c in CLAIMS]
+    assert claims[2].context == "vụ Đông Xuân"
+
+
+def test_claim_yielded_when_object_closes():
+    parser = IncrementalClaimParser()
+    first = json.dumps(CLAIMS[0], ensure_ascii=False)
+    assert parser.feed("[" + first[:-1]) == []
+    assert [c.object for c in parser.feed("}, {")] == ["8 tấn/ha"]
+
+
+def test_malformed_object_only_drops_itself():
+    raw = (
+        "[" + json.dumps(CLAIMS[0], ensure_ascii=False)
+        + ', {"subject": "Lúa", "predicate": "Năng suất"}'  # thiếu object/confidence
+        + ', {"subject": "Lúa", oops}, '
+        + json.dumps(CLAIMS[2], ensure_ascii=False) + "]"
+    )
+    claims, _ = _feed_all([raw])
+    assert [c.subject for c in claims] == ["Lúa ST25", "Lúa ST24"]
+
+
+def test_truncated_response_keeps_completed_claims():
+    raw = RESPONSE[: RESPONSE.index("Lúa ST24") + 5]
+    claims, parser = _feed_all([raw])
+    assert len(claims) == 2
+    # Buffer chỉ giữ object đang dở, không giữ phần đã parse
+    assert parser._buffer.startswith("{")
+    assert "Lúa ST25" not in parser._buffer
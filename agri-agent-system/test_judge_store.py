@@ -0,0 +1,98 @@
+"""
+Test judgement store: verdict chỉ được đọc lại dưới đúng version.
+
+Sử dụng: python -m pytest test_judge_store.py
+"""
+
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.agents import judge
+from src.models import AgriClaim
+from src.utils.judge_backends import get_gemini_backend, get_local_backend
+from src.utils.judge_store import LEGACY_VERSION, JudgeStore
+
+VERDICT = {"relation": "CONTRADICTED", "confidence": 0.9, "reasoning": "khác giải"}
+
+
+def test_get_matches_version_only(tmp_path):
+    path = tmp_path / "judgements.sqlite3"
+    JudgeStore(path, version="v1").put("pair", VERDICT)
+
+    assert JudgeStore(path, version="v1").get("pair")["relation"] == "CONTRADICTED"
+    assert JudgeStore(path, version="v2").get("pair") is None
+    assert JudgeStore(path, version="v2").get_many(["pair"]) == {}
+
+
+def test_invalidate_stale_keeps_current_version(tmp_path):
+    path = tmp_path / "judgements.sqlite3"
+    JudgeStore(path, version="v1").put_many([("a", VERDICT), ("b", VERDICT)])
+    store = JudgeStore(path, version="v2")
+    store.put("a", VERDICT)
+
+    assert store.invalidate_stale() == 2
+    assert store.count() == 1
+    assert set(store.get_many(["a", "b"])) == {"a"}
+
+
+def test_legacy_pickles_never_served(tmp_path):
+    with open(tmp_path / "pair.pkl", "wb") as f:
+        pickle.dump(VERDICT, f)
+    store = JudgeStore(tmp_path / "judgements.sqlite3", version="v1")
+
+    assert store.import_legacy_pickles(tmp_path) == 1
+    assert store.get("pair") is None
+    assert store.count() == 0
+    legacy = store.conn.execute(
+        "SELECT COUNT(*) FROM judgements WHERE version = ?", (LEGACY_VERSION,)
+    ).fetchone()[0]
+    assert legacy == 1
+    # Chỉ nhập một lần
+    assert store.import_legacy_pickles(tmp_path) == 0
+
+
+def test_single_pair_llm_error_not_cached(tmp_path, monkeypatch):
+    store = JudgeStore(tmp_path / "judgements.sqlite3", version="v1")
+    monkeypatch.setattr(judge, "get_judge_store", lambda: store)
+    monkeypatch.setattr(judge, "get_judge_backend", lambda: type("Gemini", (), {"judge_pairs": lambda self, pairs: None})())
+
+    def quota_error(messages, client=None):
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+    monkeypatch.setattr(judge, "_invoke_judge", quota_error)
+    claim1 = AgriClaim(subject="Lúa ST25", predicate="Giải thưởng", object="Giải nhất", confidence=0.9)
+    claim2 = AgriClaim(subject="Lúa ST25", predicate="Giải thưởng", object="Giải khuyến khích", confidence=0.9)
+
+    result = judge.judge_claims(claim1, claim2, use_embedding=False)
+
+    assert result["llm_error"]
+    assert store.count() == 0
+
+
+@pytest.mark.parametrize("backend, cached", [(get_local_backend(), False), (get_gemini_backend(), True)])
+def test_similarity_verdict_cached_only_for_gemini(tmp_path, monkeypatch, backend, cached):
+    store = JudgeStore(tmp_path / "judgements.sqlite3", version="v1")
+    monkeypatch.setattr(judge, "get_judge_store", lambda: store)
+    similar = np.array([[1.0, 0.99], [0.99, 1.0]])
+    monkeypatch.setattr(judge, "_pairwise_similarity_matrix", lambda objects, use_embedding: (similar, backend))
+    claim1 = AgriClaim(subject="Lúa ST25", predicate="Năng suất", object="6-7 tấn/ha", confidence=0.9)
+    claim2 = AgriClaim(subject="Lúa ST25", predicate="Năng suất", object="6 - 7 tấn/ha", confidence=0.9)
+
+    result = judge.judge_claims(claim1, claim2)
+
+    assert result["relation"] == "SUPPORTED"
+    assert store.count() == (1 if cached else 0)
+
+
+def test_judge_version_tracks_similarity_threshold(monkeypatch):
+    before = judge._judge_version()
+    monkeypatch.setattr(get_gemini_backend(), "support_threshold", 0.9)
+
+    assert judge._judge_version() != before
@@ -0,0 +1,38 @@
+"""
+Test LLM router: giới hạn endpoint theo model (judge chỉ failover trong một model).
+
+Sử dụng: python -m pytest test_llm_router.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.utils.llm_router import LLMEndpoint, LLMRouter
+from src.utils.rate_limiter import RequestBudget
+
+
+def _router(*models):
+    return LLMRouter(
+        [
+            LLMEndpoint(name=f"{model}#{i}", model=model, api_key=f"key-{i}", budget=RequestBudget(60, 0))
+            for i, model in enumerate(models)
+        ]
+    )
+
+
+def test_models_in_preference_order():
+    router = _router("gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.5-flash")
+    assert router.models == ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+
+
+def test_acquire_restricted_to_model():
+    router = _router("gemini-2.5-flash", "gemini-2.5-flash-lite")
+    primary = router.endpoints[0]
+    primary.cooldown_until = float("inf")  # Model ưu tiên đang cooldown vì 429
+
+    assert router.acquire(timeout=0).model == "gemini-2.5-flash-lite"
+    assert not router.has_available_endpoint(model="gemini-2.5-flash")
+    assert router.acquire(timeout=0, model="gemini-2.5-flash") is None
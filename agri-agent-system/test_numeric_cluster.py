@@ -0,0 +1,74 @@
+"""
+Test gom cụm giá trị số của resolver (cluster_numeric_values, sai số cấu hình được).
+
+Sử dụng: python -m pytest test_numeric_cluster.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+
+from src.agents.resolver import _cluster_numeric_values
+from src.models import AgriClaim
+from src.utils.numeric_cluster import (
+    DEFAULT_NUMERIC_ABS_TOLERANCE,
+    DEFAULT_NUMERIC_TOLERANCE,
+    cluster_numeric_values,
+    numeric_abs_tolerance,
+    numeric_tolerance,
+)
+
+
+def _groups(values, **kwargs):
+    labels, _ = cluster_numeric_values(values, **kwargs)
+    groups = {}
+    for value, label in zip(values, labels.tolist()):
+        groups.setdefault(label, []).append(value)
+    return sorted(groups.values())
+
+
+def test_close_values_share_cluster():
+    labels, centroids = cluster_numeric_values([8.0, 8.3, 12.0])
+    assert labels[0] == labels[1] != labels[2]
+    assert np.allclose(centroids, [8.15, 12.0])
+
+
+def test_drifting_chain_is_split():
+    # 100, 104, 108, ... không được nuốt hết vào một cụm
+    groups = _groups([100.0 + 4 * i for i in range(10)])
+    assert len(groups) > 1
+    for group in groups:
+        mid = (min(group) + max(group)) / 2
+        assert all(abs(v - mid) <= DEFAULT_NUMERIC_TOLERANCE * mid + 1e-9 for v in group)
+
+
+def test_values_near_zero_use_abs_tolerance():
+    # Chỉ dùng sai số tương đối: 0 và 0.01 tách cụm
+    assert len(_groups([0.0, 0.01, 0.02])) == 3
+    assert _groups([0.0, 0.01, 0.02], abs_tolerance=0.05) == [[0.0, 0.01, 0.02]]
+    assert _groups([-0.02, 0.0, 0.03], abs_tolerance=0.05) == [[-0.02, 0.0, 0.03]]
+    assert len(_groups([0.0, 0.2], abs_tolerance=0.05)) == 2
+
+
+def test_resolver_defaults_to_abs_tolerance():
+    claims = [
+        (AgriClaim(subject="Lúa", predicate="Tỷ lệ hạt lép", object=f"{v}%", confidence=0.8), v)
+        for v in (0.0, 0.02)
+    ]
+    assert len(_cluster_numeric_values(claims)) == 1
+
+
+def test_tolerances_from_env(monkeypatch):
+    monkeypatch.setenv("AGRI_NUMERIC_TOLERANCES", "duration=0.1,năng suất=0.02,bad=2")
+    monkeypatch.setenv("AGRI_NUMERIC_ABS_TOLERANCES", "duration=1,percent=0.5,bad=-1")
+
+    assert numeric_tolerance("Năng suất", "yield") == 0.02
+    assert numeric_tolerance("Thời gian", "duration") == 0.1
+    assert numeric_tolerance("Khác", "bad") == DEFAULT_NUMERIC_TOLERANCE
+    assert numeric_abs_tolerance("Thời gian", "duration") == 1.0
+    assert numeric_abs_tolerance("Khác", "bad") == DEFAULT_NUMERIC_ABS_TOLERANCE
+    assert numeric_abs_tolerance("Khác", "yield") == DEFAULT_NUMERIC_ABS_TOLERANCE
@@ -0,0 +1,99 @@
+"""
+Test numeric value parser: số, khoảng, đơn vị, phân cách hàng nghìn và ngày tháng.
+
+Sử dụng: python -m pytest test_numeric_value.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.utils.numeric_value import convert_value, parse_numeric_value
+
+
+@pytest.mark.parametrize(
+    "text, value, unit",
+    [
+        ("8.5 tấn/ha", 8.5, "tấn/ha"),
+        ("8,5 tấn/ha", 8.5, "tấn/ha"),
+        ("85 tạ/ha", 8.5, "tấn/ha"),
+        ("8500 kg / ha", 8.5, "tấn/ha"),
+        ("95-100 ngày", 97.5, "ngày"),
+        ("3 - 4 tháng", 105.0, "ngày"),
+        ("12,5%", 12.5, "%"),
+        ("0.125 kg", 0.125, "kg"),
+    ],
+)
+def test_known_units_are_converted_to_canonical(text, value, unit):
+    parsed = parse_numeric_value(text)
+    assert parsed is not None
+    assert parsed.value == pytest.approx(value)
+    assert parsed.unit == unit
+
+
+def test_range_keeps_bounds():
+    parsed = parse_numeric_value("95 đến 100 ngày")
+    assert parsed.is_range
+    assert (parsed.low, parsed.high) == (95.0, 100.0)
+
+
+@pytest.mark.parametrize(
+    "text, value",
+    [
+        ("1.000 kg", 1000.0),
+        ("1,000 kg", 1000.0),
+        ("12.500 đồng/kg", 12500.0),
+        ("1.000.000 đồng", 1_000_000.0),
+        ("1.250,5 kg", 1250.5),
+        ("1,250.5 kg", 1250.5),
+    ],
+)
+def test_single_separator_before_three_digits_is_thousands(text, value):
+    assert parse_numeric_value(text).value == pytest.approx(value)
+
+
+def test_unknown_unit_is_kept_raw():
+    parsed = parse_numeric_value("12.500 đồng/kg")
+    assert parsed.dimension is None
+    assert parsed.unit_key == "raw:đồng/kg"
+
+
+def test_year_is_only_a_fallback():
+    assert parse_numeric_value("vụ 2019 đạt 8.5 tấn/ha").value == pytest.approx(8.5)
+    assert parse_numeric_value("vụ 2019 đạt 8.5").value == pytest.approx(8.5)
+    assert parse_numeric_value("năm 2019").value == 2019.0
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["gieo tháng 3 năm 2020", "thu hoạch ngày 15 tháng 6 năm 2021", "xuống giống 3 năm 2020"],
+)
+def test_dates_are_not_durations(text):
+    parsed = parse_numeric_value(text)
+    assert parsed is None or parsed.dimension != "duration"
+
+
+def test_date_does_not_hide_real_value():
+    parsed = parse_numeric_value("ngày 15 tháng 6 năm 2021 đạt 8 tấn/ha")
+    assert parsed.value == pytest.approx(8.0)
+    assert parsed.dimension == "yield"
+
+
+def test_duration_still_parsed():
+    assert parse_numeric_value("sau 3 năm").value == pytest.approx(3 * 365)
+    assert parse_numeric_value("thời gian sinh trưởng 95 ngày").value == pytest.approx(95.0)
+
+
+def test_no_number_returns_none():
+    assert parse_numeric_value("chịu mặn tốt") is None
+    assert parse_numeric_value("") is None
+
+
+def test_convert_value_between_units():
+    assert convert_value(85, "tạ/ha", "tấn/ha") == pytest.approx(8.5)
+    assert convert_value(2, "tuần", "ngày") == pytest.approx(14)
+    assert convert_value(1, "kg", "ngày") is None
@@ -0,0 +1,61 @@
+"""
+Test page cache: thay nội dung một URL không để lại blob mồ côi, blob dùng
+chung giữa nhiều URL chỉ bị xóa khi không còn URL nào trỏ tới.
+
+Sử dụng: python -m pytest test_page_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.tools.page_cache import PageCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PageCache(tmp_path / "page_cache")
+
+
+def _blobs(cache: PageCache):
+    return [p for p in cache.blob_dir.rglob("*") if p.is_file()]
+
+
+def _disk_bytes(cache: PageCache) -> int:
+    return sum(p.stat().st_size for p in _blobs(cache))
+
+
+def test_reput_with_new_body_removes_old_blob(cache):
+    cache.put("https://a.vn/bai-viet", b"<html>ban cu</html>", "utf-8", "ban cu")
+    new_body = b"<html>ban moi, dai hon ban cu</html>"
+    cache.put("https://a.vn/bai-viet", new_body, "utf-8", "ban moi")
+
+    assert len(_blobs(cache)) == 1
+    assert _disk_bytes(cache) == len(new_body)
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["total_bytes"] == len(new_body)
+    assert cache.get("https://a.vn/bai-viet").body == new_body
+
+
+def test_reput_keeps_blob_shared_with_other_url(cache):
+    shared = b"<html>noi dung chung</html>"
+    cache.put("https://a.vn/x", shared, "utf-8", "chung")
+    cache.put("https://b.vn/y", shared, "utf-8", "chung")
+    cache.put("https://a.vn/x", b"<html>khac</html>", "utf-8", "khac")
+
+    assert len(_blobs(cache)) == 2
+    assert cache.get("https://b.vn/y").body == shared
+
+
+def test_reput_same_body_keeps_blob(cache):
+    body = b"<html>giong nhau</html>"
+    cache.put("https://a.vn/x", body, "utf-8", "giong")
+    cache.put("https://a.vn/x", body, "utf-8", "giong")
+
+    assert len(_blobs(cache)) == 1
+    assert cache.get("https://a.vn/x").body == body
@@ -0,0 +1,72 @@
+"""
+Test ngày quota (0h giờ Pacific, có giờ mùa hè) dùng chung cho usage ledger và RequestBudget.
+
+Sử dụng: python -m pytest test_quota_window.py
+"""
+
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.utils import rate_limiter
+from src.utils.quota_window import quota_window
+from src.utils.rate_limiter import RateLimitStore, RequestBudget, SharedRequestBudget
+from src.utils.usage_ledger import UsageLedger
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+
+def _utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_window_follows_daylight_time():
+    # Mùa hè (PDT, UTC-7): reset lúc 07:00 UTC; mùa đông (PST, UTC-8): 08:00 UTC
+    assert quota_window(_utc(2025, 7, 1, 12), PACIFIC) == (_utc(2025, 7, 1, 7), _utc(2025, 7, 2, 7))
+    assert quota_window(_utc(2025, 1, 15, 12), PACIFIC) == (_utc(2025, 1, 15, 8), _utc(2025, 1, 16, 8))
+    # 07:30 UTC ngày 1/7 đã sang ngày quota mới (offset -8 cố định thì chưa)
+    assert quota_window(_utc(2025, 7, 1, 7, 30), PACIFIC)[0] == _utc(2025, 7, 1, 7)
+
+
+def test_transition_days_are_not_24h():
+    start, end = quota_window(_utc(2025, 3, 9, 20), PACIFIC)
+    assert end - start == 23 * 3600
+    start, end = quota_window(_utc(2025, 11, 2, 20), PACIFIC)
+    assert end - start == 25 * 3600
+
+
+def test_ledger_snapshot_resets_at_window_end(tmp_path):
+    ledger = UsageLedger(tmp_path / "usage.sqlite3", reset_timezone=PACIFIC)
+    now = _utc(2025, 7, 1, 12)
+    snapshot = ledger.usage("gemini-2.5-flash", now=now)
+    assert (snapshot.window_start, snapshot.resets_at) == quota_window(now, PACIFIC)
+
+
+def test_request_budget_resets_at_quota_boundary(monkeypatch):
+    clock = [_utc(2025, 7, 1, 6, 59)]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: clock[0])
+    budget = RequestBudget(requests_per_minute=60, requests_per_day=1, reset_timezone=PACIFIC)
+
+    assert budget.try_acquire() == (True, None)
+    assert budget.try_acquire() == (False, None)
+    # Hai phút sau là ngày quota mới (0h PDT), không phải 24h sau request đầu
+    clock[0] = _utc(2025, 7, 1, 7, 1)
+    assert budget.remaining_today() == 1
+
+
+def test_shared_budget_exhausted_until_reset(tmp_path, monkeypatch):
+    clock = [_utc(2025, 7, 1, 12)]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: clock[0])
+    store = RateLimitStore(tmp_path / "rate_limits.sqlite3")
+    budget = SharedRequestBudget(store, requests_per_minute=60, requests_per_day=1, reset_timezone=PACIFIC)
+
+    assert budget.try_acquire()[0]
+    assert budget.try_acquire() == (False, None)
+    assert budget._exhausted_until == _utc(2025, 7, 2, 7)
+    clock[0] = _utc(2025, 7, 2, 7, 1)
+    assert budget.remaining_today() == 1
+    assert budget.try_acquire()[0]
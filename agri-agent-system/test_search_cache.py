@@ -0,0 +1,97 @@
+"""
+Test search cache: query chuẩn hóa, trạng thái fresh / stale / hết hạn, LRU và
+stale-while-revalidate trong `_run_variant`.
+
+Sử dụng: python -m pytest test_search_cache.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.tools import search
+from src.tools.search import SearchVariant
+from src.tools.search_cache import SearchCache, normalize_query
+
+TTL = 100.0
+MAX_STALE = 1000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return SearchCache(tmp_path / "search_cache.sqlite3", ttl=TTL, max_stale=MAX_STALE, max_entries=3)
+
+
+def test_normalized_query_variants_share_entry(cache):
+    assert normalize_query("  Lúa\tST25 ") == normalize_query("lúa st25")
+    cache.put("ddg", "Lúa  ST25", "vn-vi", ["https://a.vn"])
+
+    assert cache.get("ddg", "lúa st25", "vn-vi").urls == ["https://a.vn"]
+    # Khác region/provider là entry khác
+    assert cache.get("ddg", "lúa st25", None) is None
+    assert cache.get("tavily", "lúa st25", "vn-vi") is None
+
+
+def test_fresh_then_stale_then_expired(cache, clock):
+    cache.put("ddg", "lúa st25", "vn-vi", ["https://a.vn"])
+
+    assert cache.get("ddg", "lúa st25", "vn-vi").fresh
+    clock[0] += TTL
+    stale = cache.get("ddg", "lúa st25", "vn-vi")
+    assert stale is not None and not stale.fresh
+    clock[0] += MAX_STALE - TTL
+    assert cache.get("ddg", "lúa st25", "vn-vi") is None
+
+    stats = cache.stats()
+    assert (stats["fresh_hits"], stats["stale_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_empty_result_is_cached(cache):
+    cache.put("ddg", "giống lạ", "vn-vi", [])
+    cached = cache.get("ddg", "giống lạ", "vn-vi")
+    assert cached is not None and cached.urls == []
+
+
+def test_evicts_least_recently_accessed(cache, clock):
+    for i in range(3):
+        cache.put("ddg", f"q{i}", None, [f"https://{i}.vn"])
+        clock[0] += 1
+    cache.get("ddg", "q0", None)  # q0 vừa được dùng, q1 ít dùng nhất
+    clock[0] += 1
+    cache.put("ddg", "q3", None, ["https://3.vn"])
+
+    assert cache.stats()["entries"] == 3
+    assert cache.get("ddg", "q1", None) is None
+    assert cache.get("ddg", "q0", None) is not None
+
+
+def test_run_variant_serves_stale_and_refreshes(cache, clock, monkeypatch):
+    calls = []
+    refreshed = []
+    monkeypatch.setattr(search, "get_search_cache", lambda: cache)
+    monkeypatch.setattr(search, "_search_ddg", lambda query, region: calls.append(query) or ["https://new.vn"])
+    monkeypatch.setattr(search, "_refresh_in_background", lambda variant, c: refreshed.append(variant.query))
+    variant = SearchVariant("ddg", "Lúa ST25", region="vn-vi")
+
+    miss = search._run_variant(variant)
+    assert (miss.cache, miss.urls, calls) == ("miss", ["https://new.vn"], ["Lúa ST25"])
+
+    fresh = search._run_variant(variant)
+    assert (fresh.cache, len(calls), refreshed) == ("fresh", 1, [])
+
+    clock[0] += TTL + 1
+    stale = search._run_variant(variant)
+    assert (stale.cache, stale.urls, len(calls)) == ("stale", ["https://new.vn"], 1)
+    assert refreshed == ["Lúa ST25"]
@@ -0,0 +1,43 @@
+"""
+Test reducer của WorkflowState: nối claims / gộp debug_info trả về giá trị mới,
+không sửa state cũ.
+
+Sử dụng: python -m pytest test_workflow_state.py
+"""
+
+import sys
+from pathlib import Path
+
+# Thêm thư mục gốc vào path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.models import AgriClaim
+from src.workflows.main import _append_claims, _merge_debug
+
+
+def _claim(obj: str) -> AgriClaim:
+    return AgriClaim(subject="Lúa ST25", predicate="Năng suất", object=obj, confidence=0.8)
+
+
+def test_append_claims_does_not_mutate_inputs():
+    left, right = [_claim("6 tấn/ha")], [_claim("7 tấn/ha")]
+
+    merged = _append_claims(left, right)
+
+    assert [c.object for c in merged] == ["6 tấn/ha", "7 tấn/ha"]
+    assert len(left) == 1 and len(right) == 1
+    assert _append_claims(None, right) == right
+    assert _append_claims(left, None) is not left
+
+
+def test_merge_debug_appends_errors_without_mutating_inputs():
+    left = {"errors": ["Search error"], "num_urls": 3}
+    right = {"errors": ["Scrape error"], "num_claims": 2}
+
+    merged = _merge_debug(left, right)
+
+    assert merged == {"errors": ["Search error", "Scrape error"], "num_urls": 3, "num_claims": 2}
+    assert left == {"errors": ["Search error"], "num_urls": 3}
+    assert right == {"errors": ["Scrape error"], "num_claims": 2}
+    assert merged["errors"] is not left["errors"]
+    assert _merge_debug(None, {"errors": ["x"]}) == {"errors": ["x"]}